@@ -0,0 +1,63 @@
+"""
+Compare per-comment featurization (process_comment in a list comprehension) with
+the vectorized process_comments on synthetic comments, and check the outputs match.
+Run from the backend directory:
+
+    python -m benchmarks.bench_featurize
+    python -m benchmarks.bench_featurize --count 100000 --loop-count 100000
+"""
+import argparse
+import random
+import string
+import time
+
+import numpy as np
+
+from utils import process_comment, process_comments
+
+WORDS = ["lol", "omg", "my", "street", "bus", "stop", "at", "7th", "&", "oak", "dm", "me", "every", "monday",
+         "gym", "library", "so", "cute", "call", "555-0134", "near", "the", "mural", "😀", "café"]
+
+
+def synthetic_comments(count, seed):
+    rng = random.Random(seed)
+    comments = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(1, 20))
+        if rng.random() < 0.1:
+            words.append("".join(rng.choices(string.ascii_letters, k=rng.randint(1, 40))))
+        comments.append(("  " if rng.random() < 0.1 else "") + " ".join(words).title())
+    return comments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--loop-count", type=int, default=None,
+                        help="Comments for the per-comment baseline (default: --count)")
+    parser.add_argument("--max-length", type=int, default=70)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    comments = synthetic_comments(args.count, args.seed)
+    loop_comments = comments[:args.loop_count or args.count]
+
+    start = time.perf_counter()
+    expected = np.array([process_comment(comment, args.max_length) for comment in loop_comments])
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X = process_comments(comments, args.max_length)
+    vectorized_s = time.perf_counter() - start
+
+    identical = np.array_equal(expected.view(np.uint64), X[:len(loop_comments)].view(np.uint64))
+    loop_rate = len(loop_comments) / loop_s
+    vectorized_rate = len(comments) / vectorized_s
+    print(f"{'method':<18} {'comments':>10} {'seconds':>9} {'comments/s':>12}")
+    print(f"{'process_comment':<18} {len(loop_comments):>10} {loop_s:>9.2f} {loop_rate:>12.0f}")
+    print(f"{'process_comments':<18} {len(comments):>10} {vectorized_s:>9.2f} {vectorized_rate:>12.0f}")
+    print(f"Speedup: {vectorized_rate / loop_rate:.1f}x, bit-identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
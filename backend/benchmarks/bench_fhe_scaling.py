@@ -0,0 +1,122 @@
+"""
+Throughput of tiktok_server against the number of FHE worker processes.
+
+For each worker count a tiktok_server is started with PRIVIFY_FHE_PROCESSES set
+to it (0 is the single-process thread mode), and a fixed set of encrypted
+comments is sent with `concurrency = factor * workers` requests in flight.
+Speedup and efficiency are relative to the first worker count. Needs the
+client artifacts and --port (5000 by default) free. Run from the backend directory:
+
+    python -m benchmarks.bench_fhe_scaling
+    python -m benchmarks.bench_fhe_scaling --workers 0 1 2 4 8 --requests 64
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import pandas as pd
+
+from utils import process_comments
+
+
+def start_server(port, workers, max_pending, timeout):
+    env = dict(os.environ, PRIVIFY_FHE_PROCESSES=str(workers), PRIVIFY_FHE_MAX_PENDING=str(max_pending))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "tiktok_server:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError("tiktok_server exited during startup")
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"tiktok_server was not ready after {timeout}s")
+
+
+def encrypt_inputs(comments):
+    from client_side import LAYOUTS, MODEL_LAYOUT, encrypt_features, get_client, get_serialized_evaluation_keys
+
+    names = LAYOUTS[MODEL_LAYOUT]
+    clients = {name: get_client(name) for name in names}
+    keys = {name: get_serialized_evaluation_keys(name, client) for name, client in clients.items()}
+    features = process_comments(comments)
+    return [{name: [encrypt_features(row, clients[name])] for name in names} for row in features], keys
+
+
+async def run_level(inputs, keys, concurrency):
+    import client_side
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(item):
+        async with semaphore:
+            start = time.perf_counter()
+            await client_side.call_fhe_server_models_async(item, keys)
+            latencies.append(time.perf_counter() - start)
+
+    # The key set is registered again for every server
+    client_side._registered_key_ids.clear()
+    await one(inputs[0])
+    latencies.clear()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in inputs))
+    wall = time.perf_counter() - start
+    await client_side.aclose_http_clients()
+    latencies.sort()
+    return {
+        "throughput_rps": len(inputs) / wall,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+async def main_async(args, inputs, keys):
+    print(f"{'workers':>8} {'in flight':>10} {'req/s':>8} {'speedup':>8} {'efficiency':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    baseline = None
+    for workers in args.workers:
+        concurrency = args.factor * max(1, workers)
+        server = start_server(args.port, workers, max_pending=concurrency, timeout=args.startup_timeout)
+        try:
+            result = await run_level(inputs, keys, concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or result["throughput_rps"] / max(1, args.workers[0])
+        speedup = result["throughput_rps"] / baseline
+        print(f"{workers:>8} {concurrency:>10} {result['throughput_rps']:>8.2f} {speedup:>8.2f} "
+              f"{speedup / max(1, workers):>10.0%} {result['p50_ms']:>9.0f} {result['p95_ms']:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--factor", type=int, default=2, help="Requests in flight per worker")
+    parser.add_argument("--port", type=int, default=5000, help="Port for the tiktok_server instances")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+    # client_side reads it when first imported, in encrypt_inputs
+    os.environ["PRIVIFY_FHE_SERVER_URL"] = f"http://127.0.0.1:{args.port}"
+
+    comments = pd.read_csv(args.csv).iloc[:, 0].astype(str).tolist()
+    comments = (comments * (args.requests // len(comments) + 1))[:args.requests]
+    inputs, keys = encrypt_inputs(comments)
+
+    asyncio.run(main_async(args, inputs, keys))
+
+
+if __name__ == "__main__":
+    main()
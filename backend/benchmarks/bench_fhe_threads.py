@@ -0,0 +1,87 @@
+"""
+Check that FHE circuit evaluations on threads run in parallel, i.e. that the
+FHE runtime releases the GIL while it evaluates a circuit.
+
+tiktok_server's default thread mode (fhe_executor.FHEExecutor) runs the
+circuits of concurrent requests on a thread pool and only gains from it if
+they overlap. If they do not, use the multi-process mode (PRIVIFY_FHE_PROCESSES).
+
+The circuits are loaded in this process and run without HTTP on a set of
+encrypted comments (both models per comment in the split layout), first on one
+thread, then on a pool of 2, 4, ... threads, the way FHEExecutor submits them.
+A speedup close to the thread count (up to the core count) means evaluations
+overlap; a speedup close to 1 means the GIL serializes them. cpu/wall is the
+process CPU time over wall time, the number of cores kept busy. Needs the server
+and client artifacts. Run from the backend directory:
+
+    python -m benchmarks.bench_fhe_threads
+    python -m benchmarks.bench_fhe_threads --threads 1 2 4 8 --comments 16
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import process_comments
+
+# Speedup with 2 threads above which evaluations are considered to overlap
+OVERLAP_SPEEDUP = 1.5
+
+
+def prepare_calls(comments):
+    from client_side import (LAYOUTS, MODEL_CLIENT_DIRS, MODEL_LAYOUT, encrypt_features, get_client,
+                             get_serialized_evaluation_keys)
+    from model_registry import ModelRegistry, deserialize_evaluation_keys
+
+    names = LAYOUTS[MODEL_LAYOUT]
+    registry = ModelRegistry({name: MODEL_CLIENT_DIRS[name] for name in names})
+    registry.load_all()
+    servers = registry.snapshot()
+    clients = {name: get_client(name) for name in names}
+    keys = {name: deserialize_evaluation_keys(get_serialized_evaluation_keys(name, client))
+            for name, client in clients.items()}
+    return [(servers[name], encrypt_features(row, clients[name]), keys[name])
+            for row in process_comments(comments) for name in names]
+
+
+def run_all(calls, threads):
+    from model_registry import run_with_keys
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="fhe") as pool:
+        start, cpu_start = time.perf_counter(), time.process_time()
+        list(pool.map(lambda call: run_with_keys(*call), calls))
+        return time.perf_counter() - start, time.process_time() - cpu_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--comments", type=int, default=8)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    comments = pd.read_csv(args.csv).iloc[:, 0].astype(str).tolist()
+    comments = (comments * (args.comments // len(comments) + 1))[:args.comments]
+    calls = prepare_calls(comments)
+    run_all(calls[:2], 1)  # warm-up
+
+    print(f"{len(calls)} evaluations, {os.cpu_count()} CPUs")
+    print(f"{'threads':>8} {'seconds':>8} {'evals/s':>8} {'speedup':>8} {'cpu/wall':>9}")
+    baseline, speedups = None, {}
+    for threads in args.threads:
+        wall, cpu = run_all(calls, threads)
+        baseline = baseline or wall
+        speedups[threads] = baseline / wall
+        print(f"{threads:>8} {wall:>8.2f} {len(calls) / wall:>8.2f} {speedups[threads]:>8.2f} {cpu / wall:>9.2f}")
+
+    if args.threads[0] == 1 and 2 in speedups:
+        if speedups[2] >= OVERLAP_SPEEDUP:
+            print("Evaluations overlap on threads: the thread mode uses several cores")
+        else:
+            print("Evaluations do not overlap on threads: run tiktok_server with PRIVIFY_FHE_PROCESSES")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Guard against slow imports: time importing each backend module in a fresh interpreter.
+
+A module fails if its import takes longer than the budget or drags in a heavy
+dependency (torch, transformers, concrete, ...) that should only load on first use.
+Exits non-zero on failure so it can run in CI. Run from the backend directory:
+
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --budget 0.5 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = ["utils", "client_side", "language_models", "on_device_server"]
+
+HEAVY_MODULES = ["torch", "transformers", "concrete", "matplotlib", "sklearn", "nltk", "pandas"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def probe(module):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--budget", type=float, default=1.0, help="Max seconds per import")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<20} {'import s':>9}  heavy dependencies")
+    for module in args.modules:
+        try:
+            runs = [probe(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<20} {'error':>9}  {e}")
+            failed = True
+            continue
+        seconds = statistics.median(run["seconds"] for run in runs)
+        heavy = runs[0]["heavy"]
+        ok = seconds <= args.budget and not heavy
+        failed |= not ok
+        print(f"{module:<20} {seconds:>9.3f}  {', '.join(heavy) or '-'}{'' if ok else '  FAIL'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
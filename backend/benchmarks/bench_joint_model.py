@@ -0,0 +1,92 @@
+"""
+Compare the two-model setup (category + risk circuits) with the joint 4-output circuit.
+
+Both setups are trained on the same split of comments.csv, then evaluated for
+category accuracy, risk MAE and per-comment FHE latency. Run from the backend directory:
+
+    python -m benchmarks.bench_joint_model
+    python -m benchmarks.bench_joint_model --fhe simulate --max-epochs 20   # quick check
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from concrete.ml.sklearn import NeuralNetRegressor
+
+from training import CATEGORY_PARAMS, JOINT_PARAMS, RISK_PARAMS, category_targets, joint_targets, num_categories, risk_targets
+from utils import RISK_SCALE, clip_risk_score, process_comments
+
+
+def train(params, X, y, max_epochs):
+    params = dict(params, verbose=False)
+    if max_epochs is not None:
+        params["max_epochs"] = max_epochs
+    model = NeuralNetRegressor(**params)
+    model.fit(X, y)
+    start = time.perf_counter()
+    model.compile(X)
+    return model, time.perf_counter() - start
+
+
+def latency_ms(predict, X, fhe):
+    samples = []
+    for row in X:
+        start = time.perf_counter()
+        predict(row.reshape(1, -1), fhe)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--fhe", default="execute", choices=["execute", "simulate", "disable"])
+    parser.add_argument("--latency-samples", type=int, default=5)
+    parser.add_argument("--max-epochs", type=int, default=None, help="Override the epochs of every model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    X = process_comments(df.values[:, 0], max_length=70)
+    idx_train, idx_test = train_test_split(np.arange(len(df)), test_size=0.2, random_state=args.seed)
+    X_train, X_test = X[idx_train], X[idx_test]
+    y_category, y_risk, y_joint = category_targets(df), risk_targets(df), joint_targets(df)
+    true_category = np.argmax(y_category[idx_test], axis=1)
+    true_risk = y_risk[idx_test].ravel()
+
+    category_model, category_compile = train(CATEGORY_PARAMS, X_train, y_category[idx_train], args.max_epochs)
+    risk_model, risk_compile = train(RISK_PARAMS, X_train, y_risk[idx_train], args.max_epochs)
+    joint_model, joint_compile = train(JOINT_PARAMS, X_train, y_joint[idx_train], args.max_epochs)
+
+    # Accuracy is measured in the clear (quantized) so it does not depend on --fhe
+    split_category = np.argmax(category_model.predict(X_test), axis=1)
+    split_risk = clip_risk_score(risk_model.predict(X_test)).ravel()
+    joint_pred = joint_model.predict(X_test)
+    joint_category = np.argmax(joint_pred[:, :num_categories], axis=1)
+    joint_risk = clip_risk_score(joint_pred[:, num_categories] * RISK_SCALE).ravel()
+
+    def predict_split(x, fhe):
+        category_model.predict(x, fhe=fhe)
+        risk_model.predict(x, fhe=fhe)
+
+    def predict_joint(x, fhe):
+        joint_model.predict(x, fhe=fhe)
+
+    latency_rows = X_test[:args.latency_samples]
+    rows = [
+        ("split", np.mean(split_category == true_category), np.mean(np.abs(split_risk - true_risk)),
+         category_compile + risk_compile, latency_ms(predict_split, latency_rows, args.fhe)),
+        ("joint", np.mean(joint_category == true_category), np.mean(np.abs(joint_risk - true_risk)),
+         joint_compile, latency_ms(predict_joint, latency_rows, args.fhe)),
+    ]
+
+    print(f"Test rows: {len(idx_test)}, latency mode: fhe={args.fhe}")
+    print(f"{'setup':<8} {'accuracy':>9} {'risk MAE':>9} {'compile s':>10} {'p50 ms/comment':>15}")
+    for name, accuracy, mae, compile_s, p50 in rows:
+        print(f"{name:<8} {accuracy:>9.4f} {mae:>9.3f} {compile_s:>10.1f} {p50:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare the LLM inference backends (torch, torch-int8, onnx) on load time, tokens/sec,
+peak memory and output parity with the first backend listed.
+
+Each backend runs in its own process, so peak RSS is that backend's alone.
+Prompts are built from the first rows of output_with_reasons.csv: moderation
+prompts for TinyLlama, comment-history analyses for Phi-3. Decoding is greedy
+with a fixed token budget, so differences in the outputs come from the backend.
+Parity is the share of outputs identical to the reference, the mean share of
+reference words generated before the first difference, and the share of
+outputs that parse (Reasoning/Suggestion lines or analysis JSON).
+The onnx backend needs `python export_llm.py` first. Run from the backend directory:
+
+    python -m benchmarks.bench_llm_backends
+    python -m benchmarks.bench_llm_backends --model phi3 --backends torch torch-int8 --limit 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+HISTORY_ROWS = 5  # comments per Phi-3 analysis prompt
+
+
+def build_prompts(model, csv_path, limit):
+    import language_models
+
+    df = pd.read_csv(csv_path)
+    if model == "tinyllama":
+        pipe = language_models.get_pipe()
+        rows = df.head(limit)
+        return [language_models.build_moderation_prompt(pipe, row.comment, [row.category], int(row.score))
+                for row in rows.itertuples()]
+    lines = [f"Comment: {row.comment} | Reasoning: {row.reason} | Suggestion: {row.suggestion}"
+             for row in df.head(limit * HISTORY_ROWS).itertuples()]
+    return [language_models._analysis_prompt("\n".join(lines[i:i + HISTORY_ROWS]))
+            for i in range(0, len(lines), HISTORY_ROWS)]
+
+
+def parses(model, prompt, text):
+    import language_models
+
+    if model == "tinyllama":
+        return language_models._is_complete(language_models.parse_moderation_output(prompt + text))
+    return "error" not in language_models._parse_analysis(text)
+
+
+def run_worker(args):
+    """Runs in the child process, with the backend selected through the environment."""
+    import language_models
+    from training import peak_rss_mb
+
+    start = time.perf_counter()
+    pipe = language_models.get_pipe() if args.model == "tinyllama" else language_models.get_phi3_pipeline()
+    load_seconds = time.perf_counter() - start
+    load_rss = peak_rss_mb()
+
+    prompts = build_prompts(args.model, args.csv, args.limit)
+    outputs, tokens = [], 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        text = pipe(prompt, do_sample=False, max_new_tokens=args.max_new_tokens, return_full_text=False)[0]["generated_text"]
+        tokens += len(pipe.tokenizer(text, add_special_tokens=False)["input_ids"])
+        outputs.append(text)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "load_s": load_seconds,
+        "load_rss_mb": load_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "tokens": tokens,
+        "tokens_per_s": tokens / elapsed,
+        "outputs": outputs,
+        "parsed": sum(parses(args.model, p, o) for p, o in zip(prompts, outputs)) / len(prompts),
+    }))
+
+
+def common_prefix_share(reference, output):
+    ref, out = reference.split(), output.split()
+    same = 0
+    for a, b in zip(ref, out):
+        if a != b:
+            break
+        same += 1
+    return same / len(ref) if ref else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="tinyllama", choices=["tinyllama", "phi3"])
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--csv", default="output_with_reasons.csv")
+    parser.add_argument("--limit", type=int, default=8, help="Prompts per backend")
+    parser.add_argument("--max-new-tokens", type=int, default=96)
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    for backend in args.backends:
+        env = dict(os.environ, PRIVIFY_LLM_BACKEND=backend, PRIVIFY_PHI3_BACKEND=backend)
+        command = [sys.executable, "-m", "benchmarks.bench_llm_backends", "--worker", backend,
+                   "--model", args.model, "--csv", args.csv, "--limit", str(args.limit),
+                   "--max-new-tokens", str(args.max_new_tokens)]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{backend}: failed: {completed.stderr.strip().splitlines()[-1]}")
+            continue
+        results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    if not results:
+        sys.exit(1)
+    reference_backend = next(iter(results))
+    reference = results[reference_backend]["outputs"]
+    print(f"Model: {args.model}, {len(reference)} prompts, parity against {reference_backend}")
+    print(f"{'backend':<11} {'load s':>7} {'load MB':>8} {'peak MB':>8} {'tok/s':>7} "
+          f"{'identical':>9} {'prefix':>7} {'parsed':>7}")
+    for backend, result in results.items():
+        outputs = result["outputs"]
+        identical = sum(a == b for a, b in zip(reference, outputs)) / len(reference)
+        prefix = sum(common_prefix_share(a, b) for a, b in zip(reference, outputs)) / len(reference)
+        print(f"{backend:<11} {result['load_s']:>7.1f} {result['load_rss_mb']:>8.0f} {result['peak_rss_mb']:>8.0f} "
+              f"{result['tokens_per_s']:>7.1f} {identical:>9.0%} {prefix:>7.0%} {result['parsed']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Measure moderation-explanation throughput for different generation batch sizes.
+
+Runs safe_generate_batch over the first rows of a CSV with comment, category and
+score columns (the bundled output_with_reasons.csv by default). Batch size 1 is
+the old one-row-at-a-time behaviour. Run from the backend directory:
+
+    python -m benchmarks.bench_llm_batch
+    python -m benchmarks.bench_llm_batch --limit 32 --batch-sizes 1 8 16
+"""
+import argparse
+import time
+
+import pandas as pd
+
+import language_models
+from language_models import FALLBACK_RESPONSE, safe_generate_batch
+from response_cache import ResponseCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="output_with_reasons.csv")
+    parser.add_argument("--limit", type=int, default=64, help="Rows to generate per batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--max-retries", type=int, default=6)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv).head(args.limit)
+    rows = list(zip(df["comment"], df["category"], df["score"].astype(int)))
+
+    # Every batch size generates the same rows, so the response cache must stay out of the way
+    language_models.response_cache = ResponseCache(max_entries=0)
+    # Load the model up front so it is not counted against the first batch size
+    language_models.warm_up()
+
+    print(f"Rows: {len(rows)}")
+    print(f"{'batch':>6} {'seconds':>9} {'rows/sec':>9} {'fallbacks':>10}")
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        results = []
+        for offset in range(0, len(rows), batch_size):
+            results += safe_generate_batch(rows[offset:offset + batch_size], batch_size=batch_size,
+                                           max_retries=args.max_retries)
+        elapsed = time.perf_counter() - start
+        fallbacks = sum(result == FALLBACK_RESPONSE for result in results)
+        print(f"{batch_size:>6} {elapsed:>9.1f} {len(rows) / elapsed:>9.2f} {fallbacks:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare legacy decoding (300 sampled tokens, regex scrape) with structured decoding
+(pre-filled "Reasoning:", stop once both lines are complete, PRIVIFY_LLM_MAX_NEW_TOKENS budget).
+
+Reports generated tokens per request, retry rate, fallbacks and throughput over the
+first rows of a CSV with comment, category and score columns. Run from the backend directory:
+
+    python -m benchmarks.bench_llm_decoding
+    python -m benchmarks.bench_llm_decoding --limit 16 --batch-size 4
+"""
+import argparse
+import time
+
+import pandas as pd
+
+import language_models
+from language_models import generation_stats, safe_generate_batch
+from response_cache import ResponseCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="output_with_reasons.csv")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=language_models.LLM_BATCH_SIZE)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "structured"], choices=["legacy", "structured"])
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv).head(args.limit)
+    rows = list(zip(df["comment"], df["category"], df["score"].astype(int)))
+
+    # Both modes generate the same rows, so the response cache must stay out of the way
+    language_models.response_cache = ResponseCache(max_entries=0)
+    language_models.warm_up()
+
+    print(f"Rows: {len(rows)}, batch size: {args.batch_size}")
+    print(f"{'mode':<11} {'tokens/req':>10} {'retry rate':>10} {'fallbacks':>10} {'rows/sec':>9}")
+    for mode in args.modes:
+        language_models.LLM_DECODING = mode
+        generation_stats.reset()
+        start = time.perf_counter()
+        for offset in range(0, len(rows), args.batch_size):
+            safe_generate_batch(rows[offset:offset + args.batch_size], batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        stats = generation_stats.snapshot()
+        print(f"{mode:<11} {stats['tokens_per_request']:>10.1f} {stats['retry_rate']:>10.3f} "
+              f"{stats['fallbacks']:>10} {len(rows) / elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
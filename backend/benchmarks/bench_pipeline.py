@@ -0,0 +1,238 @@
+"""
+End-to-end latency benchmark for the comment pipeline with per-stage timings.
+
+Comments from comments.csv are sent at each concurrency level, and per-stage
+p50/p95/p99 latency, payload bytes and throughput are recorded.
+
+Targets:
+  inprocess  calls client_side.run_inference_async (and safe_generate with --llm)
+             in this process; needs the TikTok server at PRIVIFY_FHE_SERVER_URL
+             (127.0.0.1:5000 by default) or on 127.0.0.1:--tiktok-port, or
+             --start-tiktok-server to launch it
+  http       POSTs to a running on_device_server /process (includes generation);
+             stages come from its Server-Timing header
+
+Client stages: keys, featurize, encrypt, register, serialize, post, deserialize,
+decrypt, generate. server_* stages are reported by tiktok_server (decode, keys,
+run, encode, total); post minus server_total is the network and HTTP overhead.
+
+Results are written as JSON together with the git commit, so runs can be compared:
+
+    python -m benchmarks.bench_pipeline --start-tiktok-server --concurrency 1 4
+    python -m benchmarks.bench_pipeline --target http --url http://127.0.0.1:8000 --requests 20
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/pipeline-abc1234-inprocess.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from tracing import SERVER_TIMING_HEADER, parse_server_timing, span, trace
+
+PERCENTILES = (50, 95, 99)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def summarize(samples):
+    values = np.asarray(samples, dtype=float)
+    summary = {f"p{q}": float(np.percentile(values, q)) for q in PERCENTILES}
+    summary["mean"] = float(values.mean())
+    return summary
+
+
+def start_tiktok_server(port, timeout):
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "tiktok_server:app", "--port", str(port)])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError("tiktok_server exited during startup")
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"tiktok_server was not ready after {timeout}s")
+
+
+async def run_inprocess(comment, llm):
+    from client_side import run_inference_async
+    from language_models import safe_generate
+
+    with trace() as current:
+        with span("total"):
+            category, risk_score = await run_inference_async(comment)
+            if llm:
+                with span("generate"):
+                    await asyncio.to_thread(safe_generate, comment, category, risk_score)
+    return current.stages, current.sizes
+
+
+async def run_http(client, url, comment):
+    body = json.dumps({"comment": comment}).encode("utf-8")
+    start = time.perf_counter()
+    response = await client.post(f"{url}/process", content=body, headers={"Content-Type": "application/json"})
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    stages = parse_server_timing(response.headers.get(SERVER_TIMING_HEADER))
+    stages["client_total"] = elapsed
+    return stages, {"request_bytes": len(body), "response_bytes": len(response.content)}
+
+
+async def run_level(comments, concurrency, call):
+    semaphore = asyncio.Semaphore(concurrency)
+    stages, sizes, errors = {}, {}, 0
+
+    async def one(comment):
+        nonlocal errors
+        async with semaphore:
+            try:
+                request_stages, request_sizes = await call(comment)
+            except Exception as e:
+                errors += 1
+                print(f"Request failed: {e}")
+                return
+        for name, seconds in request_stages.items():
+            stages.setdefault(name, []).append(seconds * 1000)
+        for name, size in request_sizes.items():
+            sizes.setdefault(name, []).append(size)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(comment) for comment in comments))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(comments),
+        "errors": errors,
+        "wall_s": wall,
+        "throughput_rps": (len(comments) - errors) / wall,
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+        "bytes": {name: summarize(values) for name, values in sizes.items()},
+    }
+
+
+def print_level(level):
+    print(f"\nconcurrency {level['concurrency']}: {level['requests']} requests, {level['errors']} errors, "
+          f"{level['throughput_rps']:.2f} req/s")
+    print(f"{'stage':<20} " + " ".join(f"{'p' + str(q) + ' ms':>10}" for q in PERCENTILES))
+    for name, summary in level["stages_ms"].items():
+        print(f"{name:<20} " + " ".join(f"{summary['p' + str(q)]:>10.1f}" for q in PERCENTILES))
+    for name, summary in level["bytes"].items():
+        print(f"{name:<20} {summary['p50']:>10.0f} (p50 bytes)")
+
+
+def compare(result, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    base_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}), p50 ms:")
+    for level in result["levels"]:
+        base = base_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        print(f"concurrency {level['concurrency']}: throughput {base['throughput_rps']:.2f} -> {level['throughput_rps']:.2f} req/s")
+        for name, summary in level["stages_ms"].items():
+            if name in base["stages_ms"]:
+                before, after = base["stages_ms"][name]["p50"], summary["p50"]
+                change = (after - before) / before * 100 if before else 0.0
+                print(f"  {name:<20} {before:>10.1f} -> {after:>10.1f} ({change:+.1f}%)")
+
+
+async def main_async(args, comments):
+    levels = []
+    if args.target == "http":
+        async with httpx.AsyncClient(timeout=None) as client:
+            call = lambda comment: run_http(client, args.url, comment)
+            for comment in comments[:args.warmup]:
+                await call(comment)
+            for concurrency in args.concurrency:
+                levels.append(await run_level(comments, concurrency, call))
+    else:
+        from client_side import aclose_http_clients
+
+        call = lambda comment: run_inprocess(comment, args.llm)
+        try:
+            for comment in comments[:args.warmup]:
+                await call(comment)
+            for concurrency in args.concurrency:
+                levels.append(await run_level(comments, concurrency, call))
+        finally:
+            await aclose_http_clients()
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="inprocess", choices=["inprocess", "http"])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="on_device_server URL for --target http")
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests before the first level")
+    parser.add_argument("--llm", action="store_true", help="Also generate explanations (inprocess target)")
+    parser.add_argument("--start-tiktok-server", action="store_true")
+    parser.add_argument("--tiktok-port", type=int, default=None,
+                        help="TikTok server port on 127.0.0.1, overrides PRIVIFY_FHE_SERVER_URL "
+                             "(5000 with --start-tiktok-server)")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--output", default=None, help="Defaults to benchmarks/results/pipeline-<commit>-<target>.json")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    comments = pd.read_csv(args.csv).iloc[:, 0].astype(str).tolist()
+    comments = (comments * (args.requests // len(comments) + 1))[:args.requests]
+
+    if args.start_tiktok_server and args.tiktok_port is None:
+        args.tiktok_port = 5000
+    if args.tiktok_port is not None:
+        # client_side reads it when first imported, in run_inprocess
+        os.environ["PRIVIFY_FHE_SERVER_URL"] = f"http://127.0.0.1:{args.tiktok_port}"
+
+    server = start_tiktok_server(args.tiktok_port, args.startup_timeout) if args.start_tiktok_server else None
+    try:
+        levels = asyncio.run(main_async(args, comments))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    commit, dirty = git_commit()
+    result = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": args.target,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "levels": levels,
+    }
+    for level in levels:
+        print_level(level)
+
+    output = args.output or os.path.join("benchmarks", "results", f"pipeline-{(commit or 'unknown')[:7]}-{args.target}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Recall and skip rate of the on-device prefilter.
+
+Recall is measured with k-fold cross-validation on the labelled comments
+(comments.csv, all privacy leaks), so each comment is scored by a filter that
+did not see it. The skip fraction is measured on comments without a privacy
+signal: a small built-in sample of generic reactions, or --benign-csv with a
+`comment` column from real traffic. Run from the backend directory:
+
+    python -m benchmarks.bench_prefilter
+    python -m benchmarks.bench_prefilter --recall 0.9 0.95 0.99 --benign-csv sample_traffic.csv
+"""
+import argparse
+import csv
+import random
+import time
+
+from prefilter import Prefilter
+
+GENERIC_COMMENTS = [
+    "lol so cute", "this song is fire", "omg where is this", "wow the lighting", "hahaha i'm crying",
+    "need this energy today", "the edit is insane", "ok but the outfit", "who else is here in 2024",
+    "no way this is real", "obsessed with this trend", "the cat at the end 😂", "this made my day",
+    "queen behavior", "can't stop watching", "love the colors", "the transition though", "facts",
+    "this is so relatable", "pls do a tutorial", "what filter is this", "me every time", "iconic",
+    "i need part 2", "the dog stole the show", "so satisfying", "10/10 would watch again", "bro what",
+    "ate and left no crumbs", "the vibes are immaculate", "why is nobody talking about this", "slay",
+    "i'm screaming", "this aged well", "the way he looked at her", "underrated", "that's wild",
+    "best thing on my fyp", "who's the artist", "this is art",
+]
+
+
+def read_comments(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["comment"] for row in csv.DictReader(f)]
+
+
+def cross_validated_recall(comments, target_recall, folds, seed):
+    comments = list(comments)
+    random.Random(seed).shuffle(comments)
+    passed = 0
+    for fold in range(folds):
+        held_out = comments[fold::folds]
+        training = [comment for i, comment in enumerate(comments) if i % folds != fold]
+        prefilter = Prefilter.fit(training, target_recall=target_recall)
+        passed += sum(prefilter.needs_analysis(comment) for comment in held_out)
+    return passed / len(comments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--benign-csv", default=None)
+    parser.add_argument("--recall", type=float, nargs="+", default=[0.9, 0.95, 0.98, 1.0],
+                        help="Target recall values to evaluate")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    labelled = read_comments(args.csv)
+    benign = read_comments(args.benign_csv) if args.benign_csv else GENERIC_COMMENTS
+
+    print(f"Labelled comments: {len(labelled)}, comments without signal: {len(benign)}")
+    print(f"{'target':>7} {'threshold':>10} {'CV recall':>10} {'skipped':>8} {'us/comment':>11}")
+    for target in args.recall:
+        recall = cross_validated_recall(labelled, target, args.folds, args.seed)
+        prefilter = Prefilter.fit(labelled, target_recall=target)
+        start = time.perf_counter()
+        for comment in benign:
+            prefilter.needs_analysis(comment)
+        per_comment_us = (time.perf_counter() - start) / len(benign) * 1e6
+        print(f"{target:>7.2f} {prefilter.threshold:>10.2f} {recall:>10.3f} "
+              f"{prefilter.stats()['skip_fraction']:>8.3f} {per_comment_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Latency and Phi-3 token counts of /privacy_analysis against comment history length.
+
+Histories are built from the first N rows of a CSV with comment, reason and
+suggestion columns (output_with_reasons.csv by default), one line per comment.
+For each length this runs:
+
+  single       the one-prompt analysis; skipped when the prompt does not fit
+               in Phi-3's 4k context
+  cold         the incremental analysis with an empty summary cache
+  append       the incremental analysis again after --append more comments,
+               reusing the summaries of the cold run
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_privacy_analysis
+    python -m benchmarks.bench_privacy_analysis --lengths 20 100 400 --append 5
+"""
+import argparse
+import time
+
+import pandas as pd
+
+import language_models
+from language_models import analysis_stats, generate_incremental_privacy_analysis, generate_privacy_analysis
+from response_cache import ResponseCache
+
+CONTEXT_TOKENS = 4096
+
+
+def history_lines(df):
+    return [f"Comment: {row.comment} | Reasoning: {row.reason} | Suggestion: {row.suggestion}"
+            for row in df.itertuples()]
+
+
+def measure(analyse, history):
+    analysis_stats.reset()
+    start = time.perf_counter()
+    result = analyse(history)
+    elapsed = time.perf_counter() - start
+    stats = analysis_stats.snapshot()
+    return elapsed, stats["generations"], stats["prompt_tokens"], stats["tokens"], "error" not in result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="output_with_reasons.csv")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--append", type=int, default=5, help="Comments appended before the append run")
+    args = parser.parse_args()
+
+    lines = history_lines(pd.read_csv(args.csv))
+    tokenizer = language_models.get_phi3_pipeline().tokenizer
+
+    print(f"{'comments':>8} {'history tok':>11} {'mode':>7} {'seconds':>8} {'calls':>6} "
+          f"{'prompt tok':>11} {'gen tok':>8} {'parsed':>7}")
+    for length in args.lengths:
+        history = "\n".join(lines[:length])
+        history_tokens = len(tokenizer(history, add_special_tokens=False)["input_ids"])
+        # Each length starts from an empty cache so earlier lengths don't help it
+        language_models.summary_cache = ResponseCache(language_models.SUMMARY_CACHE_SIZE)
+
+        runs = []
+        if history_tokens + 500 < CONTEXT_TOKENS:
+            runs.append(("single", generate_privacy_analysis, history))
+        runs.append(("cold", generate_incremental_privacy_analysis, history))
+        runs.append(("append", generate_incremental_privacy_analysis,
+                     "\n".join(lines[:length + args.append])))
+
+        for mode, analyse, text in runs:
+            elapsed, calls, prompt_tokens, tokens, parsed = measure(analyse, text)
+            print(f"{length:>8} {history_tokens:>11} {mode:>7} {elapsed:>8.1f} {calls:>6} "
+                  f"{prompt_tokens:>11} {tokens:>8} {str(parsed):>7}")
+
+
+if __name__ == "__main__":
+    main()
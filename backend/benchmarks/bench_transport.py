@@ -0,0 +1,119 @@
+"""
+Compare base64-in-JSON against length-prefixed binary frames for /fhe/process payloads.
+
+Reports bytes on the wire and server-side deserialize time (body -> ciphertext bytes)
+for both transports. Run from the backend directory:
+
+    python -m benchmarks.bench_transport
+    python -m benchmarks.bench_transport --real      # payloads from the real FHE clients
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import time
+
+from fhe_transport import decode_frames, encode_frames
+
+
+def synthetic_payload(ciphertext_bytes, key_bytes):
+    return {
+        "category": os.urandom(ciphertext_bytes),
+        "risk": os.urandom(ciphertext_bytes),
+        "keys_category": os.urandom(key_bytes) if key_bytes else None,
+        "keys_risk": os.urandom(key_bytes) if key_bytes else None,
+    }
+
+
+def real_payload(include_keys):
+    from concrete.ml.deployment import FHEModelClient
+    from client_side import FHE_FILE_PATH_CLIENT, FHE_FILE_PATH_RISK_CLIENT, quantize_encrypt_serialize
+
+    client = FHEModelClient(path_dir=FHE_FILE_PATH_CLIENT)
+    client_risk = FHEModelClient(path_dir=FHE_FILE_PATH_RISK_CLIENT)
+    comment = "walk past here every morning on my way to class"
+    return {
+        "category": quantize_encrypt_serialize(comment, client),
+        "risk": quantize_encrypt_serialize(comment, client_risk),
+        "keys_category": client.get_serialized_evaluation_keys() if include_keys else None,
+        "keys_risk": client_risk.get_serialized_evaluation_keys() if include_keys else None,
+    }
+
+
+def b64(b):
+    return base64.b64encode(b).decode("utf-8")
+
+
+def encode_json(payload):
+    body = {"X_enc": b64(payload["category"]), "X_enc_risk": b64(payload["risk"])}
+    if payload["keys_category"] is not None:
+        body["serialized_keys"] = b64(payload["keys_category"])
+        body["serialized_keys_risk"] = b64(payload["keys_risk"])
+    else:
+        body["key_id"] = "0" * 64
+    return json.dumps(body).encode("utf-8")
+
+
+def decode_json(body):
+    data = json.loads(body)
+    out = [base64.b64decode(data["X_enc"]), base64.b64decode(data["X_enc_risk"])]
+    if "serialized_keys" in data:
+        out += [base64.b64decode(data["serialized_keys"]), base64.b64decode(data["serialized_keys_risk"])]
+    return out
+
+
+def encode_binary(payload):
+    frames = [("category", payload["category"]), ("risk", payload["risk"])]
+    if payload["keys_category"] is not None:
+        frames += [("keys_category", payload["keys_category"]), ("keys_risk", payload["keys_risk"])]
+    else:
+        frames.append(("key_id", b"0" * 64))
+    return encode_frames(frames)
+
+
+def decode_binary(body):
+    # bytes() mirrors the single copy the server makes before fhe.Value.deserialize
+    return [bytes(payload) for name, payload in decode_frames(body) if name != "key_id"]
+
+
+def time_ms(fn, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ciphertext-kib", type=int, default=256, help="Synthetic ciphertext size per model")
+    parser.add_argument("--key-mib", type=int, default=0, help="Synthetic evaluation key size per model (0 = send key_id)")
+    parser.add_argument("--real", action="store_true", help="Use real ciphertexts from fhe_directory*")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.real:
+        payload = real_payload(include_keys=args.key_mib > 0)
+    else:
+        payload = synthetic_payload(args.ciphertext_kib * 1024, args.key_mib * 1024 * 1024)
+
+    raw = sum(len(v) for v in payload.values() if v is not None)
+    json_body = encode_json(payload)
+    binary_body = encode_binary(payload)
+    assert decode_json(json_body) == decode_binary(binary_body)
+
+    rows = [
+        ("json", len(json_body), time_ms(encode_json, payload, args.repeat), time_ms(decode_json, json_body, args.repeat)),
+        ("binary", len(binary_body), time_ms(encode_binary, payload, args.repeat), time_ms(decode_binary, binary_body, args.repeat)),
+    ]
+
+    print(f"Raw payload: {raw:,} bytes")
+    print(f"{'transport':<10} {'wire bytes':>14} {'overhead':>9} {'encode ms':>10} {'decode ms':>10}")
+    for name, size, encode_ms, decode_ms in rows:
+        print(f"{name:<10} {size:>14,} {size / raw - 1:>8.1%} {encode_ms:>10.2f} {decode_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Train, compile and save the FHE models in parallel, skipping models that are up to date.
+
+Each model is built in its own process. A model is rebuilt only when its
+fingerprint changes: a hash of the training CSV, the hyperparameters and build
+options, utils.PROCESS_COMMENT_VERSION and the Concrete ML version. The
+fingerprint is stored next to the artifacts in fingerprint.json.
+
+New artifacts are saved to a temporary sibling directory and moved into place
+with os.replace, server.zip last and fingerprint.json after it, so a running
+tiktok_server never loads a half-written server.zip and an interrupted build is
+redone on the next run:
+
+    python build_models.py
+    python build_models.py --models category risk joint --jobs 3
+    python build_models.py --force
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib.metadata import PackageNotFoundError, version
+
+from training import MODEL_DIRS, MODEL_PARAMS, StageTimer, featurize_csv, train_from_features
+from utils import PROCESS_COMMENT_VERSION
+
+FINGERPRINT_FILE = "fingerprint.json"
+ARTIFACTS = ["client.zip", "server.zip"]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(model_name, csv_sha256, options):
+    try:
+        concrete_version = version("concrete-ml")
+    except PackageNotFoundError:
+        concrete_version = None
+    # Activation functions are classes, fingerprint them by name
+    params = {key: getattr(value, "__name__", value) for key, value in MODEL_PARAMS[model_name].items()}
+    return {
+        "model": model_name,
+        "data_sha256": csv_sha256,
+        "params": params,
+        "options": options,
+        "process_comment_version": PROCESS_COMMENT_VERSION,
+        "concrete_ml_version": concrete_version,
+    }
+
+
+def is_up_to_date(output_dir, expected):
+    try:
+        with open(os.path.join(output_dir, FINGERPRINT_FILE)) as f:
+            current = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return current == expected and all(os.path.exists(os.path.join(output_dir, name)) for name in ARTIFACTS)
+
+
+def save_atomically(model, output_dir, model_fingerprint):
+    from concrete.ml.deployment import FHEModelDev
+
+    tmp_dir = f"{output_dir.rstrip('/')}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    FHEModelDev(path_dir=tmp_dir, model=model).save()
+    with open(os.path.join(tmp_dir, FINGERPRINT_FILE), "w") as f:
+        json.dump(model_fingerprint, f, indent=2)
+
+    os.makedirs(output_dir, exist_ok=True)
+    # The server watches server.zip, so it goes last, and the fingerprint only
+    # after every artifact is in place
+    names = sorted(os.listdir(tmp_dir), key=lambda name: (name == FINGERPRINT_FILE, name == "server.zip", name))
+    for name in names:
+        os.replace(os.path.join(tmp_dir, name), os.path.join(output_dir, name))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def build(model_name, csv_path, output_dir, features_dir, model_fingerprint, options, threads):
+    """Runs in a worker process: featurize, train, compile and save one model."""
+    import torch
+
+    # Share the cores between the models built in parallel
+    torch.set_num_threads(threads)
+    timer = StageTimer()
+    with timer.stage("featurize"):
+        features = featurize_csv(csv_path, model_name, features_dir, chunk_size=options["chunk_size"],
+                                 test_fraction=options["test_fraction"], seed=options["seed"])
+    model, metrics = train_from_features(model_name, features, compile_samples=options["compile_samples"],
+                                         max_epochs=options["max_epochs"], timer=timer, seed=options["seed"])
+    with timer.stage("save"):
+        save_atomically(model, output_dir, model_fingerprint)
+    return metrics, timer.stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["category", "risk"], choices=sorted(MODEL_DIRS))
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--features-dir", default="./features")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel builds (default: one per model)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the fingerprint matches")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--test-fraction", type=float, default=0.05)
+    parser.add_argument("--compile-samples", type=int, default=1000)
+    parser.add_argument("--max-epochs", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = {
+        "chunk_size": args.chunk_size,
+        "test_fraction": args.test_fraction,
+        "compile_samples": args.compile_samples,
+        "max_epochs": args.max_epochs,
+        "seed": args.seed,
+    }
+    csv_sha256 = file_sha256(args.csv)
+
+    todo = {}
+    for model_name in args.models:
+        expected = fingerprint(model_name, csv_sha256, options)
+        if not args.force and is_up_to_date(MODEL_DIRS[model_name], expected):
+            print(f"{model_name}: up to date, skipping")
+        else:
+            todo[model_name] = expected
+    if not todo:
+        return
+
+    jobs = args.jobs or len(todo)
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    start = time.perf_counter()
+    failed = False
+    # spawn, not fork: torch and the Concrete compiler keep thread pools that do not survive a fork
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(build, model_name, args.csv, MODEL_DIRS[model_name], args.features_dir,
+                        expected, options, threads): model_name
+            for model_name, expected in todo.items()
+        }
+        for future in as_completed(futures):
+            model_name = futures[future]
+            try:
+                metrics, stages = future.result()
+            except Exception as e:
+                print(f"{model_name}: build failed. Reason: {e}")
+                failed = True
+                continue
+            summary = ", ".join(f"{name} {seconds:.1f}s" for name, seconds, _ in stages)
+            scores = ", ".join(f"{name} {value:.4f}" for name, value in metrics.items())
+            print(f"{model_name}: built in {MODEL_DIRS[model_name]} ({summary}; peak RSS {stages[-1][2]:.0f} MB) {scores}")
+
+    print(f"Total: {time.perf_counter() - start:.1f}s")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
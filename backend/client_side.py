@@ -1,24 +1,22 @@
-from sklearn.datasets import make_classification
-from sklearn.model_selection import train_test_split
-from concrete.ml.sklearn import LogisticRegression
-import pandas as pd
-import matplotlib.pyplot as plt
-
-from concrete.ml.sklearn import NeuralNetRegressor
-from concrete.ml.deployment import FHEModelDev, FHEModelClient, FHEModelServer
+# concrete.ml (which pulls in torch) is imported when the first FHE client is
+# created, so importing this module for featurization or config stays light
 import numpy as np
-import torch.nn as nn
-from collections import Counter
-import re
-from sklearn.preprocessing import normalize
 import os
-import shutil
-from nltk.stem.porter import PorterStemmer
-from utils import process_comment, clip_risk_score
+from utils import process_comment, process_comments, clip_risk_score, RISK_SCALE
+from key_cache import key_set_id
+from tracing import (REQUEST_ID_HEADER, SERVER_TIMING_HEADER, current_request_id, get_logger, parse_server_timing,
+                     record, record_bytes, span)
+from fhe_transport import CONTENT_TYPE as FRAME_CONTENT_TYPE, decode_frames, encode_frames, group_frames
 import httpx
 import base64
+import asyncio
+import hashlib
+import threading
+import time
 
 num_categories = 3
+logger = get_logger("client_side")
+
 FHE_FILE_PATH = "./fhe_directory"
 FHE_FILE_PATH_CLIENT = "./fhe_directory"
 FHE_FILE_PATH_SERVER = "./fhe_directory"
@@ -26,7 +24,167 @@ FHE_FILE_PATH_SERVER = "./fhe_directory"
 FHE_FILE_PATH_RISK = "./fhe_directory_risk"
 FHE_FILE_PATH_RISK_CLIENT = "./fhe_directory_risk"
 FHE_FILE_PATH_RISK_SERVER = "./fhe_directory_risk"
-API_URL ="http://127.0.0.1:5000/fhe/process" 
+
+FHE_FILE_PATH_JOINT_CLIENT = "./fhe_directory_joint"
+
+# TikTok server running the FHE circuits
+FHE_SERVER_URL = os.environ.get("PRIVIFY_FHE_SERVER_URL", "http://127.0.0.1:5000").rstrip("/")
+API_URL = f"{FHE_SERVER_URL}/fhe/process"
+KEYS_URL = f"{FHE_SERVER_URL}/fhe/keys"
+BATCH_API_URL = f"{FHE_SERVER_URL}/fhe/process_batch"
+BINARY_API_URL = f"{FHE_SERVER_URL}/fhe/process_binary"
+BINARY_KEYS_URL = f"{FHE_SERVER_URL}/fhe/keys_binary"
+
+# "binary" sends length-prefixed frames, "json" sends base64 inside JSON
+FHE_TRANSPORT = os.environ.get("PRIVIFY_FHE_TRANSPORT", "binary")
+
+# "split" runs the category and risk models, "joint" runs the merged model
+# from train_joint_model.py (one encryption, one key set, one circuit)
+MODEL_LAYOUT = os.environ.get("PRIVIFY_MODEL_LAYOUT", "split")
+LAYOUTS = {"split": ("category", "risk"), "joint": ("joint",)}
+
+# Private and evaluation keys are generated once per model and kept here
+# (<model>/<client.zip fingerprint>/) so restarts reuse them, see rotate_keys()
+KEY_STORE_DIR = os.environ.get("PRIVIFY_KEY_STORE", "./fhe_keys")
+CLIENT_ZIP = "client.zip"
+
+MODEL_CLIENT_DIRS = {
+    "category": FHE_FILE_PATH_CLIENT,
+    "risk": FHE_FILE_PATH_RISK_CLIENT,
+    "joint": FHE_FILE_PATH_JOINT_CLIENT,
+}
+
+# Calls to the FHE server: total and connect timeouts in seconds, retries with
+# exponential backoff on connection errors and 502/503/504, and pool size
+FHE_TIMEOUT = float(os.environ.get("PRIVIFY_FHE_TIMEOUT", "300"))
+FHE_CONNECT_TIMEOUT = float(os.environ.get("PRIVIFY_FHE_CONNECT_TIMEOUT", "5"))
+FHE_RETRIES = int(os.environ.get("PRIVIFY_FHE_RETRIES", "2"))
+FHE_RETRY_BACKOFF = float(os.environ.get("PRIVIFY_FHE_RETRY_BACKOFF", "0.5"))
+FHE_MAX_CONNECTIONS = int(os.environ.get("PRIVIFY_FHE_MAX_CONNECTIONS", "20"))
+RETRY_STATUS_CODES = {502, 503, 504}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+# Must not exceed the FHE server's PRIVIFY_MAX_BATCH_SIZE
+MAX_BATCH_SIZE = 32
+
+# Probabilities to Category Mapping
+CATEGORY_MAP = {
+    0: "location/geoinformation",
+    1: "routines",
+    2: "contactinfo",
+}
+
+# Local key set fingerprint -> key ID returned by the FHE server
+_registered_key_ids = {}
+
+# Binary endpoint URLs of FHE servers that turned out not to have them; later
+# calls to those servers go straight to JSON
+_binary_unsupported = set()
+
+_http_client = None
+_async_http_client = None
+_async_registration_lock = None
+
+# Long-lived clients, their serialized evaluation keys and the (mtime, size)
+# of the client.zip they were loaded from, by model name
+_clients = {}
+_serialized_keys = {}
+_client_stats = {}
+_clients_lock = threading.Lock()
+
+# (model name, id(key bytes)) pairs -> (key bytes, fingerprint), see _key_set_fingerprint
+_fingerprints = {}
+
+def _client_zip_stat(name):
+    stat = os.stat(os.path.join(MODEL_CLIENT_DIRS[name], CLIENT_ZIP))
+    return stat.st_mtime_ns, stat.st_size
+
+def _client_fingerprint(name):
+    # Keys only work with the circuit they were generated for, so the key store
+    # is namespaced by the content of client.zip rather than its mtime
+    digest = hashlib.sha256()
+    with open(os.path.join(MODEL_CLIENT_DIRS[name], CLIENT_ZIP), "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _load_client(name, force_keygen=False):
+    from concrete.ml.deployment import FHEModelClient
+
+    # Taken first, so a client.zip replaced while loading is reloaded next time
+    stat = _client_zip_stat(name)
+    key_dir = os.path.join(KEY_STORE_DIR, name, _client_fingerprint(name))
+    os.makedirs(key_dir, mode=0o700, exist_ok=True)
+    client = FHEModelClient(path_dir=MODEL_CLIENT_DIRS[name], key_dir=key_dir)
+    # Loads the keys from key_dir if they exist, generates and saves them otherwise
+    client.generate_private_and_evaluation_keys(force=force_keygen)
+    return client, stat
+
+def _set_client(name, client, stat):
+    _clients[name] = client
+    _serialized_keys[name] = client.get_serialized_evaluation_keys()
+    _client_stats[name] = stat
+
+def get_client(name):
+    """
+    Return the shared FHEModelClient of a model, loading its keys on first use.
+
+    The client is reloaded when the model's client.zip changes on disk (e.g.
+    after build_models.py), with the keys stored for the new client.zip.
+    """
+    stat = _client_zip_stat(name)
+    with _clients_lock:
+        if _client_stats.get(name) != stat:
+            reloaded = name in _clients
+            _set_client(name, *_load_client(name))
+            if reloaded:
+                logger.info("Reloaded FHE client '%s' after its %s changed", name, CLIENT_ZIP)
+        return _clients[name]
+
+def get_serialized_evaluation_keys(name, client=None):
+    """
+    Serialized evaluation keys of a model's shared client, or of `client` if
+    given: a client from get_client that a reload may have replaced since.
+    """
+    client = client or get_client(name)
+    with _clients_lock:
+        if _clients.get(name) is client:
+            return _serialized_keys[name]
+    return client.get_serialized_evaluation_keys()
+
+def load_clients(layout=None):
+    """Load (or generate) the keys of every model used by `layout`, e.g. at server startup."""
+    names = LAYOUTS[layout or MODEL_LAYOUT]
+    for name in names:
+        get_client(name)
+    # Hash the key set now rather than on the first request
+    _key_set_fingerprint({name: _serialized_keys[name] for name in names})
+
+def rotate_keys(names=None):
+    """
+    Generate fresh private and evaluation keys, replacing the ones in the key store.
+
+    Args:
+        names (Optional[List[str]]): Models to rotate, defaults to every loaded model.
+    """
+    with _clients_lock:
+        for name in names or list(_clients):
+            _set_client(name, *_load_client(name, force_keygen=True))
+        # Old key IDs are useless once their keys are gone
+        _registered_key_ids.clear()
+        _fingerprints.clear()
+
+def _key_set_fingerprint(keys):
+    # Hashing tens of MB of keys on every request is wasteful, so memoize by object
+    # identity. The cache keeps references to the key bytes, so ids cannot be reused
+    # by other objects while an entry exists.
+    ident = tuple(sorted((name, id(key)) for name, key in keys.items()))
+    cached = _fingerprints.get(ident)
+    if cached is None:
+        if len(_fingerprints) >= 16:
+            _fingerprints.clear()
+        cached = _fingerprints[ident] = (tuple(keys.values()), key_set_id(keys))
+    return cached[1]
 
 def quantize_encrypt_serialize(comment, client):
     processed_comment = process_comment(comment)
@@ -34,6 +192,10 @@ def quantize_encrypt_serialize(comment, client):
     processed_enc_comment = client.quantize_encrypt_serialize(processed_comment)
     return processed_enc_comment
 
+def encrypt_features(features, client):
+    """Encrypt one row of process_comments output."""
+    return client.quantize_encrypt_serialize(features.reshape(1, -1))
+
 def bytes_to_b64(b: bytes) -> str:
     return base64.b64encode(b).decode("utf-8")
 
@@ -49,62 +211,464 @@ def encode_X(x):
     else:
         raise TypeError(f"Unsupported type for JSON: {type(x)}")
 
-def call_fhe_server(X_enc, X_enc_risk, serialized_keys, serialized_keys_risk):
+def get_http_client():
+    """Shared, connection-pooled client for synchronous calls to the FHE server."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(timeout=_http_timeout(), limits=_http_limits())
+    return _http_client
+
+def get_async_http_client():
+    """Shared, connection-pooled client for calls made from the event loop."""
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        _async_http_client = httpx.AsyncClient(timeout=_http_timeout(), limits=_http_limits())
+    return _async_http_client
+
+async def aclose_http_clients():
+    global _http_client, _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
+
+def _http_timeout():
+    return httpx.Timeout(FHE_TIMEOUT, connect=FHE_CONNECT_TIMEOUT)
+
+def _http_limits():
+    return httpx.Limits(max_connections=FHE_MAX_CONNECTIONS, max_keepalive_connections=FHE_MAX_CONNECTIONS)
+
+def _should_retry(attempt, response=None):
+    if attempt >= FHE_RETRIES:
+        return False
+    return response is None or response.status_code in RETRY_STATUS_CODES
+
+def _record_exchange(response):
+    """Add payload sizes and the FHE server's own stage timings to the current trace."""
+    record_bytes("fhe_request_bytes", int(response.request.headers.get("content-length", 0)))
+    record_bytes("fhe_response_bytes", len(response.content))
+    for stage, seconds in parse_server_timing(response.headers.get(SERVER_TIMING_HEADER)).items():
+        record(f"server_{stage}", seconds)
+
+def _with_request_id(request):
+    """Forward the current request ID so both servers' logs can be correlated."""
+    request_id = current_request_id()
+    if request_id is None:
+        return request
+    return dict(request, headers={**request.get("headers", {}), REQUEST_ID_HEADER: request_id})
+
+def _post(url, request, stage="post"):
+    """POST with the shared client, retrying connection errors and 502/503/504."""
+    request = _with_request_id(request)
+    with span(stage):
+        for attempt in range(FHE_RETRIES + 1):
+            try:
+                response = get_http_client().post(url, **request)
+            except RETRY_EXCEPTIONS:
+                if not _should_retry(attempt):
+                    raise
+            else:
+                if not _should_retry(attempt, response):
+                    _record_exchange(response)
+                    return response
+            time.sleep(FHE_RETRY_BACKOFF * 2 ** attempt)
+
+async def _apost(url, request, stage="post"):
+    """Async counterpart of `_post`."""
+    request = _with_request_id(request)
+    with span(stage):
+        for attempt in range(FHE_RETRIES + 1):
+            try:
+                response = await get_async_http_client().post(url, **request)
+            except RETRY_EXCEPTIONS:
+                if not _should_retry(attempt):
+                    raise
+            else:
+                if not _should_retry(attempt, response):
+                    _record_exchange(response)
+                    return response
+            await asyncio.sleep(FHE_RETRY_BACKOFF * 2 ** attempt)
+
+def _binary_transport():
+    return FHE_TRANSPORT == "binary" and BINARY_API_URL not in _binary_unsupported
+
+def _mark_binary_unsupported():
+    if BINARY_API_URL not in _binary_unsupported:
+        logger.info("FHE server has no binary endpoints, using JSON from now on")
+        _binary_unsupported.add(BINARY_API_URL)
+
+def _layout_of(inputs):
+    return "joint" if "joint" in inputs else "split"
+
+def _keys_request(keys, binary):
+    if binary:
+        return BINARY_KEYS_URL, {
+            "content": encode_frames(keys.items()),
+            "headers": {"Content-Type": FRAME_CONTENT_TYPE},
+        }
+    return KEYS_URL, {"json": {"keys": {name: bytes_to_b64(key) for name, key in keys.items()}}}
+
+def _binary_request(key_id, inputs):
+    frames = [("key_id", key_id.encode("utf-8"))]
+    frames += [(name, x) for name, xs in inputs.items() for x in xs]
+    return BINARY_API_URL, {
+        "content": encode_frames(frames),
+        "headers": {"Content-Type": FRAME_CONTENT_TYPE},
+    }
+
+def _json_batch_request(key_id, inputs):
+    layout = _layout_of(inputs)
     payload = {
-        "X_enc": encode_X(X_enc),
-        "X_enc_risk": encode_X(X_enc_risk),
-        "serialized_keys": bytes_to_b64(serialized_keys),
-        "serialized_keys_risk": bytes_to_b64(serialized_keys_risk)
+        "key_id": key_id,
+        "layout": layout,
+        "X_enc": [encode_X(x) for x in inputs[LAYOUTS[layout][0]]],
     }
+    if "risk" in inputs:
+        payload["X_enc_risk"] = [encode_X(x) for x in inputs["risk"]]
+    return BATCH_API_URL, {"json": payload}
 
-    response = httpx.post(API_URL, json=payload, timeout=httpx.Timeout(300.0))
+def _check_response(response):
     if response.status_code != 200:
         raise RuntimeError(f"Server returned {response.status_code}: {response.text}")
 
+def _parse_binary_response(response, inputs):
+    _check_response(response)
+    frames = group_frames(decode_frames(response.content))
+    return {name: [bytes(r) for r in frames[name]] for name in inputs}
+
+def _parse_json_batch_response(response, inputs):
+    _check_response(response)
+    data = response.json()
+    results = {LAYOUTS[_layout_of(inputs)][0]: [decode_keys(r) for r in data["encrypted_results"]]}
+    if "risk" in inputs:
+        results["risk"] = [decode_keys(r) for r in data["encrypted_results_risk"]]
+    return results
+
+def _store_key_id(fingerprint, response):
+    if response.status_code == 404:
+        return None
+    _check_response(response)
+    key_id = response.json()["key_id"]
+    _registered_key_ids[fingerprint] = key_id
+    return key_id
+
+def register_key_set(keys, force=False):
+    """
+    Upload a set of evaluation keys once and return the server's key ID for them.
+
+    Args:
+        keys (Dict[str, bytes]): Serialized evaluation keys by model name.
+        force (bool): Upload even if this key set was registered before.
+
+    Returns:
+        Optional[str]: The key ID, or None if the FHE server does not support key registration.
+    """
+    fingerprint = _key_set_fingerprint(keys)
+    if not force and fingerprint in _registered_key_ids:
+        return _registered_key_ids[fingerprint]
+
+    binary = _binary_transport()
+    response = _post(*_keys_request(keys, binary=binary), stage="register")
+    if response.status_code == 404 and binary:
+        _mark_binary_unsupported()
+        response = _post(*_keys_request(keys, binary=False), stage="register")
+    return _store_key_id(fingerprint, response)
+
+def register_keys(serialized_keys, serialized_keys_risk, force=False):
+    return register_key_set({"category": serialized_keys, "risk": serialized_keys_risk}, force=force)
+
+def call_fhe_server_binary(inputs, keys):
+    """
+    Send a batch of ciphertexts as length-prefixed frames instead of base64 JSON.
+
+    Args:
+        inputs (Dict[str, List[bytes]]): Encrypted inputs by model name, one per comment.
+        keys (Dict[str, bytes]): Serialized evaluation keys by model name.
+
+    Returns:
+        Optional[Dict[str, List[bytes]]]: Encrypted outputs by model name in input order,
+        or None if the FHE server has no binary endpoint so the caller can fall back to JSON.
+    """
+    key_id = register_key_set(keys)
+    if key_id is None:
+        return None
+
+    response = _post(*_binary_request(key_id, inputs))
+    if response.status_code == 404:
+        # Either the keys were evicted from the server cache or the route does not exist
+        key_id = register_key_set(keys, force=True)
+        response = _post(*_binary_request(key_id, inputs))
+        if response.status_code == 404:
+            _mark_binary_unsupported()
+            return None
+    return _parse_binary_response(response, inputs)
+
+def call_fhe_server_json(X_enc, X_enc_risk, serialized_keys, serialized_keys_risk):
+    payload = {
+        "X_enc": encode_X(X_enc),
+        "X_enc_risk": encode_X(X_enc_risk),
+    }
+
+    key_id = register_keys(serialized_keys, serialized_keys_risk)
+    if key_id is None:
+        payload["serialized_keys"] = bytes_to_b64(serialized_keys)
+        payload["serialized_keys_risk"] = bytes_to_b64(serialized_keys_risk)
+        response = _post(API_URL, {"json": payload})
+    else:
+        payload["key_id"] = key_id
+        response = _post(API_URL, {"json": payload})
+        if response.status_code == 404:
+            # Keys were evicted from the server cache (or it restarted), upload them again
+            payload["key_id"] = register_keys(serialized_keys, serialized_keys_risk, force=True)
+            response = _post(API_URL, {"json": payload})
+
+    _check_response(response)
     data = response.json()
     return decode_keys(data["encrypted_result"]), decode_keys(data["encrypted_result_risk"])
 
+def _call_fhe_server_legacy(inputs, keys):
+    # Server without key registration: no batch endpoint either, send one request per item
+    if _layout_of(inputs) == "joint":
+        raise RuntimeError("FHE server does not support key registration, required by the joint model")
+    results = [
+        call_fhe_server_json(X_enc, X_enc_risk, keys["category"], keys["risk"])
+        for X_enc, X_enc_risk in zip(inputs["category"], inputs["risk"])
+    ]
+    return {"category": [r[0] for r in results], "risk": [r[1] for r in results]}
+
+def call_fhe_server_json_batch(inputs, keys):
+    """JSON counterpart of `call_fhe_server_binary` using /fhe/process_batch."""
+    key_id = register_key_set(keys)
+    if key_id is None:
+        return _call_fhe_server_legacy(inputs, keys)
+
+    response = _post(*_json_batch_request(key_id, inputs))
+    if response.status_code == 404:
+        key_id = register_key_set(keys, force=True)
+        response = _post(*_json_batch_request(key_id, inputs))
+    return _parse_json_batch_response(response, inputs)
+
+def _use_binary(inputs):
+    return _binary_transport() and all(isinstance(x, bytes) for xs in inputs.values() for x in xs)
+
+def call_fhe_server_models(inputs, keys):
+    """Run a batch of encrypted comments in one round trip, results keep the input order."""
+    if _use_binary(inputs):
+        results = call_fhe_server_binary(inputs, keys)
+        if results is not None:
+            return results
+    return call_fhe_server_json_batch(inputs, keys)
+
+def _registration_lock():
+    # Created lazily so it binds to the running event loop
+    global _async_registration_lock
+    if _async_registration_lock is None:
+        _async_registration_lock = asyncio.Lock()
+    return _async_registration_lock
+
+async def register_key_set_async(keys, force=False):
+    """Async counterpart of `register_key_set`."""
+    # The first call for a key set hashes the keys, keep that off the event loop
+    fingerprint = await asyncio.to_thread(_key_set_fingerprint, keys)
+    async with _registration_lock():
+        if not force and fingerprint in _registered_key_ids:
+            return _registered_key_ids[fingerprint]
+
+        binary = _binary_transport()
+        request = await asyncio.to_thread(_keys_request, keys, binary)
+        response = await _apost(*request, stage="register")
+        if response.status_code == 404 and binary:
+            _mark_binary_unsupported()
+            request = await asyncio.to_thread(_keys_request, keys, False)
+            response = await _apost(*request, stage="register")
+        return _store_key_id(fingerprint, response)
+
+async def call_fhe_server_models_async(inputs, keys):
+    """
+    Async counterpart of `call_fhe_server_models` using the pooled AsyncClient.
+
+    Args:
+        inputs (Dict[str, List[bytes]]): Encrypted inputs by model name, one per comment.
+        keys (Dict[str, bytes]): Serialized evaluation keys by model name.
+
+    Returns:
+        Dict[str, List[bytes]]: Encrypted outputs by model name in input order.
+    """
+    key_id = await register_key_set_async(keys)
+    if key_id is None:
+        return await asyncio.to_thread(_call_fhe_server_legacy, inputs, keys)
+
+    binary = _use_binary(inputs)
+    build_request, parse_response = (
+        (_binary_request, _parse_binary_response) if binary
+        else (_json_batch_request, _parse_json_batch_response)
+    )
+    with span("serialize"):
+        request = build_request(key_id, inputs)
+    response = await _apost(*request)
+    if response.status_code == 404:
+        # Either the keys were evicted from the server cache or the route does not exist
+        key_id = await register_key_set_async(keys, force=True)
+        response = await _apost(*build_request(key_id, inputs))
+        if response.status_code == 404 and binary:
+            _mark_binary_unsupported()
+            build_request, parse_response = _json_batch_request, _parse_json_batch_response
+            response = await _apost(*build_request(key_id, inputs))
+    def parse():
+        with span("deserialize"):
+            return parse_response(response, inputs)
+
+    return await asyncio.to_thread(parse)
+
+def call_fhe_server_batch(X_encs, X_enc_risks, serialized_keys, serialized_keys_risk):
+    results = call_fhe_server_models(
+        {"category": X_encs, "risk": X_enc_risks},
+        {"category": serialized_keys, "risk": serialized_keys_risk},
+    )
+    return results["category"], results["risk"]
+
+def call_fhe_server(X_enc, X_enc_risk, serialized_keys, serialized_keys_risk):
+    if _binary_transport() and isinstance(X_enc, bytes) and isinstance(X_enc_risk, bytes):
+        results = call_fhe_server_binary(
+            {"category": [X_enc], "risk": [X_enc_risk]},
+            {"category": serialized_keys, "risk": serialized_keys_risk},
+        )
+        if results is not None:
+            return results["category"][0], results["risk"][0]
+    return call_fhe_server_json(X_enc, X_enc_risk, serialized_keys, serialized_keys_risk)
+
+def decode_joint_output(y):
+    """Split the joint model output into (category, risk score)."""
+    y = np.asarray(y).reshape(1, -1)
+    pred_idx = int(np.argmax(y[:, :num_categories]))
+    return CATEGORY_MAP.get(pred_idx), clip_risk_score(y[:, num_categories:] * RISK_SCALE)
+
+def run_inference_joint(comment):
+    client = get_client("joint")
+    with span("featurize"):
+        features = process_comments([comment])[0]
+    with span("encrypt"):
+        X_enc = encrypt_features(features, client)
+    serialized_evaluation_keys = get_serialized_evaluation_keys("joint", client)
+
+    results = call_fhe_server_models({"joint": [X_enc]}, {"joint": serialized_evaluation_keys})
+
+    with span("decrypt"):
+        category, risk_score = decode_joint_output(client.deserialize_decrypt_dequantize(results["joint"][0]))
+    logger.debug("Joint FHE inference done")
+    return category, risk_score
+
+def decrypt_outputs(clients, encrypted_results):
+    """
+    Decrypt one comment's encrypted outputs into (category, risk score).
+
+    Args:
+        clients (Dict[str, FHEModelClient]): Clients by model name.
+        encrypted_results (Dict[str, bytes]): Encrypted output by model name.
+    """
+    if "joint" in clients:
+        return decode_joint_output(clients["joint"].deserialize_decrypt_dequantize(encrypted_results["joint"]))
+    y_enc = clients["category"].deserialize_decrypt_dequantize(encrypted_results["category"])
+    y_enc_risk = clients["risk"].deserialize_decrypt_dequantize(encrypted_results["risk"])
+    return CATEGORY_MAP.get(int(np.argmax(y_enc))), clip_risk_score(y_enc_risk)
+
+async def run_inference_async(comment):
+    """
+    Async counterpart of `run_inference` for use inside a server's event loop.
+
+    Encryption and decryption run in worker threads and the FHE server is called
+    through the pooled AsyncClient, so the loop keeps serving other requests.
+    """
+    names = LAYOUTS[MODEL_LAYOUT]
+    with span("keys"):
+        clients = {name: await asyncio.to_thread(get_client, name) for name in names}
+        keys = {name: get_serialized_evaluation_keys(name, client) for name, client in clients.items()}
+
+    def encrypt():
+        with span("featurize"):
+            features = process_comments([comment])[0]
+        with span("encrypt"):
+            return {name: [encrypt_features(features, client)] for name, client in clients.items()}
+
+    def decrypt(results):
+        with span("decrypt"):
+            return decrypt_outputs(clients, {name: outputs[0] for name, outputs in results.items()})
+
+    inputs = await asyncio.to_thread(encrypt)
+    results = await call_fhe_server_models_async(inputs, keys)
+    return await asyncio.to_thread(decrypt, results)
+
 def run_inference(comment):
-    print("--------------------------------------------------")
-    print("Step 3) Client quantize, encrypt and serialize input comment")
-    client = FHEModelClient(path_dir=FHE_FILE_PATH_CLIENT)
-    client_risk = FHEModelClient(path_dir=FHE_FILE_PATH_RISK_CLIENT)
-    X_enc = quantize_encrypt_serialize(comment, client)
-    X_enc_risk = quantize_encrypt_serialize(comment, client_risk)
-    print("Done quantization + encryption + serialization.")
-    print("--------------------------------------------------")
-
-    print("Step 4) View the encrypted payload by client (first 50 chars only)")
-    print("Encrypted classifier input:", str(X_enc)[:50], "... [truncated]")
-    print("Encrypted risk input:", str(X_enc_risk)[:50], "... [truncated]")
-    print("--------------------------------------------------")
-
-    serialized_evaluation_keys = client.get_serialized_evaluation_keys()
-    serialized_evaluation_keys_risk = client_risk.get_serialized_evaluation_keys()
-
-    print("Step 5) Client sends request and receives the encrypted output from server")
+    if MODEL_LAYOUT == "joint":
+        return run_inference_joint(comment)
+
+    client = get_client("category")
+    client_risk = get_client("risk")
+    with span("featurize"):
+        features = process_comments([comment])[0]
+    with span("encrypt"):
+        X_enc = encrypt_features(features, client)
+        X_enc_risk = encrypt_features(features, client_risk)
+
+    serialized_evaluation_keys = get_serialized_evaluation_keys("category", client)
+    serialized_evaluation_keys_risk = get_serialized_evaluation_keys("risk", client_risk)
+
     encrypted_result, encrypted_result_risk = call_fhe_server(
         X_enc, X_enc_risk, serialized_evaluation_keys, serialized_evaluation_keys_risk
     )
-    print("Encrypted outputs received from server.")
-    print("Encrypted classifier output:", str(encrypted_result)[:50], "... [truncated]")
-    print("Encrypted risk output:", str(encrypted_result_risk)[:50], "... [truncated]")
-    print("--------------------------------------------------")
-
-    print("Step 6) Client deserialize, decrypt, and dequantize the encrypted output")
-    y_enc = client.deserialize_decrypt_dequantize(encrypted_result)
-    y_enc_risk = client_risk.deserialize_decrypt_dequantize(encrypted_result_risk)
-    print("Decryption complete. Probabilities:", y_enc)
-    print("Decryption complete. Risk score:", clip_risk_score(y_enc_risk))
-    print("--------------------------------------------------")
-
-    # Probabilities to Category Mapping
-    category_map = {
-        0: "location/geoinformation",
-        1: "routines",
-        2: "contactinfo",
-    }
+
+    with span("decrypt"):
+        y_enc = client.deserialize_decrypt_dequantize(encrypted_result)
+        y_enc_risk = client_risk.deserialize_decrypt_dequantize(encrypted_result_risk)
+    # Never log the comment, the scores or the predicted category
+    logger.debug("FHE inference done")
 
     pred_idx = int(np.argmax(y_enc))
-    print("Final Category:", category_map.get(pred_idx))
-    return category_map.get(pred_idx), clip_risk_score(y_enc_risk)
+    return CATEGORY_MAP.get(pred_idx), clip_risk_score(y_enc_risk)
+
+def run_inference_batch(comments, batch_size=MAX_BATCH_SIZE):
+    """
+    Classify and score several comments with one FHE round trip per `batch_size` comments.
+
+    Args:
+        comments (List[str]): Comments to analyse.
+        batch_size (int): Maximum number of comments per request to the FHE server.
+
+    Returns:
+        List[Tuple[str, np.ndarray]]: (category, risk score) per comment, in input order.
+    """
+    if MODEL_LAYOUT == "joint":
+        client = get_client("joint")
+        keys = {"joint": get_serialized_evaluation_keys("joint", client)}
+        results = []
+        for start in range(0, len(comments), batch_size):
+            X_encs = [encrypt_features(x, client) for x in process_comments(comments[start:start + batch_size])]
+            encrypted_results = call_fhe_server_models({"joint": X_encs}, keys)["joint"]
+            results.extend(
+                decode_joint_output(client.deserialize_decrypt_dequantize(r)) for r in encrypted_results
+            )
+        return results
+
+    client = get_client("category")
+    client_risk = get_client("risk")
+    serialized_evaluation_keys = get_serialized_evaluation_keys("category", client)
+    serialized_evaluation_keys_risk = get_serialized_evaluation_keys("risk", client_risk)
+
+    results = []
+    for start in range(0, len(comments), batch_size):
+        # Featurize once for both models
+        X = process_comments(comments[start:start + batch_size])
+        X_encs = [encrypt_features(x, client) for x in X]
+        X_enc_risks = [encrypt_features(x, client_risk) for x in X]
+
+        encrypted_results, encrypted_results_risk = call_fhe_server_batch(
+            X_encs, X_enc_risks, serialized_evaluation_keys, serialized_evaluation_keys_risk
+        )
+
+        for encrypted_result, encrypted_result_risk in zip(encrypted_results, encrypted_results_risk):
+            y_enc = client.deserialize_decrypt_dequantize(encrypted_result)
+            y_enc_risk = client_risk.deserialize_decrypt_dequantize(encrypted_result_risk)
+            results.append((CATEGORY_MAP.get(int(np.argmax(y_enc))), clip_risk_score(y_enc_risk)))
+    return results
@@ -0,0 +1,88 @@
+"""
+Export the language models to ONNX for the onnx LLM backend (PRIVIFY_LLM_BACKEND=onnx).
+
+Each model is exported with its KV cache inputs and outputs through optimum and
+saved, with its tokenizer, to PRIVIFY_ONNX_DIR/<model> (./onnx_models by
+default). With --quantize the ONNX weights are also quantized to int8 with
+ONNX Runtime's dynamic quantization. The export is written to a temporary
+sibling directory and moved into place once complete:
+
+    pip install 'optimum[onnxruntime]==1.16.2'
+    python export_llm.py
+    python export_llm.py --models tinyllama phi3 --quantize
+
+Phi-3 ships its own modeling code; exporting it needs an optimum release that
+supports the phi3 architecture, which in turn needs a newer transformers.
+"""
+import argparse
+import os
+import shutil
+import time
+
+from language_models import PHI3_MODEL_NAME, TINYLLAMA_MODEL_NAME
+from llm_backends import import_ort_model, onnx_model_dir
+
+MODELS = {"tinyllama": TINYLLAMA_MODEL_NAME, "phi3": PHI3_MODEL_NAME}
+
+
+def quantize_onnx_files(src_dir, dst_dir):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(dst_dir)
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        if name.endswith(".onnx"):
+            quantize_dynamic(src, os.path.join(dst_dir, name), weight_type=QuantType.QInt8,
+                             use_external_data_format=True)
+        elif not name.endswith(".onnx_data"):
+            # config, generation config and tokenizer files
+            shutil.copy2(src, os.path.join(dst_dir, name))
+
+
+def export(model_name, output_dir, quantize):
+    from transformers import AutoTokenizer
+
+    ORTModelForCausalLM = import_ort_model()
+    tmp_dir = f"{output_dir.rstrip('/')}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    start = time.perf_counter()
+    model = ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True, trust_remote_code=True)
+    model.save_pretrained(tmp_dir)
+    AutoTokenizer.from_pretrained(model_name, trust_remote_code=True).save_pretrained(tmp_dir)
+    del model
+    print(f"[{model_name}] exported in {time.perf_counter() - start:.0f}s")
+
+    if quantize:
+        start = time.perf_counter()
+        quantized_dir = f"{tmp_dir}-int8"
+        shutil.rmtree(quantized_dir, ignore_errors=True)
+        quantize_onnx_files(tmp_dir, quantized_dir)
+        shutil.rmtree(tmp_dir)
+        tmp_dir = quantized_dir
+        print(f"[{model_name}] quantized in {time.perf_counter() - start:.0f}s")
+
+    # Swap the whole directory, so a loading server sees the old export or the new one
+    old_dir = f"{output_dir.rstrip('/')}.old-{os.getpid()}"
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    print(f"[{model_name}] saved to {output_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", choices=sorted(MODELS), default=["tinyllama"])
+    parser.add_argument("--quantize", action="store_true", help="Quantize the ONNX weights to int8")
+    args = parser.parse_args()
+
+    for name in args.models:
+        model_name = MODELS[name]
+        output_dir = onnx_model_dir(model_name)
+        os.makedirs(os.path.dirname(output_dir) or ".", exist_ok=True)
+        export(model_name, output_dir, args.quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+
+class FHEExecutor:
+    """
+    Runs circuit evaluations on a shared worker pool.
+
+    All evaluations of one request are dispatched together so independent
+    circuits (category and risk) run side by side, and at most
+    `max_concurrent_requests` requests hold the pool at once; the others wait
+    their turn instead of oversubscribing the cores.
+
+    The evaluations only overlap if the FHE runtime releases the GIL while it
+    runs a circuit; `python -m benchmarks.bench_fhe_threads` checks that on the
+    deployed artifacts. Where it does not, tiktok_server should run with
+    PRIVIFY_FHE_PROCESSES (fhe_process_pool.FHEProcessPool) instead.
+    """
+
+    def __init__(self, max_workers: int, max_concurrent_requests: int):
+        self.max_workers = max_workers
+        self.max_concurrent_requests = max_concurrent_requests
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fhe")
+        self._limit: Optional[asyncio.Semaphore] = None
+        self.waiting = 0  # Requests queued behind the concurrency limit
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_concurrent_requests)
+        return self._limit
+
+    async def run_all(self, calls: Sequence[Tuple[Callable, Tuple[Any, ...]]]) -> List[Any]:
+        """
+        Run `fn(*args)` for every (fn, args) pair concurrently and return the results in order.
+
+        Args:
+            calls (Sequence[Tuple[Callable, Tuple]]): Blocking calls belonging to one request.
+
+        Returns:
+            List[Any]: The return values, in the order of `calls`.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.gather(
+                *(loop.run_in_executor(self._pool, fn, *args) for fn, args in calls)
+            )
+        finally:
+            semaphore.release()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
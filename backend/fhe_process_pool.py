@@ -0,0 +1,282 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, List, Optional
+
+from key_cache import EvaluationKeyCache
+from tracing import get_logger
+
+logger = get_logger("fhe_process_pool")
+
+# Returned by a worker that has not seen a key set yet; the front end then
+# sends the serialized keys along with the same request
+MISSING_KEYS = "missing_keys"
+
+
+class PoolFullError(RuntimeError):
+    """Raised when `max_pending` requests are already queued or running in the pool."""
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a worker died while the request was queued or running; the workers are restarted."""
+
+
+# Worker status slots, shared with the front end: 0 until the worker first
+# reports, then _REPORTED | _READY if ready | a bit per loaded model (in
+# sorted model name order) from _MODELS_SHIFT on
+_REPORTED = 1
+_READY = 2
+_MODELS_SHIFT = 2
+
+# Per-process state of a worker, set up by `_init_worker`
+_registry = None
+_keys: Optional[EvaluationKeyCache] = None
+_reload_generation = None
+_seen_generation = 0
+_watch_interval = 0.0
+_last_check = 0.0
+_status = None
+_slot = 0
+
+
+def _init_worker(model_dirs, optional, key_cache_size, key_cache_ttl, watch_interval, reload_generation,
+                 next_slot, status):
+    global _registry, _keys, _reload_generation, _watch_interval, _last_check, _status, _slot
+    from model_registry import ModelRegistry
+
+    _registry = ModelRegistry(model_dirs, optional=optional)
+    _keys = EvaluationKeyCache(max_entries=key_cache_size, ttl_seconds=key_cache_ttl)
+    _reload_generation = reload_generation
+    _watch_interval = watch_interval
+    _last_check = time.monotonic()
+    _status = status
+    with next_slot.get_lock():
+        _slot = next_slot.value
+        next_slot.value += 1
+    try:
+        _registry.load_all()
+    except Exception as e:
+        # Retried by the next reload check, the front end stays not ready until then
+        logger.error("Worker failed to load FHE models. Reason: %s", e)
+    _publish_status()
+
+
+def _publish_status() -> None:
+    if _slot >= len(_status):
+        return
+    loaded = set(_registry.loaded)
+    models = sum(1 << i for i, name in enumerate(sorted(_registry.model_dirs)) if name in loaded)
+    _status[_slot] = _REPORTED | (_READY if _registry.ready else 0) | models << _MODELS_SHIFT
+
+
+def _maybe_reload() -> List[str]:
+    """Reload changed artifacts when asked to via /admin/reload or every `watch_interval` seconds."""
+    global _seen_generation, _last_check
+    now = time.monotonic()
+    generation = _reload_generation.value
+    due = _watch_interval > 0 and now - _last_check >= _watch_interval
+    if generation == _seen_generation and not due and _registry.ready:
+        return []
+    _seen_generation, _last_check = generation, now
+    try:
+        return _registry.reload_if_changed()
+    except Exception as e:
+        logger.error("Worker failed to reload FHE models, keeping the loaded ones. Reason: %s", e)
+        return []
+    finally:
+        _publish_status()
+
+
+def _worker_status() -> Dict[str, Any]:
+    reloaded = _maybe_reload()
+    return {"reloaded": reloaded, "models": _registry.loaded, "ready": _registry.ready}
+
+
+def _worker_run(key_id: str, inputs: Dict[str, List], serialized_keys: Optional[Dict[str, bytes]] = None):
+    from model_registry import deserialize_evaluation_keys, run_with_keys
+
+    _maybe_reload()
+    keys = _keys.get(key_id)
+    if keys is None:
+        if serialized_keys is None:
+            return MISSING_KEYS
+        keys = {name: deserialize_evaluation_keys(key) for name, key in serialized_keys.items()}
+        _keys.put(key_id, keys)
+    servers = _registry.snapshot()
+    return {name: [run_with_keys(servers[name], x, keys[name]) for x in xs] for name, xs in inputs.items()}
+
+
+def _mp_context():
+    # forkserver starts workers from a clean process that already imported the
+    # model code, so the workers share those pages instead of re-importing
+    # concrete each, without forking the server's threads
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["model_registry"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class FHEProcessPool:
+    """
+    Runs circuit evaluations in worker processes, one request per worker at a time.
+
+    Each worker loads the FHE servers once at startup and keeps its own cache of
+    deserialized evaluation keys by key ID. A request carries only the key ID;
+    a worker that misses the key set answers `MISSING_KEYS` and the request is
+    sent again with the serialized keys, so key bytes only cross the process
+    boundary while a worker has not cached them yet. Idle workers pull the next
+    request from the shared queue, and at most `max_pending` requests are
+    accepted at once; beyond that `run` raises `PoolFullError` instead of queueing.
+
+    Workers check their artifacts for changes every `watch_interval` seconds
+    and on the next request after `request_reload`. Every worker publishes its
+    readiness and loaded models to shared memory after each load or reload, and
+    `ready` and `models` aggregate those of all workers.
+
+    A worker killed by a crash in the native circuit code or by the OOM killer
+    breaks the executor for good, so the pool then starts a new one: requests
+    that were in it raise `WorkerCrashedError`, and `ready` stays false until
+    the new workers have loaded their artifacts.
+    """
+
+    def __init__(
+        self,
+        model_dirs: Dict[str, str],
+        optional: Iterable[str] = (),
+        workers: int = 2,
+        max_pending: int = 8,
+        key_cache_size: int = 32,
+        key_cache_ttl: float = 3600.0,
+        watch_interval: float = 10.0,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._context = _mp_context()
+        self._reload_generation = self._context.Value("i", 0)
+        self._model_names = sorted(model_dirs)
+        self._worker_args = (dict(model_dirs), list(optional), key_cache_size, key_cache_ttl, watch_interval)
+        self._start_pool()
+        self.pending = 0
+        self.rejected = 0
+        self.key_transfers = 0
+        self.restarts = 0
+
+    def _start_pool(self) -> None:
+        # Each executor gets its own status slots, so workers of a broken one
+        # that are still being terminated cannot report into the new ones
+        self._status = self._context.Array("q", self.workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(*self._worker_args, self._reload_generation, self._context.Value("i", 0), self._status),
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Replace a broken executor, unless a concurrent request already did."""
+        if broken is not self._pool:
+            return
+        logger.error("An FHE worker died, restarting the worker processes")
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        with self._reload_generation.get_lock():
+            self._reload_generation.value += 1
+        self._start_pool()
+        # Start the new workers now rather than on the next request, so /ready recovers by itself
+        for _ in range(self.workers):
+            self._pool.submit(_worker_status)
+
+    async def _submit(self, fn, *args):
+        pool = self._pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool as e:
+            self._restart(pool)
+            raise WorkerCrashedError("An FHE worker died, workers are restarting") from e
+
+    @property
+    def ready(self) -> bool:
+        """Whether every worker has started and loaded its required models."""
+        return all(status & _READY for status in self._status[:])
+
+    @property
+    def models(self) -> List[str]:
+        """Models loaded by every worker that has reported, so any worker can run them."""
+        statuses = [status for status in self._status[:] if status & _REPORTED]
+        if not statuses:
+            return []
+        return [name for i, name in enumerate(self._model_names)
+                if all((status >> _MODELS_SHIFT) & (1 << i) for status in statuses)]
+
+    async def refresh(self) -> List[str]:
+        """
+        Let the workers check for changed artifacts, starting any that are not running yet.
+
+        One check is queued per worker. Idle workers take them right away and a
+        busy worker may take none, in which case it checks on its next request.
+        `ready` and `models` do not depend on which workers ran a check, since
+        every worker reports its own status.
+
+        Returns:
+            List[str]: Names of the models reloaded by the workers that ran a check.
+        """
+        try:
+            statuses = await asyncio.gather(*(self._submit(_worker_status) for _ in range(self.workers)))
+        except WorkerCrashedError:
+            return []
+        return sorted({name for status in statuses for name in status["reloaded"]})
+
+    async def request_reload(self) -> List[str]:
+        """Make every worker check its artifacts on its next request."""
+        with self._reload_generation.get_lock():
+            self._reload_generation.value += 1
+        return await self.refresh()
+
+    async def run(
+        self, key_id: str, inputs: Dict[str, List], serialized_keys: Dict[str, bytes]
+    ) -> Dict[str, List[bytes]]:
+        """
+        Run every model on each of its inputs in one worker, keeping the input order.
+
+        Args:
+            key_id (str): ID of the key set, as returned by `key_set_id`.
+            inputs (Dict[str, List]): Encrypted inputs by model name.
+            serialized_keys (Dict[str, bytes]): The key set, sent only to workers that miss it.
+
+        Returns:
+            Dict[str, List[bytes]]: Encrypted outputs by model name.
+
+        Raises:
+            PoolFullError: When `max_pending` requests are already in the pool.
+            WorkerCrashedError: When a worker died before the request completed.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolFullError(f"FHE workers busy, {self.pending} requests pending")
+
+        self.pending += 1
+        try:
+            results = await self._submit(_worker_run, key_id, inputs)
+            if results == MISSING_KEYS:
+                self.key_transfers += 1
+                results = await self._submit(_worker_run, key_id, inputs, serialized_keys)
+            return results
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "key_transfers": self.key_transfers,
+            "restarts": self.restarts,
+            "ready": self.ready,
+        }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,186 @@
+"""
+Length-prefixed binary framing for FHE payloads.
+
+Ciphertexts and evaluation keys are opaque byte strings, so sending them as
+base64 inside JSON costs ~33% more bytes plus a full decode pass. A frame body
+is instead laid out as:
+
+    MAGIC | uint32 frame count | frames...
+
+where each frame is `uint16 name length | name (utf-8) | uint64 payload length | payload`,
+all integers big-endian. Frame names are model names ("category", "risk"), "key_id",
+etc. and may repeat (one frame per comment in a batch), order is preserved.
+"""
+import struct
+from typing import Dict, Iterable, List, Tuple, Union
+
+CONTENT_TYPE = "application/octet-stream"
+MAGIC = b"PFV1"
+
+_COUNT = struct.Struct(">I")
+_NAME_LEN = struct.Struct(">H")
+_PAYLOAD_LEN = struct.Struct(">Q")
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class FrameDecodeError(ValueError):
+    """Raised when a body is not a well-formed frame sequence."""
+
+
+def encode_frames(frames: Iterable[Tuple[str, BytesLike]]) -> bytes:
+    """
+    Pack (name, payload) pairs into a single frame body.
+
+    Args:
+        frames (Iterable[Tuple[str, BytesLike]]): Frames in the order they should be sent.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    frames = list(frames)
+    parts = [MAGIC, _COUNT.pack(len(frames))]
+    for name, payload in frames:
+        encoded_name = name.encode("utf-8")
+        parts.append(_NAME_LEN.pack(len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(_PAYLOAD_LEN.pack(len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def decode_frames(body: BytesLike) -> List[Tuple[str, memoryview]]:
+    """
+    Split a frame body into (name, payload) pairs without copying the payloads.
+
+    Args:
+        body (BytesLike): The encoded body.
+
+    Returns:
+        List[Tuple[str, memoryview]]: Frames in the order they were encoded. Payloads
+        are views into `body`.
+    """
+    view = memoryview(body)
+    if view[:len(MAGIC)] != MAGIC:
+        raise FrameDecodeError("Missing frame header")
+    offset = len(MAGIC)
+
+    try:
+        (count,) = _COUNT.unpack_from(view, offset)
+        offset += _COUNT.size
+        frames = []
+        for _ in range(count):
+            (name_len,) = _NAME_LEN.unpack_from(view, offset)
+            offset += _NAME_LEN.size
+            name = bytes(view[offset:offset + name_len]).decode("utf-8")
+            offset += name_len
+            (payload_len,) = _PAYLOAD_LEN.unpack_from(view, offset)
+            offset += _PAYLOAD_LEN.size
+            if offset + payload_len > len(view):
+                raise FrameDecodeError(f"Frame '{name}' is truncated")
+            frames.append((name, view[offset:offset + payload_len]))
+            offset += payload_len
+    except struct.error as e:
+        raise FrameDecodeError(f"Truncated frame body: {e}") from e
+
+    if offset != len(view):
+        raise FrameDecodeError("Trailing bytes after the last frame")
+    return frames
+
+
+class FrameReader:
+    """
+    Incremental counterpart of `decode_frames` for a body that arrives in chunks,
+    e.g. a streamed request.
+
+    The body is never buffered as a whole: each payload is copied once, from the
+    chunks it spans into its own bytes object, which is what the FHE runtime
+    deserializes from. Call `feed` with every chunk, then `close` for the frames.
+    """
+
+    def __init__(self):
+        self._frames: List[Tuple[str, bytes]] = []
+        self._state = "header"
+        self._field = bytearray()  # fixed-size field or name being read
+        self._field_size = len(MAGIC) + _COUNT.size
+        self._frames_left = 0
+        self._name = ""
+        self._payload: List[memoryview] = []
+        self._payload_left = 0
+
+    def feed(self, chunk: BytesLike) -> None:
+        view = memoryview(chunk)
+        while view:
+            if self._state == "done":
+                raise FrameDecodeError("Trailing bytes after the last frame")
+            if self._state == "payload":
+                part = view[:self._payload_left]
+                self._payload.append(part)
+                self._payload_left -= len(part)
+                view = view[len(part):]
+                if not self._payload_left:
+                    self._add_frame(b"".join(self._payload))
+                continue
+            part = view[:self._field_size - len(self._field)]
+            self._field += part
+            view = view[len(part):]
+            if len(self._field) == self._field_size:
+                field = bytes(self._field)
+                self._field.clear()
+                self._read_field(field)
+
+    def close(self) -> List[Tuple[str, bytes]]:
+        """Return the frames, in the order they were encoded, once the whole body was fed."""
+        if self._state != "done":
+            raise FrameDecodeError("Truncated frame body")
+        return self._frames
+
+    def _read_field(self, field: bytes) -> None:
+        if self._state == "header":
+            if field[:len(MAGIC)] != MAGIC:
+                raise FrameDecodeError("Missing frame header")
+            (self._frames_left,) = _COUNT.unpack_from(field, len(MAGIC))
+            self._next_frame()
+        elif self._state == "name_length":
+            (name_len,) = _NAME_LEN.unpack(field)
+            if name_len:
+                self._expect("name", name_len)
+            else:
+                self._name = ""
+                self._expect("payload_length", _PAYLOAD_LEN.size)
+        elif self._state == "name":
+            try:
+                self._name = field.decode("utf-8")
+            except UnicodeDecodeError as e:
+                raise FrameDecodeError(f"Invalid frame name: {e}") from e
+            self._expect("payload_length", _PAYLOAD_LEN.size)
+        else:
+            (self._payload_left,) = _PAYLOAD_LEN.unpack(field)
+            if self._payload_left:
+                self._state = "payload"
+            else:
+                self._add_frame(b"")
+
+    def _expect(self, state: str, size: int) -> None:
+        self._state = state
+        self._field_size = size
+
+    def _add_frame(self, payload: bytes) -> None:
+        self._frames.append((self._name, payload))
+        self._payload = []
+        self._next_frame()
+
+    def _next_frame(self) -> None:
+        if not self._frames_left:
+            self._state = "done"
+            return
+        self._frames_left -= 1
+        self._expect("name_length", _NAME_LEN.size)
+
+
+def group_frames(frames: List[Tuple[str, BytesLike]]) -> Dict[str, List[BytesLike]]:
+    """Group decoded frames by name, keeping their relative order."""
+    grouped: Dict[str, List[BytesLike]] = {}
+    for name, payload in frames:
+        grouped.setdefault(name, []).append(payload)
+    return grouped
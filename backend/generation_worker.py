@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+def _percentile(samples: Sequence[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class GenerationWorker:
+    """
+    Collects concurrent generation requests into micro-batches.
+
+    Requests are queued; the worker takes the first waiting request, then keeps
+    collecting until it has `max_batch_size` requests or `max_wait_ms` has
+    passed, and hands the batch to `generate_batch` on a dedicated thread so the
+    event loop stays free. Requests arriving while a batch runs form the next one.
+    """
+
+    def __init__(self, generate_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 20.0, latency_samples: int = 1024):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # A single thread: the model serves one batch at a time
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generation")
+        self.batch_sizes: Counter = Counter()
+        self._latencies: Deque[float] = deque(maxlen=latency_samples)
+        self._queue_waits: Deque[float] = deque(maxlen=latency_samples)
+
+    def start(self) -> None:
+        # Created here so the queue binds to the running event loop
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._pool.shutdown(wait=False)
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        if self._task is None:
+            raise RuntimeError("GenerationWorker is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Callers that went away (e.g. client disconnected) are not generated for
+        return [entry for entry in batch if not entry[1].done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            self._queue_waits.extend(started - enqueued for _, _, enqueued in batch)
+            self.batch_sizes[len(batch)] += 1
+            try:
+                results = await loop.run_in_executor(self._pool, self.generate_batch, [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for (_, future, enqueued), result in zip(batch, results):
+                self._latencies.append(finished - enqueued)
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = list(self._latencies)
+        queue_waits = list(self._queue_waits)
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": sum(self.batch_sizes.values()),
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "queue_wait_ms": {"p50": _percentile(queue_waits, 0.5) * 1000, "p95": _percentile(queue_waits, 0.95) * 1000},
+            "time_to_result_ms": {"p50": _percentile(latencies, 0.5) * 1000, "p95": _percentile(latencies, 0.95) * 1000},
+        }
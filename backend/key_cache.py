@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def key_set_id(serialized_keys: Dict[str, bytes]) -> str:
+    """
+    Content hash identifying a set of serialized evaluation keys.
+
+    Args:
+        serialized_keys (Dict[str, bytes]): Serialized evaluation keys by model name.
+
+    Returns:
+        str: Hex digest that is stable across processes for the same key set.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(serialized_keys):
+        key = serialized_keys[name]
+        digest.update(name.encode("utf-8"))
+        digest.update(len(key).to_bytes(8, "big"))
+        digest.update(key)
+    return digest.hexdigest()
+
+
+class EvaluationKeyCache:
+    """
+    Bounded LRU cache of deserialized evaluation keys with an idle TTL.
+
+    Entries are evicted when the cache holds more than `max_entries` key sets or
+    when a key set has not been used for `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries: int = 32, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key_id: str) -> bool:
+        return self.get(key_id, count=False) is not None
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [key_id for key_id, (_, last_used) in self._entries.items()
+                   if now - last_used > self.ttl_seconds]
+        for key_id in expired:
+            del self._entries[key_id]
+
+    def put(self, key_id: str, keys: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key_id] = (keys, now)
+            self._entries.move_to_end(key_id)
+            self._evict_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key_id: str, count: bool = True) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_id)
+            if entry is None or now - entry[1] > self.ttl_seconds:
+                self._entries.pop(key_id, None)
+                if count:
+                    self.misses += 1
+                return None
+            self._entries[key_id] = (entry[0], now)
+            self._entries.move_to_end(key_id)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
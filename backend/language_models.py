@@ -1,28 +1,89 @@
 
-import torch
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
-from typing import List, Dict
+# torch, transformers and pandas are imported where they are used, so importing
+# this module (e.g. when starting on_device_server) stays fast
+from typing import Iterator, List, Dict, Optional, Tuple
+import json
+import os
 import re
-import pandas as pd
-
-pipe = pipeline(
-    "text-generation",
-    model="TinyLlama/TinyLlama-1.1B-Chat-v1.0",
-    torch_dtype=torch.bfloat16,
-    device_map="auto"
-)
-
-def generate_moderation_response(comment: str, violation_types: List[str], risk_score: int) -> Dict[str, str]:
+import threading
+import time
+from llm_backends import load_causal_lm, text_generation_pipeline
+from model_manager import LazyModel, default_device
+from response_cache import ResponseCache, moderation_key, summary_key
+from tracing import get_logger
+
+logger = get_logger("language_models")
+
+TINYLLAMA_MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+
+# Inference backend for TinyLlama: "torch" (bfloat16), "torch-int8" or "onnx",
+# see llm_backends.py. Phi-3 uses PRIVIFY_PHI3_BACKEND, defaulting to the same
+LLM_BACKEND = os.environ.get("PRIVIFY_LLM_BACKEND", "torch")
+
+# Prompts per forward pass in batched generation (process_csv, safe_generate_batch)
+LLM_BATCH_SIZE = int(os.environ.get("PRIVIFY_LLM_BATCH_SIZE", "8"))
+
+# "structured" stops generation as soon as the Reasoning and Suggestion lines
+# are complete; "legacy" samples up to 300 tokens and scrapes the result
+LLM_DECODING = os.environ.get("PRIVIFY_LLM_DECODING", "structured")
+# Token budget in structured mode, two tooltip-sized sentences fit comfortably
+LLM_MAX_NEW_TOKENS = int(os.environ.get("PRIVIFY_LLM_MAX_NEW_TOKENS", "96"))
+LEGACY_MAX_NEW_TOKENS = 300
+# Start of the answer written into structured prompts
+STRUCTURED_PREFILL = "Reasoning:"
+
+FALLBACK_RESPONSE = {"reason": "Could not generate reasoning.", "suggestion": "Could not generate suggestion."}
+
+# Moderation explanations kept in memory, and optionally persisted to a SQLite file
+RESPONSE_CACHE_SIZE = int(os.environ.get("PRIVIFY_RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_PATH = os.environ.get("PRIVIFY_RESPONSE_CACHE_PATH") or None
+# Results kept in the SQLite file, per cache; the oldest are deleted beyond it
+RESPONSE_CACHE_DISK_SIZE = int(os.environ.get("PRIVIFY_RESPONSE_CACHE_DISK_SIZE", "100000"))
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_DISK_SIZE)
+
+PHI3_MODEL_NAME = "microsoft/Phi-3-mini-4k-instruct"
+# Device for Phi-3 ("cpu", "cuda", "mps"), autodetected when unset
+PHI3_DEVICE = os.environ.get("PRIVIFY_PHI3_DEVICE")
+# Unload Phi-3 after this many idle seconds to free RAM (0 keeps it resident)
+PHI3_IDLE_TIMEOUT = float(os.environ.get("PRIVIFY_PHI3_IDLE_TIMEOUT", "0"))
+PHI3_BACKEND = os.environ.get("PRIVIFY_PHI3_BACKEND") or LLM_BACKEND
+
+def _load_tinyllama_pipeline():
+    import torch
+
+    model, tokenizer = load_causal_lm(TINYLLAMA_MODEL_NAME, LLM_BACKEND, device="auto", torch_dtype=torch.bfloat16)
+    pipe = text_generation_pipeline(model, tokenizer)
+    # Batched generation needs a pad token, and decoder-only models must be
+    # padded on the left so every prompt ends right where generation starts
+    if pipe.tokenizer.pad_token is None:
+        pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+    pipe.tokenizer.padding_side = "left"
+    return pipe
+
+_tinyllama = LazyModel(f"{TINYLLAMA_MODEL_NAME} ({LLM_BACKEND})", _load_tinyllama_pipeline)
+
+def get_pipe():
+    """Return the TinyLlama text-generation pipeline, loading it on first use."""
+    return _tinyllama.get()
+
+def warm_up() -> None:
+    """Load TinyLlama ahead of the first request, e.g. from a FastAPI startup hook."""
+    get_pipe()
+
+def __getattr__(name):
+    # Keeps `language_models.pipe` working without loading the model at import time
+    if name == "pipe":
+        return get_pipe()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def build_moderation_prompt(pipe, comment: str, violation_types: List[str], risk_score: int,
+                            structured: bool = False) -> str:
     """
-    Generate reasoning and suggestion for a flagged comment.
+    Render the chat prompt for one flagged comment with the pipeline's chat template.
 
-    Args:
-        comment (str): The social media comment.
-        violation_types (List[str]): List of violation types.
-        risk_score (int): Integer from 1 to 10 indicating severity.
-
-    Returns:
-        Dict[str, str]: Dictionary with keys "reason" and "suggestion".
+    In structured mode the prompt asks for exactly two lines and pre-fills the
+    answer with "Reasoning:", so the output starts in the expected format.
     """
     messages = [
         {
@@ -54,22 +115,23 @@ Inputs:
         }
     ]
 
+    if structured:
+        messages[1]["content"] += "Answer with exactly two lines and nothing else:\nReasoning: <one sentence>\nSuggestion: <one sentence>\n"
+
     # Apply chat template
     prompt = pipe.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    if structured:
+        prompt += STRUCTURED_PREFILL
+    return prompt
 
-    # Generate output
-    outputs = pipe(prompt, max_new_tokens=300, do_sample=True, temperature=0.3, top_k=50, top_p=0.95)
-    full_text = outputs[0]["generated_text"]
-
+def parse_moderation_output(full_text: str) -> Dict[str, str]:
+    """Extract "reason" and "suggestion" from generated text; missing fields are returned empty."""
     # Extract assistant response
     if "<|assistant|>" in full_text:
         response_text = full_text.split("<|assistant|>")[-1].strip()
     else:
         response_text = full_text.strip()
 
-    # print(response_text)  # For debugging
-    # print("-----")
-
     # Try to parse Reasoning and Suggestion even if JSON is malformed
     reason = ""
     suggestion = ""
@@ -83,24 +145,321 @@ Inputs:
 
     return {"reason": reason, "suggestion": suggestion}
 
+def _is_complete(result: Dict[str, str]) -> bool:
+    return bool(result.get("reason", "") and result.get("suggestion", ""))
+
+_FIELDS_COMPLETE = re.compile(r"[Rr]easoning:[ \t]*\S[^\n]*\n.*?[Ss]uggestion:[ \t]*\S[^\n]*\n", re.DOTALL)
+
+def _fields_complete_criteria(tokenizer, prefill: str = ""):
+    """
+    StoppingCriteria that ends generation once every sequence in the batch has
+    emitted a full Reasoning line and a full Suggestion line (or hit EOS).
+
+    Only the generated tokens are checked, after `prefill` (the end of the
+    prompt the answer continues): the chat template ends every turn with EOS
+    and left padding uses EOS too, so the prompt always contains it.
+    """
+    from transformers import StoppingCriteria
+
+    class FieldsComplete(StoppingCriteria):
+        def __init__(self):
+            self.prompt = None  # prompt ids of the current generate() call
+            self.length = 0
+
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            # Called after every new token, so the first call of a generate()
+            # has one generated token. A pipeline runs one generate() per batch
+            # with the same criteria, which then starts over with a new prompt
+            length = input_ids.shape[1]
+            if (self.prompt is None or length != self.length + 1
+                    or input_ids[:, :len(self.prompt[0])].tolist() != self.prompt):
+                self.prompt = input_ids[:, :-1].tolist()
+            self.length = length
+            for row in input_ids[:, len(self.prompt[0]):].tolist():
+                if tokenizer.eos_token_id in row:
+                    continue
+                if not _FIELDS_COMPLETE.search(prefill + tokenizer.decode(row)):
+                    return False
+            return True
+
+    return FieldsComplete()
+
+def _stop_event_criteria(stop: threading.Event):
+    """StoppingCriteria that ends generation once `stop` is set, e.g. when a streaming client disconnects."""
+    from transformers import StoppingCriteria
+
+    class StopEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            return stop.is_set()
+
+    return StopEvent()
+
+def _generation_kwargs(pipe, structured: bool, stop: Optional[threading.Event] = None) -> dict:
+    from transformers import StoppingCriteriaList
+
+    kwargs = {"do_sample": True, "temperature": 0.3, "top_k": 50, "top_p": 0.95}
+    criteria = StoppingCriteriaList()
+    if stop is not None:
+        criteria.append(_stop_event_criteria(stop))
+    if structured:
+        criteria.append(_fields_complete_criteria(pipe.tokenizer, STRUCTURED_PREFILL))
+        kwargs["max_new_tokens"] = LLM_MAX_NEW_TOKENS
+    else:
+        kwargs["max_new_tokens"] = LEGACY_MAX_NEW_TOKENS
+    if criteria:
+        kwargs["stopping_criteria"] = criteria
+    return kwargs
+
+def _structured(structured: Optional[bool]) -> bool:
+    return LLM_DECODING == "structured" if structured is None else structured
+
+class GenerationStats:
+    """
+    Counters for LLM generation: requests that reached the LLM, extra attempts
+    after unparsable output, fallbacks, and prompt and generated tokens.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.generations = 0
+            self.retries = 0
+            self.fallbacks = 0
+            self.prompt_tokens = 0
+            self.tokens = 0
+
+    def record(self, requests: int = 0, generations: int = 0, retries: int = 0, fallbacks: int = 0,
+               tokens: int = 0, prompt_tokens: int = 0) -> None:
+        with self._lock:
+            self.requests += requests
+            self.generations += generations
+            self.retries += retries
+            self.fallbacks += fallbacks
+            self.prompt_tokens += prompt_tokens
+            self.tokens += tokens
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "generations": self.generations,
+                "retries": self.retries,
+                "fallbacks": self.fallbacks,
+                "prompt_tokens": self.prompt_tokens,
+                "tokens": self.tokens,
+                "tokens_per_request": self.tokens / self.requests if self.requests else 0.0,
+                "retry_rate": self.retries / self.requests if self.requests else 0.0,
+            }
+
+generation_stats = GenerationStats()
+# Same counters for Phi-3 privacy analyses, where a request may take several generations
+analysis_stats = GenerationStats()
+
+# TinyLlama serves one generation at a time; batched and streamed requests take turns
+_generation_lock = threading.Lock()
+
+def _count_tokens(tokenizer, text: str) -> int:
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def _run_generation(pipe, prompts, structured: bool, **pipe_kwargs) -> List[Dict[str, str]]:
+    with _generation_lock:
+        outputs = pipe(prompts, **pipe_kwargs, **_generation_kwargs(pipe, structured))
+    if isinstance(prompts, str):
+        outputs = [outputs]
+    results, tokens, prompt_tokens = [], 0, 0
+    for prompt, output in zip([prompts] if isinstance(prompts, str) else prompts, outputs):
+        full_text = output[0]["generated_text"]
+        prompt_tokens += _count_tokens(pipe.tokenizer, prompt)
+        tokens += _count_tokens(pipe.tokenizer, full_text[len(prompt):])
+        results.append(parse_moderation_output(full_text))
+    generation_stats.record(generations=len(results), tokens=tokens, prompt_tokens=prompt_tokens)
+    return results
+
+def generate_moderation_response(comment: str, violation_types: List[str], risk_score: int,
+                                 structured: Optional[bool] = None) -> Dict[str, str]:
+    """
+    Generate reasoning and suggestion for a flagged comment.
+
+    Args:
+        comment (str): The social media comment.
+        violation_types (List[str]): List of violation types.
+        risk_score (int): Integer from 1 to 10 indicating severity.
+        structured (Optional[bool]): Stop-sequence decoding, defaults to PRIVIFY_LLM_DECODING.
+
+    Returns:
+        Dict[str, str]: Dictionary with keys "reason" and "suggestion".
+    """
+    structured = _structured(structured)
+    pipe = get_pipe()
+    prompt = build_moderation_prompt(pipe, comment, violation_types, risk_score, structured)
+
+    # Generate output
+    return _run_generation(pipe, prompt, structured)[0]
+
+def generate_moderation_responses(items: List[Tuple[str, List[str], int]], batch_size: int = LLM_BATCH_SIZE,
+                                  structured: Optional[bool] = None) -> List[Dict[str, str]]:
+    """
+    Batched version of generate_moderation_response.
+
+    Prompts are left-padded and run through the pipeline `batch_size` at a time,
+    so one forward pass per step serves the whole batch.
+
+    Args:
+        items (List[Tuple[str, List[str], int]]): (comment, violation_types, risk_score) per row.
+        batch_size (int): Number of prompts generated together.
+        structured (Optional[bool]): Stop-sequence decoding, defaults to PRIVIFY_LLM_DECODING.
+
+    Returns:
+        List[Dict[str, str]]: One {"reason", "suggestion"} dict per item, in order.
+    """
+    if not items:
+        return []
+    structured = _structured(structured)
+    pipe = get_pipe()
+    prompts = [build_moderation_prompt(pipe, comment, violation_types, risk_score, structured)
+               for comment, violation_types, risk_score in items]
+    return _run_generation(pipe, prompts, structured, batch_size=batch_size)
+
 
 
 # Assuming your generate_moderation_response function is already defined
-# and `pipe` is loaded globally
+# and `pipe` is loaded on first use by get_pipe
+
+def cached_response(comment: str, category: str, score: int) -> Optional[Dict[str, str]]:
+    """Return the cached explanation for this comment, category and score, if any."""
+    return response_cache.get(moderation_key(comment, category, score))
 
 def safe_generate(comment: str, category: str, score: int, max_retries: int = 6) -> Dict[str, str]:
 
+    key = moderation_key(comment, category, score)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation_stats.record(requests=1)
     for attempt in range(max_retries):
         result = generate_moderation_response(comment, [category], score)
-        reason, suggestion = result.get("reason", ""), result.get("suggestion", "")
-        if reason and suggestion:
+        if _is_complete(result):
+            response_cache.put(key, result)
             return result
-        print(f"⚠️ Empty response, retrying ({attempt+1}/{max_retries})...")
+        logger.info("Empty response, retrying (%d/%d)...", attempt + 1, max_retries)
+        if attempt + 1 < max_retries:
+            generation_stats.record(retries=1)
+    # If still empty after retries, fallback
+    generation_stats.record(fallbacks=1)
+    return dict(FALLBACK_RESPONSE)
+
+
+def stream_safe_generate(comment: str, category: str, score: int, max_retries: int = 6,
+                         stop: Optional[threading.Event] = None) -> Iterator[Tuple[str, object]]:
+    """
+    Streaming version of safe_generate.
+
+    Yields ("token", text) while the explanation is generated, then one
+    ("done", {"reason", "suggestion"}). A cached explanation is returned as "done"
+    right away. If the streamed output cannot be parsed, the remaining retries
+    run without streaming before "done" is sent.
+
+    Args:
+        stop (Optional[threading.Event]): Set it to abort generation, e.g. when the client goes away.
+    """
+    key = moderation_key(comment, category, score)
+    cached = response_cache.get(key)
+    if cached is not None:
+        yield "done", cached
+        return
+
+    from transformers import TextIteratorStreamer
+
+    structured = _structured(None)
+    pipe = get_pipe()
+    prompt = build_moderation_prompt(pipe, comment, [category], score, structured)
+    streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors: List[Exception] = []
+
+    def generate():
+        try:
+            with _generation_lock:
+                pipe(prompt, streamer=streamer, **_generation_kwargs(pipe, structured, stop))
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer, which re-raises the error
+            streamer.end()
+
+    thread = threading.Thread(target=generate, name="generation-stream", daemon=True)
+    thread.start()
+
+    # The structured prompt pre-fills "Reasoning:", so the generated text starts after it
+    text = STRUCTURED_PREFILL if structured else ""
+    if text:
+        yield "token", text
+    for chunk in streamer:
+        if chunk:
+            text += chunk
+            yield "token", chunk
+    thread.join()
+    if errors:
+        raise errors[0]
+
+    generation_stats.record(generations=1, tokens=_count_tokens(pipe.tokenizer, text),
+                            prompt_tokens=_count_tokens(pipe.tokenizer, prompt))
+    result = parse_moderation_output(text)
+    if _is_complete(result):
+        generation_stats.record(requests=1)
+        response_cache.put(key, result)
+    elif stop is None or not stop.is_set():
+        # safe_generate counts the request itself
+        generation_stats.record(retries=1)
+        result = safe_generate(comment, category, score, max_retries=max(max_retries - 1, 1))
+    yield "done", result
+
+
+def safe_generate_batch(rows: List[Tuple[str, str, int]],
+                        batch_size: int = LLM_BATCH_SIZE,
+                        max_retries: int = 6) -> List[Dict[str, str]]:
+    """
+    Batched version of safe_generate for (comment, category, score) rows.
+
+    Rows whose output cannot be parsed are collected and retried together as
+    a smaller batch, rather than regenerating each one on its own. Rows already
+    in the response cache are not generated at all.
+    """
+    keys = [moderation_key(comment, category, score) for comment, category, score in rows]
+    results: List[Optional[Dict[str, str]]] = [response_cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    generation_stats.record(requests=len(pending))
+
+    for attempt in range(max_retries):
+        if not pending:
+            break
+        outputs = generate_moderation_responses(
+            [(rows[i][0], [rows[i][1]], rows[i][2]) for i in pending],
+            batch_size=min(batch_size, len(pending)),
+        )
+        failed = []
+        for i, result in zip(pending, outputs):
+            if _is_complete(result):
+                results[i] = result
+                response_cache.put(keys[i], result)
+            else:
+                failed.append(i)
+        if failed:
+            logger.info("%d empty responses, retrying (%d/%d)...", len(failed), attempt + 1, max_retries)
+            if attempt + 1 < max_retries:
+                generation_stats.record(retries=len(failed))
+        pending = failed
+
     # If still empty after retries, fallback
-    return {"reason": "Could not generate reasoning.", "suggestion": "Could not generate suggestion."}
+    generation_stats.record(fallbacks=len(pending))
+    return [result if result is not None else dict(FALLBACK_RESPONSE) for result in results]
 
 
-def process_csv(input_csv: str, output_csv: str) -> None:
+def process_csv(input_csv: str, output_csv: str, batch_size: int = LLM_BATCH_SIZE) -> None:
+    import pandas as pd
 
     df = pd.read_csv(input_csv)
 
@@ -108,15 +467,17 @@ def process_csv(input_csv: str, output_csv: str) -> None:
     if not {"comment", "category", "score"}.issubset(df.columns):
         raise ValueError("CSV must contain columns: comment, category, score")
 
+    rows = list(zip(df["comment"], df["category"], df["score"].astype(int)))
     reasons: List[str] = []
     suggestions: List[str] = []
 
-    for idx, row in df.iterrows():
-        comment, category, score = row["comment"], row["category"], row["score"]
-        result = safe_generate(comment, category, int(score))
-        reasons.append(result["reason"])
-        suggestions.append(result["suggestion"])
-        print(f"✅ Processed row {idx+1}/{len(df)}")
+    start = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        for result in safe_generate_batch(rows[offset:offset + batch_size], batch_size=batch_size):
+            reasons.append(result["reason"])
+            suggestions.append(result["suggestion"])
+        print(f"✅ Processed rows {len(reasons)}/{len(df)}")
+    elapsed = time.perf_counter() - start
 
     # Add results to dataframe
     df["reason"] = reasons
@@ -124,58 +485,57 @@ def process_csv(input_csv: str, output_csv: str) -> None:
 
     # Save to new CSV
     df.to_csv(output_csv, index=False)
-    print(f"✅ Done! Saved results to {output_csv}")
+    print(f"✅ Done! Saved results to {output_csv} ({len(df) / max(elapsed, 1e-9):.2f} rows/sec)")
 
-def generate_privacy_analysis(comment_history: str,
-                              model_name: str = "microsoft/Phi-3-mini-4k-instruct",
-                              device: str = "mps",
-                              max_new_tokens: int = 300,
-                              temperature: float = 0.2,
-                              do_sample: bool = True) -> dict:
+def _load_phi3_pipeline(model_name: str, device: str):
+    model, tokenizer = load_causal_lm(model_name, PHI3_BACKEND, device=device, trust_remote_code=True)
+    return text_generation_pipeline(model, tokenizer)
+
+_phi3_models: Dict[tuple, LazyModel] = {}
+_phi3_models_lock = threading.Lock()
+
+def get_phi3_pipeline(model_name: str = PHI3_MODEL_NAME, device: Optional[str] = None):
     """
-    Generate a structured privacy analysis JSON from a chunk of comment history using Phi-3.
+    Return the Phi-3 text-generation pipeline, loading it once per (model, device).
 
     Args:
-        comment_history (str): Comments with reasoning/suggestions for improving privacy.
         model_name (str): Phi-3 model identifier.
-        device (str): 'cpu' or 'cuda' depending on your hardware.
-        max_new_tokens (int): Max tokens to generate.
-        temperature (float): Sampling temperature.
-        do_sample (bool): Whether to use sampling.
-
-    Returns:
-        dict: Structured JSON with overall_summary, pattern, key_findings, suggestions.
+        device (Optional[str]): 'cpu', 'cuda' or 'mps'. Defaults to PRIVIFY_PHI3_DEVICE, then autodetection.
     """
-    torch.manual_seed(0)  # reproducibility
-    
-    # Load model and tokenizer
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name,
-        device_map=device,
-        torch_dtype="auto",
-        trust_remote_code=True
-    )
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    phi_pipe = pipeline(
-        "text-generation",
-        model=model,
-        tokenizer=tokenizer
-    )
-
-    # Construct prompt
-    prompt = f"""
-You are a privacy analyst. Based on the following user's comment history, reasoning, and suggestions for improving privacy, generate a structured JSON summarizing the user's privacy risks and recommendations.
-
-Comment history:
-{comment_history}
-
+    return _phi3_model(model_name, device).get()
+
+def _phi3_model(model_name: str, device: Optional[str]) -> LazyModel:
+    device = device or PHI3_DEVICE or default_device()
+    with _phi3_models_lock:
+        if (model_name, device) not in _phi3_models:
+            _phi3_models[(model_name, device)] = LazyModel(
+                f"{model_name} on {device} ({PHI3_BACKEND})",
+                lambda: _load_phi3_pipeline(model_name, device),
+                idle_timeout=PHI3_IDLE_TIMEOUT or None,
+            )
+        return _phi3_models[(model_name, device)]
+
+# Phi-3 serves one generation at a time: concurrent /privacy_analysis requests
+# would otherwise share the model and the global torch seed between threads
+_phi3_generation_lock = threading.Lock()
+
+# Incremental /privacy_analysis: the history is split into chunks of at most
+# this many Phi-3 tokens, leaving room in the 4k context for the prompt and output
+PRIVACY_CHUNK_TOKENS = int(os.environ.get("PRIVIFY_PRIVACY_CHUNK_TOKENS", "1536"))
+PRIVACY_SUMMARY_MAX_NEW_TOKENS = 160
+# Chunk summaries and analyses kept in memory; persisted with the response cache when it is
+SUMMARY_CACHE_SIZE = int(os.environ.get("PRIVIFY_SUMMARY_CACHE_SIZE", "4096"))
+
+summary_cache = ResponseCache(SUMMARY_CACHE_SIZE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_DISK_SIZE, table="summaries")
+
+ANALYSIS_FORMAT = """
 Output JSON in this exact format with four fields:
-{{
+{
   "overall_summary": "...",
   "pattern": "...",
   "key_findings": "...",
   "suggestions": "..."
-}}
+}
 
 Rules:
 - Keep the output concise but informative.
@@ -184,17 +544,100 @@ Rules:
 - Do not add any extra text outside the JSON.
 """
 
-    # Generate output
+def _analysis_prompt(comment_history: str) -> str:
+    return f"""
+You are a privacy analyst. Based on the following user's comment history, reasoning, and suggestions for improving privacy, generate a structured JSON summarizing the user's privacy risks and recommendations.
+
+Comment history:
+{comment_history}
+""" + ANALYSIS_FORMAT
+
+def _reduce_prompt(summaries: str) -> str:
+    return f"""
+You are a privacy analyst. The following notes summarize consecutive parts of one user's comment history, with the reasoning and suggestions for improving privacy. Generate a structured JSON summarizing the user's privacy risks and recommendations across the whole history.
+
+Notes:
+{summaries}
+""" + ANALYSIS_FORMAT
+
+def _summary_prompt(chunk: str) -> str:
+    return f"""
+You are a privacy analyst. Summarize what the following part of a user's comment history reveals about them: locations, routines, habits, contacts and other personal information, and the suggestions given to protect their privacy.
+
+Comment history:
+{chunk}
+
+Rules:
+- Write at most 5 short bullet points.
+- Keep concrete details (places, times, habits) that show a pattern.
+- Do not add any text before or after the bullet points.
+"""
+
+def chunk_history(entries: List[str], max_tokens: int, count_tokens) -> List[str]:
+    """
+    Group consecutive entries into chunks of at most `max_tokens` tokens.
+
+    Chunks are filled greedily from the first entry, so appending entries only
+    changes the last chunk and adds new ones; the earlier chunks stay identical
+    and keep their cached summaries. An entry longer than `max_tokens` is split
+    on word boundaries.
+
+    Args:
+        entries (List[str]): Comment history lines, or summaries to be reduced.
+        max_tokens (int): Token budget per chunk.
+        count_tokens (Callable[[str], int]): Token count of a string.
+
+    Returns:
+        List[str]: The chunks, entries joined by newlines.
+    """
+    pieces: List[Tuple[str, int]] = []
+    for entry in entries:
+        tokens = count_tokens(entry)
+        if tokens <= max_tokens:
+            pieces.append((entry, tokens))
+            continue
+        piece, piece_tokens = [], 0
+        for word in entry.split():
+            word_tokens = count_tokens(word) + 1
+            if piece and piece_tokens + word_tokens > max_tokens:
+                pieces.append((" ".join(piece), piece_tokens))
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            pieces.append((" ".join(piece), piece_tokens))
+
+    chunks: List[str] = []
+    current, current_tokens = [], 0
+    for piece, tokens in pieces:
+        # +1 for the newline joining it to the previous entry
+        if current and current_tokens + tokens + 1 > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _phi3_generate(phi_pipe, prompt: str, max_new_tokens: int, temperature: float, do_sample: bool) -> str:
+    import torch
+
     generation_args = {
         "max_new_tokens": max_new_tokens,
         "return_full_text": False,
         "temperature": temperature,
         "do_sample": do_sample
     }
-
-    output = phi_pipe(prompt, **generation_args)
+    with _phi3_generation_lock:
+        torch.manual_seed(0)  # reproducibility
+        output = phi_pipe(prompt, **generation_args)
     generated_text = output[0]["generated_text"]
+    analysis_stats.record(generations=1, tokens=_count_tokens(phi_pipe.tokenizer, generated_text),
+                          prompt_tokens=_count_tokens(phi_pipe.tokenizer, prompt))
+    return generated_text
 
+def _parse_analysis(generated_text: str) -> dict:
     # Attempt to parse JSON safely
     try:
         json_start = generated_text.index("{")
@@ -204,3 +647,106 @@ Rules:
     except Exception as e:
         # Fallback if parsing fails
         return {"error": f"Failed to parse JSON: {e}", "raw_output": generated_text}
+
+def generate_privacy_analysis(comment_history: str,
+                              model_name: str = PHI3_MODEL_NAME,
+                              device: Optional[str] = None,
+                              max_new_tokens: int = 300,
+                              temperature: float = 0.2,
+                              do_sample: bool = True) -> dict:
+    """
+    Generate a structured privacy analysis JSON from a chunk of comment history using Phi-3.
+
+    Args:
+        comment_history (str): Comments with reasoning/suggestions for improving privacy.
+        model_name (str): Phi-3 model identifier.
+        device (Optional[str]): 'cpu', 'cuda' or 'mps'. Defaults to PRIVIFY_PHI3_DEVICE, then autodetection.
+        max_new_tokens (int): Max tokens to generate.
+        temperature (float): Sampling temperature.
+        do_sample (bool): Whether to use sampling.
+
+    Returns:
+        dict: Structured JSON with overall_summary, pattern, key_findings, suggestions.
+    """
+    analysis_stats.record(requests=1)
+    # Loaded once and kept resident (see get_phi3_pipeline), and never unloaded mid-generation
+    with _phi3_model(model_name, device).use() as phi_pipe:
+        generated_text = _phi3_generate(phi_pipe, _analysis_prompt(comment_history), max_new_tokens, temperature, do_sample)
+    return _parse_analysis(generated_text)
+
+def _cached_generation(phi_pipe, kind: str, text: str, prompt: str, model_name: str,
+                       max_new_tokens: int, temperature: float, do_sample: bool):
+    key = summary_key(text, kind, model_name)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+    generated_text = _phi3_generate(phi_pipe, prompt, max_new_tokens, temperature, do_sample)
+    if kind == "chunk_summary":
+        result = generated_text.strip()
+    else:
+        result = _parse_analysis(generated_text)
+        if "error" in result:
+            return result  # Not cached, the next call tries again
+    summary_cache.put(key, result)
+    return result
+
+def generate_incremental_privacy_analysis(comment_history: str,
+                                          model_name: str = PHI3_MODEL_NAME,
+                                          device: Optional[str] = None,
+                                          chunk_tokens: int = PRIVACY_CHUNK_TOKENS,
+                                          max_new_tokens: int = 300,
+                                          temperature: float = 0.2,
+                                          do_sample: bool = True) -> dict:
+    """
+    Privacy analysis of an arbitrarily long comment history, reusing earlier work.
+
+    The history lines are grouped into chunks of at most `chunk_tokens` tokens
+    (see chunk_history). A history that fits in one chunk is analysed directly.
+    Otherwise each chunk is summarized, and the analysis is generated from the
+    summaries, which are first summarized again in groups while they do not fit
+    in one chunk. Summaries and analyses are cached by content hash in
+    `summary_cache`, so after comments are appended only the last chunk, the new
+    chunks and the final analysis are generated.
+
+    Args:
+        comment_history (str): Comments with reasoning/suggestions, one or more lines per comment.
+        model_name (str): Phi-3 model identifier.
+        device (Optional[str]): 'cpu', 'cuda' or 'mps'. Defaults to PRIVIFY_PHI3_DEVICE, then autodetection.
+        chunk_tokens (int): Token budget per chunk.
+        max_new_tokens (int): Max tokens to generate for the analysis.
+        temperature (float): Sampling temperature.
+        do_sample (bool): Whether to use sampling.
+
+    Returns:
+        dict: Structured JSON with overall_summary, pattern, key_findings, suggestions.
+    """
+    analysis_stats.record(requests=1)
+    with _phi3_model(model_name, device).use() as phi_pipe:
+        count_tokens = lambda text: _count_tokens(phi_pipe.tokenizer, text)
+
+        entries = [line.strip() for line in comment_history.splitlines() if line.strip()]
+        chunks = chunk_history(entries, chunk_tokens, count_tokens)
+        if len(chunks) <= 1:
+            history = chunks[0] if chunks else ""
+            return _cached_generation(phi_pipe, "analysis", history, _analysis_prompt(history), model_name,
+                                      max_new_tokens, temperature, do_sample)
+
+        summaries = [
+            _cached_generation(phi_pipe, "chunk_summary", chunk, _summary_prompt(chunk), model_name,
+                               PRIVACY_SUMMARY_MAX_NEW_TOKENS, temperature, do_sample)
+            for chunk in chunks
+        ]
+        # Very long histories: summarize the summaries until they fit in one prompt
+        while True:
+            groups = chunk_history(summaries, chunk_tokens, count_tokens)
+            if len(groups) <= 1 or len(groups) == len(summaries):
+                break
+            summaries = [
+                _cached_generation(phi_pipe, "chunk_summary", group, _summary_prompt(group), model_name,
+                                   PRIVACY_SUMMARY_MAX_NEW_TOKENS, temperature, do_sample)
+                for group in groups
+            ]
+
+        notes = "\n\n".join(summaries)
+        return _cached_generation(phi_pipe, "reduce", notes, _reduce_prompt(notes), model_name,
+                                  max_new_tokens, temperature, do_sample)
@@ -0,0 +1,98 @@
+import os
+from typing import Any, Optional, Tuple
+
+from tracing import get_logger
+
+logger = get_logger("llm_backends")
+
+# "torch" keeps the model in its checkpoint dtype on the selected device,
+# "torch-int8" quantizes every nn.Linear to int8 with dynamic activation
+# quantization (CPU only), "onnx" runs an export from export_llm.py on ONNX
+# Runtime with the KV cache (CPU only, needs the optional `optimum` package)
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+# Where export_llm.py writes, and the onnx backend reads, one directory per model
+ONNX_DIR = os.environ.get("PRIVIFY_ONNX_DIR", "./onnx_models")
+
+
+def onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, model_name.replace("/", "--"))
+
+
+def import_ort_model():
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError as e:
+        raise ImportError(
+            "The onnx LLM backend needs optimum: pip install 'optimum[onnxruntime]==1.16.2'"
+        ) from e
+    return ORTModelForCausalLM
+
+
+def quantize_linear_int8(model):
+    """
+    Replace every nn.Linear of `model` with a dynamically quantized int8 Linear, in place.
+
+    Layers are converted one at a time, so a bfloat16 checkpoint never exists
+    as a whole in float32. The remaining weights (embeddings, norms) are cast
+    to float32, which the quantized layers take as input and return.
+    """
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+    from torch.ao.quantization import default_dynamic_qconfig
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child) is torch.nn.Linear:
+                child = child.float()
+                child.qconfig = default_dynamic_qconfig
+                setattr(parent, name, DynamicQuantizedLinear.from_float(child))
+    return model.float().eval()
+
+
+def load_causal_lm(model_name: str, backend: str = "torch", device: Optional[str] = None,
+                   torch_dtype: Any = "auto", trust_remote_code: bool = False) -> Tuple[Any, Any]:
+    """
+    Load a causal language model and its tokenizer for the given inference backend.
+
+    Args:
+        model_name (str): Hugging Face model identifier.
+        backend (str): One of BACKENDS.
+        device (Optional[str]): device_map for the torch backend; the other backends run on CPU.
+        torch_dtype: Weight dtype for the torch backend.
+        trust_remote_code (bool): Allow the model's own modeling code (Phi-3).
+
+    Returns:
+        Tuple[model, tokenizer]: Ready for a transformers text-generation pipeline.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {backend!r}, expected one of: {', '.join(BACKENDS)}")
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if backend == "onnx":
+        ORTModelForCausalLM = import_ort_model()
+        path = onnx_model_dir(model_name)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No ONNX export of {model_name} in {path}, run `python export_llm.py` first")
+        model = ORTModelForCausalLM.from_pretrained(path, use_cache=True, provider="CPUExecutionProvider")
+        return model, AutoTokenizer.from_pretrained(path)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=trust_remote_code)
+    if backend == "torch-int8":
+        if device not in (None, "auto", "cpu"):
+            logger.warning("The torch-int8 backend runs on CPU, ignoring device %s", device)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch_dtype, low_cpu_mem_usage=True, trust_remote_code=trust_remote_code
+        )
+        return quantize_linear_int8(model), tokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name, torch_dtype=torch_dtype, device_map=device, trust_remote_code=trust_remote_code
+    )
+    return model, tokenizer
+
+
+def text_generation_pipeline(model, tokenizer):
+    from transformers import pipeline
+
+    return pipeline("text-generation", model=model, tokenizer=tokenizer)
@@ -0,0 +1,114 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from tracing import get_logger
+
+logger = get_logger("model_manager")
+
+
+def default_device() -> str:
+    """Pick the best available torch device: cuda, then mps, then cpu."""
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+class LazyModel:
+    """
+    Loads a model on first use and keeps it resident.
+
+    With `idle_timeout` set, the model is dropped after that many seconds
+    without use to free memory, and reloaded on the next use. Generations
+    should run inside `use()`, which keeps the model loaded until the block
+    exits; otherwise a caller still holding the model keeps it in memory after
+    an unload, and the next `get()` loads a second copy.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], idle_timeout: Optional[float] = None):
+        self.name = name
+        self._loader = loader
+        self.idle_timeout = idle_timeout
+        self._model = None
+        self._lock = threading.Lock()
+        self._last_used = 0.0
+        self._in_use = 0
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self) -> Any:
+        """Return the model, loading it first if needed."""
+        with self._lock:
+            return self._get()
+
+    @contextmanager
+    def use(self) -> Iterator[Any]:
+        """Like `get()`, and the idle timeout does not unload the model before the block exits."""
+        with self._lock:
+            model = self._get()
+            self._in_use += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self._last_used = time.monotonic()
+
+    def _get(self) -> Any:
+        if self._model is None:
+            logger.info("Loading %s...", self.name)
+            start = time.perf_counter()
+            self._model = self._loader()
+            logger.info("Loaded %s in %.1fs", self.name, time.perf_counter() - start)
+        self._last_used = time.monotonic()
+        self._schedule_idle_check(self.idle_timeout)
+        return self._model
+
+    def unload(self) -> None:
+        with self._lock:
+            self._unload()
+
+    def _unload(self) -> None:
+        if self._model is None:
+            return
+        self._model = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logger.info("Unloaded %s", self.name)
+
+    def _schedule_idle_check(self, delay: Optional[float]) -> None:
+        if not self.idle_timeout or self._timer is not None:
+            return
+        self._timer = threading.Timer(delay, self._check_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _check_idle(self) -> None:
+        with self._lock:
+            self._timer = None
+            idle = time.monotonic() - self._last_used
+            if self._in_use:
+                self._schedule_idle_check(self.idle_timeout)
+            elif idle >= self.idle_timeout:
+                self._unload()
+            elif self._model is not None:
+                self._schedule_idle_check(self.idle_timeout - idle)
@@ -0,0 +1,150 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Tuple, Union
+
+from concrete import fhe
+from concrete.ml.deployment import FHEModelServer
+
+from tracing import get_logger
+
+logger = get_logger("model_registry")
+
+SERVER_ZIP = "server.zip"
+
+
+class ModelNotReadyError(RuntimeError):
+    """Raised when a model is requested before the registry finished loading it."""
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded FHEModelServer instances.
+
+    Loading a server unzips `server.zip` and compiles the circuit, which takes
+    seconds, so it is done once at startup and the loaded servers are shared by
+    every request. `reload_if_changed` reloads a model when its `server.zip`
+    changes on disk; the new servers are swapped in with a single reference
+    assignment so in-flight requests keep using the generation they started with.
+
+    Models listed in `optional` are loaded only if their artifacts exist (and
+    picked up by `reload_if_changed` once they appear); readiness does not wait
+    for them.
+    """
+
+    def __init__(self, model_dirs: Dict[str, str], optional: Iterable[str] = ()):
+        self.model_dirs = dict(model_dirs)
+        self.optional = set(optional)
+        self._servers: Dict[str, FHEModelServer] = {}
+        self._fingerprints: Dict[str, Tuple[int, int]] = {}
+        self._load_lock = threading.Lock()
+
+    @property
+    def required(self) -> set:
+        return set(self.model_dirs) - self.optional
+
+    @property
+    def ready(self) -> bool:
+        return self.required <= set(self._servers)
+
+    @property
+    def loaded(self) -> List[str]:
+        return sorted(self._servers)
+
+    @staticmethod
+    def _fingerprint(path_dir: str) -> Tuple[int, int]:
+        stat = os.stat(os.path.join(path_dir, SERVER_ZIP))
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _load(path_dir: str) -> FHEModelServer:
+        server = FHEModelServer(path_dir=path_dir)
+        server.load()
+        return server
+
+    def load_all(self) -> None:
+        """Load every registered model, replacing whatever is currently loaded."""
+        with self._load_lock:
+            servers, fingerprints = {}, {}
+            for name, path_dir in self.model_dirs.items():
+                if name in self.optional and not os.path.exists(os.path.join(path_dir, SERVER_ZIP)):
+                    continue
+                fingerprints[name] = self._fingerprint(path_dir)
+                servers[name] = self._load(path_dir)
+                logger.info("Loaded FHE model '%s' from %s", name, path_dir)
+            self._servers, self._fingerprints = servers, fingerprints
+
+    def reload_if_changed(self) -> List[str]:
+        """
+        Reload the models whose `server.zip` changed since they were loaded.
+
+        Returns:
+            List[str]: Names of the models that were reloaded.
+        """
+        with self._load_lock:
+            changed = []
+            for name, path_dir in self.model_dirs.items():
+                try:
+                    fingerprint = self._fingerprint(path_dir)
+                except FileNotFoundError:
+                    continue  # Artifacts are being rewritten, keep serving the old ones
+                if fingerprint != self._fingerprints.get(name):
+                    changed.append((name, path_dir, fingerprint))
+
+            if not changed:
+                return []
+
+            servers, fingerprints = dict(self._servers), dict(self._fingerprints)
+            for name, path_dir, fingerprint in changed:
+                servers[name] = self._load(path_dir)
+                fingerprints[name] = fingerprint
+                logger.info("Reloaded FHE model '%s' from %s", name, path_dir)
+            self._servers, self._fingerprints = servers, fingerprints
+            return [name for name, _, _ in changed]
+
+    def snapshot(self) -> Dict[str, FHEModelServer]:
+        """
+        Return the currently loaded servers as one consistent generation.
+
+        Raises:
+            ModelNotReadyError: If the models have not finished loading yet.
+        """
+        servers = self._servers
+        missing = self.required - set(servers)
+        if missing:
+            raise ModelNotReadyError(f"FHE models not loaded yet: {', '.join(sorted(missing))}")
+        return servers
+
+    def get(self, name: str) -> FHEModelServer:
+        servers = self.snapshot()
+        if name not in servers:
+            raise ModelNotReadyError(f"FHE model not loaded: {name}")
+        return servers[name]
+
+
+def deserialize_evaluation_keys(serialized_keys: bytes) -> fhe.EvaluationKeys:
+    return fhe.EvaluationKeys.deserialize(serialized_keys)
+
+
+def run_with_keys(
+    server: FHEModelServer,
+    serialized_encrypted_quantized_data: Union[bytes, Tuple[bytes, ...]],
+    evaluation_keys: fhe.EvaluationKeys,
+) -> Union[bytes, Tuple[bytes, ...]]:
+    """
+    Same as `FHEModelServer.run` but with already deserialized evaluation keys.
+
+    Args:
+        server (FHEModelServer): A loaded model server.
+        serialized_encrypted_quantized_data: Serialized encrypted input(s).
+        evaluation_keys (fhe.EvaluationKeys): Deserialized evaluation keys.
+
+    Returns:
+        Serialized encrypted output(s).
+    """
+    if not isinstance(serialized_encrypted_quantized_data, tuple):
+        serialized_encrypted_quantized_data = (serialized_encrypted_quantized_data,)
+    inputs = tuple(fhe.Value.deserialize(data) for data in serialized_encrypted_quantized_data)
+    result = server.server.run(*inputs, evaluation_keys=evaluation_keys)
+    if isinstance(result, tuple):
+        return tuple(value.serialize() for value in result)
+    return result.serialize()
@@ -1,10 +1,80 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from language_models import safe_generate 
-from client_side import run_inference
+from typing import List, Optional
+from language_models import safe_generate_batch, stream_safe_generate, generate_privacy_analysis, generate_incremental_privacy_analysis, warm_up, cached_response, response_cache, summary_cache, generation_stats, analysis_stats, LLM_BATCH_SIZE
+from client_side import run_inference_async, load_clients, rotate_keys, aclose_http_clients
+from generation_worker import GenerationWorker
+from tracing import METRICS_CONTENT_TYPE, configure_logging, get_logger, instrument_request, render_metrics, span
+from prefilter import Prefilter
 import json
+import numpy as np
 
-app = FastAPI()
+configure_logging()
+logger = get_logger("on_device_server")
+
+# Also load TinyLlama in the background at startup instead of on the first /process
+WARMUP_LLM = os.environ.get("PRIVIFY_WARMUP_LLM", "0") == "1"
+
+# Concurrent /process requests are generated together: a batch closes at
+# PRIVIFY_LLM_BATCH_SIZE requests or after PRIVIFY_LLM_MAX_WAIT_MS
+LLM_MAX_WAIT_MS = float(os.environ.get("PRIVIFY_LLM_MAX_WAIT_MS", "20"))
+
+def generate_batch(rows):
+    return safe_generate_batch(rows, batch_size=len(rows))
+
+generation_worker = GenerationWorker(generate_batch, max_batch_size=LLM_BATCH_SIZE, max_wait_ms=LLM_MAX_WAIT_MS)
+
+# Skip FHE and the LLM for comments without any privacy cue. The threshold keeps
+# PRIVIFY_PREFILTER_RECALL of the labelled comments in comments.csv
+PREFILTER_ENABLED = os.environ.get("PRIVIFY_PREFILTER", "0") == "1"
+PREFILTER_RECALL = float(os.environ.get("PRIVIFY_PREFILTER_RECALL", "0.98"))
+prefilter = Prefilter.from_csv("comments.csv", target_recall=PREFILTER_RECALL) if PREFILTER_ENABLED else None
+
+# Analyse comment histories in cached chunks (see generate_incremental_privacy_analysis)
+# unless a request asks for the single-prompt analysis
+PRIVACY_ANALYSIS_INCREMENTAL = os.environ.get("PRIVIFY_PRIVACY_ANALYSIS_INCREMENTAL", "1") == "1"
+
+def skip_analysis(comment: str) -> bool:
+    return prefilter is not None and not prefilter.needs_analysis(comment)
+
+async def warm_up_models():
+    try:
+        # Load the FHE keys from the key store (or generate them) before the first comment
+        await asyncio.to_thread(load_clients)
+        if WARMUP_LLM:
+            await asyncio.to_thread(warm_up)
+    except Exception as e:
+        logger.warning("Warm-up failed, models will load on first use. Reason: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in the background so the server starts accepting requests right away;
+    # requests arriving before it finishes wait for the same loads
+    warm_up_task = asyncio.create_task(warm_up_models())
+    generation_worker.start()
+    yield
+    warm_up_task.cancel()
+    await generation_worker.stop()
+    await aclose_http_clients()
+    response_cache.close()
+    summary_cache.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    # Request IDs (forwarded to the TikTok server), /metrics and per-stage
+    # timings in the Server-Timing header, see benchmarks/bench_pipeline.py
+    return await instrument_request("on_device_server", request, call_next)
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 SERVER_LINK = "http://example.com/endpoint"
 num_categories = 3
@@ -24,42 +94,98 @@ class CommentRequest(BaseModel):
 
 @app.post("/process")
 async def process_comment(req: CommentRequest):
-    print("--------------------------------------------------")
-    print("Step 1) Receiving comment")
-    print(f"Received comment: {req.comment}")
-    print("--------------------------------------------------")
+    # Never log the comment itself, or anything derived from it
+    if skip_analysis(req.comment):
+        logger.debug("Skipped by the prefilter")
+        return {"response": None, "skipped": True}
 
-    print("Step 2) Running FHE inference to get category and risk scores")
-    category, risk_score = run_inference(req.comment)
-    print(f"Inference complete -> Category: {category}, Risk Score: {risk_score}")
-    print("--------------------------------------------------")
+    category, risk_score = await run_inference_async(req.comment)
+    logger.debug("FHE inference done")
 
-    print("Step 7) Generating SLM output")
-    llm_output = safe_generate(req.comment, category, risk_score)
-    print("LLM generation done.")
-    print("--------------------------------------------------")
+    # Repeated comments (spam, copy-paste variants) skip the LLM entirely
+    # A memory miss reads the SQLite cache, which stays off the event loop
+    llm_output = await asyncio.to_thread(cached_response, req.comment, category, risk_score)
+    if llm_output is not None:
+        logger.debug("Using cached explanation")
+        return {"response": llm_output}
 
-    print("Step 8) Output generated and sending reply")
-    print(f"Reply: {llm_output}")
-    print("--------------------------------------------------")
+    with span("generate"):
+        llm_output = await generation_worker.submit((req.comment, category, risk_score))
+    logger.debug("Explanation generated")
 
     return {"response": llm_output}
 
+@app.post("/process/stream")
+async def process_comment_stream(req: CommentRequest):
+    """
+    Streaming variant of /process as newline-delimited JSON: a "verdict" event
+    with the category and risk score as soon as FHE inference is done, "token"
+    events while the explanation is generated, then a "done" event with the
+    reason and suggestion. Comments skipped by the prefilter get a single
+    "skipped" event.
+    """
+    if skip_analysis(req.comment):
+        skipped = json.dumps({"event": "skipped"}) + "\n"
+        return StreamingResponse(iter([skipped]), media_type="application/x-ndjson")
+
+    category, risk_score = await run_inference_async(req.comment)
+    risk_score = int(np.asarray(risk_score).item())
+
+    async def events():
+        yield json.dumps({"event": "verdict", "category": category, "risk_score": risk_score}) + "\n"
+        stop = threading.Event()
+        stream = stream_safe_generate(req.comment, category, risk_score, stop=stop)
+        try:
+            while True:
+                event = await asyncio.to_thread(next, stream, None)
+                if event is None:
+                    break
+                kind, value = event
+                if kind == "token":
+                    yield json.dumps({"event": "token", "text": value}) + "\n"
+                else:
+                    yield json.dumps({"event": "done", "response": value}) + "\n"
+        finally:
+            # Client went away or the stream ended: stop generating
+            stop.set()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/prefilter/stats")
+async def prefilter_stats():
+    return prefilter.stats() if prefilter is not None else {"enabled": False}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return {
+        **generation_stats.snapshot(),
+        "worker": generation_worker.stats(),
+        "privacy_analysis": {**analysis_stats.snapshot(), "cache": summary_cache.stats()},
+    }
+
+class KeyRotationRequest(BaseModel):
+    models: Optional[List[str]] = None  # defaults to every loaded model
+
+@app.post("/keys/rotate")
+async def rotate_fhe_keys(req: KeyRotationRequest):
+    await asyncio.to_thread(rotate_keys, req.models)
+    return {"rotated": True}
+
 class CommentHistoryRequest(BaseModel):
-    comment_history: str  # chunk of comment history with reasoning/suggestions
+    comment_history: str  # comment history with reasoning/suggestions, one or more lines per comment
+    incremental: Optional[bool] = None  # defaults to PRIVIFY_PRIVACY_ANALYSIS_INCREMENTAL
 
 @app.post("/privacy_analysis")
 async def privacy_analysis(req: CommentHistoryRequest):
-    print("--------------------------------------------------")
-    print("Step 1) Receiving comment history for privacy analysis")
-    print(f"Received comment history:\n{req.comment_history}")
-    print("--------------------------------------------------")
-
-    print("Step 2) Generating privacy analysis using Phi-3")
-    analysis_result = generate_privacy_analysis(req.comment_history)
-    print("Privacy analysis generation done.")
-    print("--------------------------------------------------")
-    print(f"Result:\n{json.dumps(analysis_result, indent=2)}")
-    print("--------------------------------------------------")
-
-    return {"privacy_analysis": analysis_result}
\ No newline at end of file
+    # Never log the comment history or the analysis, both reveal it
+    incremental = PRIVACY_ANALYSIS_INCREMENTAL if req.incremental is None else req.incremental
+    analyse = generate_incremental_privacy_analysis if incremental else generate_privacy_analysis
+    with span("generate"):
+        analysis_result = await asyncio.to_thread(analyse, req.comment_history)
+    logger.debug("Privacy analysis generated")
+
+    return {"privacy_analysis": analysis_result}
@@ -0,0 +1,141 @@
+"""
+Cheap on-device triage: decide whether a comment needs the full FHE + LLM analysis.
+
+The filter is a weighted cue lexicon learned from the labelled comments in
+comments.csv (every row there is a privacy leak) plus a few regular expressions
+for handles, emails, phone numbers, times and street numbers. A comment's score
+is the summed weight of the distinct cues it contains; comments scoring below
+the threshold carry no privacy signal and are skipped. The threshold is chosen
+so that a target fraction of the labelled comments (the recall) still passes.
+"""
+import csv
+import json
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# Chatty filler that appears in leaking and harmless comments alike, never a cue
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be been but by can could did do does doing
+for from had has have he her here hers him his how i if in into is it its just me more most no
+not of off on once only or other our out over own same she should so some such than that the their
+them then there these they this those through to too under until up very was we were what when
+where which while who why will with would you your yours u ur ya yeah yes lol lmao omg haha hahaha
+wow so cute love like pretty nice cool fire vibe vibes literally fr tho though lowkey highkey
+same really totally im i'm it's that's you're same wait look looks looking got get just one
+still see saw right old new last used back good great thing things always never ever
+""".split())
+
+TOKEN = re.compile(r"[a-z0-9@#][a-z0-9@#._'’-]*")
+
+# Structural cues that do not need to appear in the training data verbatim
+PATTERNS = {
+    "handle": re.compile(r"(?<![\w.])@[a-z0-9_.]{2,}"),
+    "email": re.compile(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}"),
+    "url": re.compile(r"(?:https?://|www\.|t\.me/|wa\.me/)\S+"),
+    "phone": re.compile(r"\d{3}[-. )]*\d{3}[-. ]*\d{4}|\d{3}[-.]\d{4}"),
+    "time": re.compile(r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\b\d{1,2}:\d{2}\b"),
+    "street_number": re.compile(r"\b\d+(?:st|nd|rd|th)\b"),
+}
+
+
+def tokens(comment: str) -> List[str]:
+    """Lowercased word tokens with a crude plural folding, stopwords removed."""
+    result = []
+    for token in TOKEN.findall(comment.lower()):
+        token = token.strip("._'’-")
+        if not token or token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        result.append(token)
+    return result
+
+
+def pattern_cues(comment: str) -> List[str]:
+    lowered = comment.lower()
+    return [name for name, pattern in PATTERNS.items() if pattern.search(lowered)]
+
+
+class Prefilter:
+    """
+    Scores comments by the privacy cues they contain and skips those below `threshold`.
+
+    Build one with `Prefilter.fit(comments)` or `Prefilter.from_csv(path)`;
+    `needs_analysis(comment)` is the decision, `stats()` the skip counters.
+    """
+
+    def __init__(self, weights: Dict[str, float], pattern_weight: float, threshold: float):
+        self.weights = weights
+        self.pattern_weight = pattern_weight
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    @classmethod
+    def fit(cls, comments: Iterable[str], target_recall: float = 0.98, min_df: int = 2) -> "Prefilter":
+        """
+        Learn cue weights from comments that all leak private information.
+
+        A token seen in at least `min_df` comments becomes a cue weighted
+        log(1 + document frequency). The threshold is the highest score that
+        still lets `target_recall` of the training comments through.
+        """
+        comments = list(comments)
+        document_frequency: Dict[str, int] = {}
+        for comment in comments:
+            for token in set(tokens(comment)):
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        weights = {token: math.log1p(df) for token, df in document_frequency.items() if df >= min_df}
+        pattern_weight = max(weights.values(), default=1.0)
+
+        prefilter = cls(weights, pattern_weight, threshold=0.0)
+        scores = sorted(prefilter.score(comment) for comment in comments)
+        if scores:
+            # Keep the top `target_recall` share of the training scores above the threshold
+            index = min(len(scores) - 1, int(math.floor((1.0 - target_recall) * len(scores))))
+            prefilter.threshold = scores[index]
+        return prefilter
+
+    @classmethod
+    def from_csv(cls, path: str = "comments.csv", target_recall: float = 0.98, min_df: int = 2) -> "Prefilter":
+        """Fit on the `comment` column of a labelled CSV such as comments.csv."""
+        with open(path, newline="", encoding="utf-8") as f:
+            comments = [row["comment"] for row in csv.DictReader(f)]
+        return cls.fit(comments, target_recall=target_recall, min_df=min_df)
+
+    def score(self, comment: str) -> float:
+        score = sum(self.weights.get(token, 0.0) for token in set(tokens(comment)))
+        return score + self.pattern_weight * len(pattern_cues(comment))
+
+    def needs_analysis(self, comment: str) -> bool:
+        """True when the comment should go through FHE inference and the LLM."""
+        # An empty training set gives threshold 0, which skips only cue-free comments
+        score = self.score(comment)
+        needed = score > 0 and score >= self.threshold
+        with self._lock:
+            self.checked += 1
+            if not needed:
+                self.skipped += 1
+        return needed
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_fraction": self.skipped / self.checked if self.checked else 0.0,
+            "threshold": self.threshold,
+            "cues": len(self.weights),
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"weights": self.weights, "pattern_weight": self.pattern_weight, "threshold": self.threshold}, f)
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "Prefilter":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["weights"], data["pattern_weight"], data["threshold"] if threshold is None else threshold)
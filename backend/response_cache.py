@@ -0,0 +1,113 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils import normalize_comment
+
+
+def moderation_key(comment: str, category: str, score: int) -> str:
+    """
+    Cache key for a moderation explanation.
+
+    Args:
+        comment (str): The social media comment, normalized with utils.normalize_comment.
+        category (str): The violation type.
+        score (int): The risk score.
+
+    Returns:
+        str: Hex digest shared by comments that only differ in case or whitespace.
+    """
+    payload = json.dumps([normalize_comment(comment), category, int(score)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def summary_key(text: str, kind: str, model_name: str) -> str:
+    """
+    Cache key for a Phi-3 summary or analysis of some text.
+
+    Args:
+        text (str): The comment history chunk or joined summaries, used verbatim.
+        kind (str): What was generated from it, e.g. "chunk_summary" or "analysis".
+        model_name (str): The model that generated it.
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    payload = json.dumps([kind, model_name, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed LRU cache of JSON-serializable LLM results.
+
+    Holds up to `max_entries` results in memory. With `path` set, every result is
+    also written to `table` in a SQLite file, which serves memory misses and
+    survives restarts; the table keeps the `max_disk_entries` most recently
+    written results. Lookups that miss memory read the file, so callers on an
+    event loop should call `get` and `put` from a thread.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None,
+                 max_disk_entries: int = 100_000, table: str = "responses"):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._table = table
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(f"SELECT value FROM {self._table} WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Callers may modify the result, so never hand out the cached object
+            return json.loads(json.dumps(value))
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                # REPLACE gives the row a new, highest rowid, so rowids follow write order
+                rowid = self._db.execute(f"INSERT OR REPLACE INTO {self._table} (key, value) VALUES (?, ?)",
+                                         (key, json.dumps(value))).lastrowid
+                self._db.execute(f"DELETE FROM {self._table} WHERE rowid <= ?", (rowid - self.max_disk_entries,))
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,246 @@
+"""
+Scan a CSV of comments through the whole pipeline: featurize and encrypt, FHE
+inference on the TikTok server, decrypt, and explanations for risky comments.
+
+The input is read in batches of --batch-size rows and never held in memory as
+a whole. Each stage runs in its own thread(s), connected by bounded queues, so
+encryption, FHE requests, decryption and generation of different batches
+overlap. Explanations are generated only for rows with a risk score of at
+least --threshold.
+
+Results are appended to the output CSV in input order: the input columns plus
+category, score, reason and suggestion (existing columns of those names are
+overwritten). After each batch the output is flushed and a checkpoint
+(<output>.checkpoint.json) records the rows done and the output size. Rerunning
+the same command after a crash truncates the output to the checkpoint and
+resumes from the next row:
+
+    python scan_csv.py comments_export.csv scanned.csv
+    python scan_csv.py comments_export.csv scanned.csv --threshold 7 --fhe-workers 4
+    python scan_csv.py comments_export.csv scanned.csv --no-explain --restart
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from utils import process_comments
+
+_DONE = object()
+
+
+class Batch:
+    def __init__(self, seq, rows):
+        self.seq = seq
+        self.rows = rows  # input DataFrame chunk
+        self.inputs = None
+        self.results = None
+        self.categories = None
+        self.scores = None
+        self.explanations = None
+
+
+class Pipeline:
+    """Threads connected by bounded queues; the first error stops the run."""
+
+    def __init__(self, queue_depth):
+        self.queue_depth = queue_depth
+        self.error = None
+        self.busy = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def queue(self):
+        return queue.Queue(maxsize=self.queue_depth)
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        yield
+        with self._lock:
+            self.busy[stage] += time.perf_counter() - start
+
+    def stage(self, name, fn, inbox, outbox, workers=1):
+        """Run `fn(batch)` on every batch from `inbox` in `workers` threads and pass it on to `outbox`."""
+        remaining = [workers]
+
+        def work():
+            try:
+                while True:
+                    batch = inbox.get()
+                    if batch is _DONE:
+                        inbox.put(_DONE)  # for the sibling workers
+                        break
+                    with self.timed(name):
+                        fn(batch)
+                    outbox.put(batch)
+                with self._lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+            except BaseException as e:
+                self.error = e
+
+        for i in range(workers):
+            threading.Thread(target=work, name=f"scan-{name}-{i}", daemon=True).start()
+
+
+def load_checkpoint(path, output_csv, expected, restart):
+    if restart or not os.path.exists(path):
+        return {**expected, "rows_done": 0, "output_bytes": 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    mismatched = [key for key, value in expected.items() if checkpoint.get(key) != value]
+    if mismatched:
+        raise SystemExit(f"{path} was written with a different {', '.join(mismatched)}; use --restart to start over")
+    output_bytes = os.path.getsize(output_csv) if os.path.exists(output_csv) else 0
+    if output_bytes < checkpoint["output_bytes"]:
+        raise SystemExit(f"{output_csv} is missing rows recorded in {path}; use --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_csv")
+    parser.add_argument("output_csv")
+    parser.add_argument("--column", default="comment", help="Column holding the comment text")
+    parser.add_argument("--batch-size", type=int, default=32, help="Rows per FHE request")
+    parser.add_argument("--threshold", type=int, default=5, help="Explain rows with at least this risk score")
+    parser.add_argument("--no-explain", action="store_true", help="Only classify and score")
+    parser.add_argument("--encrypt-workers", type=int, default=1)
+    parser.add_argument("--fhe-workers", type=int, default=2, help="Batches in flight to the FHE server")
+    parser.add_argument("--llm-batch-size", type=int, default=None, help="Defaults to PRIVIFY_LLM_BATCH_SIZE")
+    parser.add_argument("--queue-depth", type=int, default=4, help="Batches buffered between stages")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    from client_side import (LAYOUTS, MODEL_LAYOUT, call_fhe_server_models, decrypt_outputs, encrypt_features,
+                             get_client, get_serialized_evaluation_keys)
+
+    checkpoint_path = f"{args.output_csv}.checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path, args.output_csv, {
+        "input": os.path.abspath(args.input_csv),
+        "column": args.column,
+        "layout": MODEL_LAYOUT,
+        "threshold": None if args.no_explain else args.threshold,
+    }, args.restart)
+    rows_done = checkpoint["rows_done"]
+    if rows_done:
+        print(f"Resuming after row {rows_done}")
+
+    names = LAYOUTS[MODEL_LAYOUT]
+    clients = {name: get_client(name) for name in names}
+    keys = {name: get_serialized_evaluation_keys(name, client) for name, client in clients.items()}
+
+    def encrypt(batch):
+        features = process_comments(batch.rows[args.column].astype(str).tolist())
+        batch.inputs = {name: [encrypt_features(x, client) for x in features] for name, client in clients.items()}
+
+    def run_fhe(batch):
+        batch.results = call_fhe_server_models(batch.inputs, keys)
+        batch.inputs = None
+
+    def decrypt(batch):
+        outputs = [decrypt_outputs(clients, {name: results[i] for name, results in batch.results.items()})
+                   for i in range(len(batch.rows))]
+        batch.categories = [category for category, _ in outputs]
+        batch.scores = [int(np.asarray(score).item()) for _, score in outputs]
+        batch.results = None
+
+    def explain(batch):
+        from language_models import LLM_BATCH_SIZE, safe_generate_batch
+
+        risky = [i for i, score in enumerate(batch.scores) if score >= args.threshold]
+        batch.explanations = {}
+        if risky:
+            comments = batch.rows[args.column].astype(str).tolist()
+            rows = [(comments[i], batch.categories[i], batch.scores[i]) for i in risky]
+            results = safe_generate_batch(rows, batch_size=args.llm_batch_size or LLM_BATCH_SIZE)
+            batch.explanations = dict(zip(risky, results))
+
+    pipeline = Pipeline(args.queue_depth)
+    encrypt_queue, fhe_queue, decrypt_queue = pipeline.queue(), pipeline.queue(), pipeline.queue()
+    explain_queue, write_queue = pipeline.queue(), pipeline.queue()
+    pipeline.stage("encrypt", encrypt, encrypt_queue, fhe_queue, workers=args.encrypt_workers)
+    pipeline.stage("fhe", run_fhe, fhe_queue, decrypt_queue, workers=args.fhe_workers)
+    if args.no_explain:
+        pipeline.stage("decrypt", decrypt, decrypt_queue, write_queue)
+    else:
+        pipeline.stage("decrypt", decrypt, decrypt_queue, explain_queue)
+        pipeline.stage("explain", explain, explain_queue, write_queue)
+
+    def read():
+        try:
+            # Rows are skipped after parsing, since a quoted comment may span several lines
+            skip, seq = rows_done, 0
+            for rows in pd.read_csv(args.input_csv, chunksize=args.batch_size):
+                if skip >= len(rows):
+                    skip -= len(rows)
+                    continue
+                encrypt_queue.put(Batch(seq, rows.iloc[skip:]))
+                skip, seq = 0, seq + 1
+            encrypt_queue.put(_DONE)
+        except BaseException as e:
+            pipeline.error = e
+
+    threading.Thread(target=read, name="scan-read", daemon=True).start()
+
+    # Writes happen here, in input order; batches may finish out of order with several FHE workers
+    mode = "r+b" if os.path.exists(args.output_csv) and rows_done else "wb"
+    start, written = time.perf_counter(), 0
+    with open(args.output_csv, mode) as f:
+        f.truncate(checkpoint["output_bytes"])
+        f.seek(checkpoint["output_bytes"])
+        pending, next_seq = {}, 0
+        while pipeline.error is None:
+            try:
+                batch = write_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if batch is _DONE:
+                break
+            pending[batch.seq] = batch
+            while next_seq in pending:
+                batch = pending.pop(next_seq)
+                next_seq += 1
+                with pipeline.timed("write"):
+                    rows = batch.rows.copy()
+                    rows["category"] = batch.categories
+                    rows["score"] = batch.scores
+                    explanations = batch.explanations or {}
+                    rows["reason"] = [explanations.get(i, {}).get("reason", "") for i in range(len(rows))]
+                    rows["suggestion"] = [explanations.get(i, {}).get("suggestion", "") for i in range(len(rows))]
+                    f.write(rows.to_csv(header=checkpoint["output_bytes"] == 0, index=False).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    checkpoint["rows_done"] += len(rows)
+                    checkpoint["output_bytes"] = f.tell()
+                    save_checkpoint(checkpoint_path, checkpoint)
+                written += len(rows)
+                print(f"✅ Scanned rows {checkpoint['rows_done']} ({written / (time.perf_counter() - start):.2f} rows/sec)")
+
+    if pipeline.error is not None:
+        raise pipeline.error
+    elapsed = time.perf_counter() - start
+    print(f"✅ Done! Saved results to {args.output_csv} ({written} rows in {elapsed:.1f}s)")
+    print(f"{'stage':<10} {'busy s':>9}")
+    for name, seconds in pipeline.busy.items():
+        print(f"{name:<10} {seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import sys
+import types
+
+import pytest
+
+import client_side
+
+
+class FakeFHEModelClient:
+    """Stands in for concrete.ml's client: keys are derived from client.zip and a key generation counter."""
+
+    generated = 0
+
+    def __init__(self, path_dir, key_dir):
+        self.key_dir = key_dir
+        with open(os.path.join(path_dir, "client.zip"), "rb") as f:
+            self.circuit = f.read()
+
+    def generate_private_and_evaluation_keys(self, force=False):
+        FakeFHEModelClient.generated += 1
+        self.keys = self.circuit + b"/" + str(FakeFHEModelClient.generated).encode()
+
+    def get_serialized_evaluation_keys(self):
+        return self.keys
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    deployment = types.ModuleType("concrete.ml.deployment")
+    deployment.FHEModelClient = FakeFHEModelClient
+    monkeypatch.setitem(sys.modules, "concrete", types.ModuleType("concrete"))
+    monkeypatch.setitem(sys.modules, "concrete.ml", types.ModuleType("concrete.ml"))
+    monkeypatch.setitem(sys.modules, "concrete.ml.deployment", deployment)
+
+    path = tmp_path / "fhe_directory"
+    path.mkdir()
+    (path / "client.zip").write_bytes(b"circuit v1")
+    monkeypatch.setattr(client_side, "KEY_STORE_DIR", str(tmp_path / "keys"))
+    monkeypatch.setitem(client_side.MODEL_CLIENT_DIRS, "category", str(path))
+    for cache in ("_clients", "_serialized_keys", "_client_stats"):
+        monkeypatch.setattr(client_side, cache, {})
+    return path
+
+
+def rebuild(path, content):
+    (path / "client.zip").write_bytes(content)
+    # Make sure the mtime changes even on coarse-grained file systems
+    stat = os.stat(path / "client.zip")
+    os.utime(path / "client.zip", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_client_is_reloaded_when_client_zip_changes(model_dir):
+    old = client_side.get_client("category")
+    assert client_side.get_client("category") is old
+
+    rebuild(model_dir, b"circuit v2")
+    new = client_side.get_client("category")
+
+    assert new is not old
+    assert new.circuit == b"circuit v2"
+    assert client_side.get_serialized_evaluation_keys("category").startswith(b"circuit v2")
+    # The key store has one directory per client.zip, so keys of the old circuit are never reused
+    assert os.path.dirname(new.key_dir) == os.path.dirname(old.key_dir)
+    assert new.key_dir != old.key_dir
+    assert os.path.basename(new.key_dir) == client_side._client_fingerprint("category")
+
+
+def test_keys_match_the_client_the_caller_holds(model_dir):
+    old = client_side.get_client("category")
+    rebuild(model_dir, b"circuit v2")
+    client_side.get_client("category")
+
+    assert client_side.get_serialized_evaluation_keys("category", old) == old.keys
+
+
+def test_key_store_is_reused_for_identical_client_zip(model_dir):
+    first = client_side.get_client("category")
+    rebuild(model_dir, b"circuit v1")
+
+    assert client_side.get_client("category").key_dir == first.key_dir
@@ -0,0 +1,36 @@
+import httpx
+import pytest
+
+import client_side
+
+
+@pytest.fixture
+def json_only_server(monkeypatch):
+    """An FHE server without the binary endpoints; records the paths it is called on."""
+    calls = []
+
+    def handle(request):
+        calls.append(request.url.path)
+        if request.url.path == "/fhe/keys":
+            return httpx.Response(200, json={"key_id": "k1"})
+        if request.url.path == "/fhe/process_batch":
+            return httpx.Response(200, json={"encrypted_results": [client_side.bytes_to_b64(b"out")]})
+        return httpx.Response(404, json={"detail": "Not Found"})
+
+    monkeypatch.setattr(client_side, "FHE_TRANSPORT", "binary")
+    monkeypatch.setattr(client_side, "_binary_unsupported", set())
+    monkeypatch.setattr(client_side, "_registered_key_ids", {})
+    monkeypatch.setattr(client_side, "_fingerprints", {})
+    monkeypatch.setattr(client_side, "_http_client", httpx.Client(transport=httpx.MockTransport(handle)))
+    return calls
+
+
+def test_binary_is_not_retried_once_the_server_lacks_it(json_only_server):
+    inputs, keys = {"joint": [b"ciphertext"]}, {"joint": b"keys"}
+
+    assert client_side.call_fhe_server_models(inputs, keys) == {"joint": [b"out"]}
+    assert "/fhe/process_batch" in json_only_server
+
+    json_only_server.clear()
+    assert client_side.call_fhe_server_models(inputs, keys) == {"joint": [b"out"]}
+    assert json_only_server == ["/fhe/process_batch"]
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+# The workers import model_registry, which needs concrete
+pytest.importorskip("concrete.ml")
+
+from fhe_process_pool import FHEProcessPool, WorkerCrashedError
+
+
+async def wait_until_ready(pool, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while not pool.ready:
+        assert time.monotonic() < deadline, "workers did not come back"
+        await asyncio.sleep(0.1)
+
+
+def test_pool_recovers_from_a_killed_worker():
+    async def scenario():
+        # No models: the workers start and run requests without any artifacts
+        pool = FHEProcessPool({}, workers=2, watch_interval=0)
+        try:
+            await pool.refresh()
+            await wait_until_ready(pool)
+            assert await pool.run("k1", {}, {}) == {}
+
+            pid = await asyncio.get_running_loop().run_in_executor(pool._pool, os.getpid)
+            os.kill(pid, signal.SIGKILL)
+
+            with pytest.raises(WorkerCrashedError):
+                # The executor may notice the death only once this request is queued
+                for _ in range(50):
+                    await pool.run("k1", {}, {})
+                    await asyncio.sleep(0.1)
+            assert not pool.ready
+            assert pool.stats()["restarts"] == 1
+
+            await wait_until_ready(pool)
+            assert await pool.run("k1", {}, {}) == {}
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
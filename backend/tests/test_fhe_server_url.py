@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def client_urls(**env):
+    # In a fresh interpreter, since client_side reads the setting at import
+    code = "import client_side as c; print(c.KEYS_URL, c.BINARY_API_URL)"
+    env = {key: value for key, value in dict(os.environ, **env).items() if value is not None}
+    completed = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                               capture_output=True, text=True, check=True)
+    return completed.stdout.split()
+
+
+def test_fhe_server_url_defaults_to_the_local_tiktok_server():
+    assert client_urls(PRIVIFY_FHE_SERVER_URL=None) == [
+        "http://127.0.0.1:5000/fhe/keys", "http://127.0.0.1:5000/fhe/process_binary"]
+
+
+def test_fhe_server_url_is_read_from_the_environment():
+    assert client_urls(PRIVIFY_FHE_SERVER_URL="http://127.0.0.1:5055/") == [
+        "http://127.0.0.1:5055/fhe/keys", "http://127.0.0.1:5055/fhe/process_binary"]
@@ -0,0 +1,33 @@
+import pytest
+
+from fhe_transport import FrameDecodeError, FrameReader, decode_frames, encode_frames
+
+FRAMES = [("key_id", b"abc123"), ("category", b"\x00" * 1000), ("risk", bytes(range(256)) * 7), ("", b""),
+          ("category", b"x")]
+
+
+def read(body, chunk_size):
+    reader = FrameReader()
+    for start in range(0, len(body), chunk_size):
+        reader.feed(body[start:start + chunk_size])
+    return reader.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 20])
+def test_reader_matches_decode_frames_for_any_chunking(chunk_size):
+    body = encode_frames(FRAMES)
+
+    frames = read(body, chunk_size)
+
+    assert frames == [(name, bytes(payload)) for name, payload in decode_frames(body)] == FRAMES
+    assert all(type(payload) is bytes for _, payload in frames)
+
+
+def test_reader_rejects_malformed_bodies():
+    body = encode_frames(FRAMES)
+    with pytest.raises(FrameDecodeError, match="header"):
+        read(b"JSON" + body[4:], 16)
+    with pytest.raises(FrameDecodeError, match="Truncated"):
+        read(body[:-1], 16)
+    with pytest.raises(FrameDecodeError, match="Trailing"):
+        read(body + b"\x00", 16)
@@ -0,0 +1,32 @@
+import time
+
+from model_manager import LazyModel
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_idle_model_is_unloaded():
+    model = LazyModel("test", object, idle_timeout=0.05)
+    model.get()
+
+    assert wait_for(lambda: not model.loaded)
+
+
+def test_model_in_use_is_not_unloaded():
+    loads = []
+    model = LazyModel("test", lambda: loads.append(1) or object(), idle_timeout=0.05)
+
+    with model.use() as first:
+        # Several idle checks pass while a generation holds the model
+        time.sleep(0.3)
+        assert model.loaded
+        assert model.get() is first
+    assert len(loads) == 1
+
+    # The idle timeout counts from the end of the last use
+    assert wait_for(lambda: not model.loaded)
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+
+import language_models
+
+
+class FakePhi3Pipeline:
+    """Records how many generations run at once."""
+
+    def __init__(self):
+        self.tokenizer = lambda text, add_special_tokens=False: {"input_ids": text.split()}
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, **kwargs):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self._lock:
+            self.running -= 1
+        return [{"generated_text": '{"overall_summary": "s", "pattern": "p", "key_findings": "k", "suggestions": "x"}'}]
+
+
+def test_concurrent_analyses_generate_one_at_a_time(monkeypatch):
+    pipe = FakePhi3Pipeline()
+    monkeypatch.setattr(language_models, "_phi3_models", {})
+    monkeypatch.setattr(language_models, "_load_phi3_pipeline", lambda model_name, device: pipe)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(
+            language_models.generate_privacy_analysis(f"Comment: comment {i}", device="cpu")))
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pipe.max_running == 1
+    assert [result["pattern"] for result in results] == ["p"] * 4
@@ -0,0 +1,33 @@
+import json
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import on_device_server
+
+
+def test_stream_sends_the_verdict_first(monkeypatch):
+    async def run_inference_async(comment):
+        # Decrypted risk scores come back as numpy arrays
+        return "location/geoinformation", np.array([[7]], dtype=np.int64)
+
+    def stream_safe_generate(comment, category, score, stop=None):
+        yield "token", "Reasoning:"
+        yield "token", " It names a school."
+        yield "done", {"reason": "It names a school.", "suggestion": "Leave it out."}
+
+    monkeypatch.setattr(on_device_server, "run_inference_async", run_inference_async)
+    monkeypatch.setattr(on_device_server, "stream_safe_generate", stream_safe_generate)
+
+    # Without a `with` block the lifespan (model warm-up) does not run
+    client = TestClient(on_device_server.app)
+    with client.stream("POST", "/process/stream", json={"comment": "See you at Hillside High"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = response.iter_lines()
+        verdict = json.loads(next(lines))
+        rest = [json.loads(line) for line in lines if line]
+
+    assert verdict == {"event": "verdict", "category": "location/geoinformation", "risk_score": 7}
+    assert [event["event"] for event in rest] == ["token", "token", "done"]
+    assert rest[-1]["response"]["suggestion"] == "Leave it out."
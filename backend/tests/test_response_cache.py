@@ -0,0 +1,37 @@
+import sqlite3
+
+from response_cache import ResponseCache
+
+
+def count_rows(path, table):
+    with sqlite3.connect(path) as db:
+        return db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_disk_keeps_the_most_recent_results(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(max_entries=2, path=path, max_disk_entries=3)
+    for i in range(5):
+        cache.put(f"k{i}", {"n": i})
+    # Rewriting a key makes it the most recent one
+    cache.put("k2", {"n": 2})
+    cache.close()
+
+    assert count_rows(path, "responses") == 3
+    reopened = ResponseCache(max_entries=8, path=path, max_disk_entries=3)
+    assert [reopened.get(f"k{i}") for i in range(5)] == [None, None, {"n": 2}, {"n": 3}, {"n": 4}]
+    reopened.close()
+
+
+def test_caches_sharing_a_file_are_capped_separately(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    responses = ResponseCache(path=path, max_disk_entries=2)
+    summaries = ResponseCache(path=path, max_disk_entries=2, table="summaries")
+    responses.put("r", {"reason": "kept"})
+    for i in range(4):
+        summaries.put(f"s{i}", f"summary {i}")
+
+    assert count_rows(path, "responses") == 1
+    assert count_rows(path, "summaries") == 2
+    responses.close()
+    summaries.close()
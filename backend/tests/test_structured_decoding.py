@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+import language_models
+from language_models import STRUCTURED_PREFILL, _fields_complete_criteria, build_moderation_prompt
+
+# chat_template of TinyLlama/TinyLlama-1.1B-Chat-v1.0: every turn ends with EOS
+TINYLLAMA_CHAT_TEMPLATE = (
+    "{% for message in messages %}\n{% if message['role'] == 'user' %}\n{{ '<|user|>\n' + message['content'] + eos_token }}\n"
+    "{% elif message['role'] == 'system' %}\n{{ '<|system|>\n' + message['content'] + eos_token }}\n"
+    "{% elif message['role'] == 'assistant' %}\n{{ '<|assistant|>\n'  + message['content'] + eos_token }}\n"
+    "{% endif %}\n{% if loop.last and add_generation_prompt %}\n{{ '<|assistant|>' }}\n{% endif %}\n{% endfor %}"
+)
+
+ANSWERS = [
+    " The comment names the school the user attends.\nSuggestion: Leave out the school name.\nExtra text past the answer.",
+    " It shares a phone number.\nSuggestion: Send contact details privately.\nExtra text past the answer.",
+]
+COMPLETE = [answer[:answer.index("Extra")] for answer in ANSWERS]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    # A small byte-level BPE stands in for the TinyLlama tokenizer, which would need a download
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=400, special_tokens=["<unk>", "<s>", "</s>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    bpe.train_from_iterator(ANSWERS, trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, bos_token="<s>", eos_token="</s>",
+                                        unk_token="<unk>", pad_token="</s>", padding_side="left")
+    tokenizer.chat_template = TINYLLAMA_CHAT_TEMPLATE
+    return tokenizer
+
+
+@pytest.fixture(scope="module")
+def model(tokenizer):
+    config = transformers.LlamaConfig(vocab_size=len(tokenizer), hidden_size=16, intermediate_size=32,
+                                      num_hidden_layers=1, num_attention_heads=2, max_position_embeddings=4096,
+                                      eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.eos_token_id)
+    torch.manual_seed(0)
+    return transformers.LlamaForCausalLM(config).eval()
+
+
+class ForceAnswers(transformers.LogitsProcessor):
+    """Makes the model generate `answers` (token ids, one per row) whatever its weights."""
+
+    def __init__(self, answers, prompt_length):
+        self.answers = answers
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids, scores):
+        step = input_ids.shape[1] - self.prompt_length
+        forced = torch.full_like(scores, -float("inf"))
+        for row, answer in enumerate(self.answers):
+            forced[row, answer[min(step, len(answer) - 1)]] = 0
+        return forced
+
+
+def generate(model, tokenizer, comments, criteria):
+    pipe = SimpleNamespace(tokenizer=tokenizer)
+    prompts = [build_moderation_prompt(pipe, comment, ["location/geoinformation"], 7, structured=True)
+               for comment in comments]
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False,
+                       return_token_type_ids=False)
+    answers = [tokenizer(answer, add_special_tokens=False)["input_ids"] for answer in ANSWERS[:len(prompts)]]
+    prompt_length = inputs["input_ids"].shape[1]
+    output = model.generate(**inputs, max_new_tokens=96, do_sample=False, pad_token_id=tokenizer.pad_token_id,
+                            logits_processor=transformers.LogitsProcessorList([ForceAnswers(answers, prompt_length)]),
+                            stopping_criteria=transformers.StoppingCriteriaList([criteria]))
+    return prompts, [tokenizer.decode(row) for row in output[:, prompt_length:]]
+
+
+def test_prompt_has_eos_before_the_answer(tokenizer):
+    prompt = build_moderation_prompt(SimpleNamespace(tokenizer=tokenizer), "See you at Hillside High", ["location"], 7,
+                                     structured=True)
+    assert prompt.endswith("</s>\n<|assistant|>\n" + STRUCTURED_PREFILL)
+
+
+def test_generation_runs_until_both_fields_are_complete(model, tokenizer):
+    criteria = _fields_complete_criteria(tokenizer, STRUCTURED_PREFILL)
+    _, texts = generate(model, tokenizer, ["See you at Hillside High after class"], criteria)
+
+    assert texts == COMPLETE[:1]
+    assert language_models.parse_moderation_output(STRUCTURED_PREFILL + texts[0])["suggestion"] == "Leave out the school name."
+
+
+def test_left_padded_batch_waits_for_every_row(model, tokenizer):
+    criteria = _fields_complete_criteria(tokenizer, STRUCTURED_PREFILL)
+    _, texts = generate(model, tokenizer, ["Hillside High", "Call me on 0412 345 678 tonight after my shift"], criteria)
+
+    # The second prompt is padded with EOS and its answer is shorter, so it runs on until the first is complete
+    assert texts[0] == COMPLETE[0]
+    assert texts[1].startswith(COMPLETE[1]) and len(texts[1]) > len(COMPLETE[1])
+
+
+def test_criteria_starts_over_for_each_generate_call(model, tokenizer):
+    # A pipeline reuses the criteria for every batch it generates
+    criteria = _fields_complete_criteria(tokenizer, STRUCTURED_PREFILL)
+    _, first = generate(model, tokenizer, ["See you at Hillside High after class"], criteria)
+    _, second = generate(model, tokenizer, ["Hillside"], criteria)
+
+    assert first == second == COMPLETE[:1]
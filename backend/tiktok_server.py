@@ -1,20 +1,134 @@
+import asyncio
 import base64
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from concrete.ml.deployment import FHEModelServer
 import numpy as np
-from typing import Union, List
+from typing import Union, List, Dict, Optional, Tuple
+from model_registry import ModelRegistry, ModelNotReadyError, deserialize_evaluation_keys, run_with_keys
+from key_cache import EvaluationKeyCache, key_set_id
+from fhe_executor import FHEExecutor
+from fhe_process_pool import FHEProcessPool, PoolFullError, WorkerCrashedError
+from fhe_transport import CONTENT_TYPE, FrameDecodeError, FrameReader, encode_frames, group_frames
+from tracing import METRICS_CONTENT_TYPE, configure_logging, get_logger, instrument_request, render_metrics, span
 
-app = FastAPI()
+configure_logging()
+logger = get_logger("tiktok_server")
 
 FHE_FILE_PATH_SERVER = "./fhe_directory"
 FHE_FILE_PATH_RISK_SERVER = "./fhe_directory_risk"
+FHE_FILE_PATH_JOINT_SERVER = "./fhe_directory_joint"
+
+# Models run for each request layout: the two-circuit setup or the merged
+# circuit with 3 category outputs + 1 risk output (train_joint_model.py)
+LAYOUTS = {"split": ("category", "risk"), "joint": ("joint",)}
+
+# Seconds between checks for updated server.zip artifacts (0 disables the watcher)
+MODEL_WATCH_INTERVAL = float(os.environ.get("PRIVIFY_MODEL_WATCH_INTERVAL", "10"))
+
+# Bounds for the deserialized evaluation key cache
+KEY_CACHE_SIZE = int(os.environ.get("PRIVIFY_KEY_CACHE_SIZE", "32"))
+KEY_CACHE_TTL = float(os.environ.get("PRIVIFY_KEY_CACHE_TTL", "3600"))
+
+# Maximum number of comments accepted in one batched request
+MAX_BATCH_SIZE = int(os.environ.get("PRIVIFY_MAX_BATCH_SIZE", "64"))
+
+# Requests allowed to run circuits at the same time (others queue), and the
+# size of the worker pool they share. Each request uses up to one worker per circuit.
+FHE_MAX_CONCURRENCY = int(os.environ.get("PRIVIFY_FHE_MAX_CONCURRENCY", max(1, (os.cpu_count() or 2) // 2)))
+FHE_WORKERS = int(os.environ.get("PRIVIFY_FHE_WORKERS", 2 * FHE_MAX_CONCURRENCY))
+
+# With PRIVIFY_FHE_PROCESSES > 0 the circuits run in that many worker processes
+# instead of threads of this one, so a single uvicorn process uses every core.
+# Requests beyond PRIVIFY_FHE_MAX_PENDING get a 503 instead of queueing.
+FHE_PROCESSES = int(os.environ.get("PRIVIFY_FHE_PROCESSES", "0"))
+FHE_MAX_PENDING = int(os.environ.get("PRIVIFY_FHE_MAX_PENDING", 4 * max(1, FHE_PROCESSES)))
+
+registry = ModelRegistry({
+    "category": FHE_FILE_PATH_SERVER,
+    "risk": FHE_FILE_PATH_RISK_SERVER,
+    "joint": FHE_FILE_PATH_JOINT_SERVER,
+}, optional=["joint"])
+key_cache = EvaluationKeyCache(max_entries=KEY_CACHE_SIZE, ttl_seconds=KEY_CACHE_TTL)
+executor = FHEExecutor(max_workers=FHE_WORKERS, max_concurrent_requests=FHE_MAX_CONCURRENCY)
+
+# In process mode the workers hold the loaded servers and deserialized keys;
+# this process only keeps the serialized keys in key_cache
+process_pool = FHEProcessPool(
+    registry.model_dirs,
+    registry.optional,
+    workers=FHE_PROCESSES,
+    max_pending=FHE_MAX_PENDING,
+    key_cache_size=KEY_CACHE_SIZE,
+    key_cache_ttl=KEY_CACHE_TTL,
+    watch_interval=MODEL_WATCH_INTERVAL,
+) if FHE_PROCESSES > 0 else None
+
+async def load_models():
+    try:
+        if process_pool is not None:
+            await process_pool.refresh()
+        else:
+            await asyncio.to_thread(registry.load_all)
+    except Exception as e:
+        logger.error("Failed to load FHE models, /ready stays false. Reason: %s", e)
+
+async def watch_models(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if process_pool is not None:
+                # The workers reload on their own, this only refreshes /ready
+                await process_pool.refresh()
+            else:
+                await asyncio.to_thread(registry.reload_if_changed)
+        except Exception as e:
+            logger.error("Failed to reload FHE models, keeping the loaded ones. Reason: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile the circuits in the background so /ready can report progress
+    tasks = [asyncio.create_task(load_models())]
+    if MODEL_WATCH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(watch_models(MODEL_WATCH_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+    executor.shutdown()
+    if process_pool is not None:
+        process_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    # Request IDs, /metrics and the Server-Timing header, which lets clients
+    # split their round trip into network and server stages
+    return await instrument_request("tiktok_server", request, call_next)
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 class FHERequest(BaseModel):
     X_enc: Union[str, List]  # base64 string or list
-    X_enc_risk: Union[str, List]
-    serialized_keys: str      # base64 string
-    serialized_keys_risk: str
+    X_enc_risk: Optional[Union[str, List]] = None  # not used by the joint layout
+    layout: str = "split"    # "split" (category + risk circuits) or "joint" (merged circuit)
+    key_id: Optional[str] = None  # ID returned by /fhe/keys, replaces the keys below
+    serialized_keys: Optional[str] = None      # base64 string
+    serialized_keys_risk: Optional[str] = None
+
+class FHEBatchRequest(BaseModel):
+    key_id: str                          # ID returned by /fhe/keys
+    X_enc: List[Union[str, List]]        # one encrypted input per comment
+    X_enc_risk: Optional[List[Union[str, List]]] = None
+    layout: str = "split"
+
+class KeyRegistration(BaseModel):
+    keys: Dict[str, str]  # model name -> base64 serialized evaluation keys
 
 def decode_input(x: Union[str, list]) -> Union[np.ndarray, bytes]:
     """
@@ -35,35 +149,239 @@ def decode_keys(key_b64: str) -> bytes:
 def bytes_to_b64(b: bytes) -> str:
     return base64.b64encode(b).decode("utf-8")
 
+def models_ready() -> bool:
+    return process_pool.ready if process_pool is not None else registry.ready
+
+@app.get("/ready")
+def ready():
+    status_code = 200 if models_ready() else 503
+    return JSONResponse({"ready": models_ready()}, status_code=status_code)
+
+@app.post("/admin/reload")
+async def reload_models():
+    if process_pool is not None:
+        return {"reloaded": await process_pool.request_reload()}
+    return {"reloaded": await asyncio.to_thread(registry.reload_if_changed)}
+
+def get_servers() -> Dict:
+    """Loaded servers by model name. In process mode they live in the workers and only the names are known here."""
+    if process_pool is not None:
+        if not process_pool.ready:
+            raise HTTPException(status_code=503, detail="FHE workers not ready yet")
+        return dict.fromkeys(process_pool.models)
+    try:
+        return registry.snapshot()
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+def get_cached_keys(key_id: str, names: List[str]) -> Dict:
+    keys = key_cache.get(key_id)
+    if keys is None:
+        # The client re-registers its keys on 404
+        raise HTTPException(status_code=404, detail=f"Unknown or expired key_id: {key_id}")
+    missing = set(names) - set(keys)
+    if missing:
+        raise HTTPException(status_code=422, detail=f"key_id has no keys for: {', '.join(sorted(missing))}")
+    return keys
+
+def store_keys(serialized_keys: Dict[str, bytes]) -> Dict[str, str]:
+    unknown = set(serialized_keys) - set(registry.model_dirs)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown models: {', '.join(sorted(unknown))}")
+
+    key_id = key_set_id(serialized_keys)
+    if key_id not in key_cache:
+        if process_pool is not None:
+            key_cache.put(key_id, dict(serialized_keys))
+        else:
+            key_cache.put(key_id, {
+                name: deserialize_evaluation_keys(key) for name, key in serialized_keys.items()
+            })
+    return {"key_id": key_id}
+
+async def read_frames(request: Request) -> Dict[str, List[bytes]]:
+    """Decode a frame body while it is received, without buffering the whole body first."""
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type != CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Expected {CONTENT_TYPE}")
+    reader = FrameReader()
+    try:
+        async for chunk in request.stream():
+            reader.feed(chunk)
+        return group_frames(reader.close())
+    except FrameDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def single_frame(frames: Dict[str, List[bytes]], name: str) -> bytes:
+    payloads = frames.get(name, [])
+    if len(payloads) != 1:
+        raise HTTPException(status_code=422, detail=f"Expected exactly one '{name}' frame")
+    return payloads[0]
+
+@app.post("/fhe/keys")
+def register_keys(req: KeyRegistration):
+    return store_keys({name: decode_keys(key) for name, key in req.keys.items()})
+
+@app.post("/fhe/keys_binary")
+async def register_keys_binary(request: Request):
+    frames = await read_frames(request)
+    serialized_keys = {name: single_frame(frames, name) for name in frames}
+    return await run_in_threadpool(store_keys, serialized_keys)
+
+@app.get("/fhe/keys/stats")
+def key_cache_stats():
+    return key_cache.stats()
+
+@app.get("/fhe/stats")
+def executor_stats():
+    if process_pool is not None:
+        return {"mode": "processes", **process_pool.stats()}
+    return {
+        "mode": "threads",
+        "workers": executor.max_workers,
+        "max_concurrency": executor.max_concurrent_requests,
+        "queued_requests": executor.waiting,
+    }
+
+def layout_inputs(layout: str, X_encs: List, X_enc_risks: Optional[List]) -> Dict[str, List]:
+    """Map the X_enc / X_enc_risk fields of a JSON request to the models they are meant for."""
+    if layout not in LAYOUTS:
+        raise HTTPException(status_code=422, detail=f"Unknown layout: {layout}")
+    if layout == "split":
+        if X_enc_risks is None:
+            raise HTTPException(status_code=422, detail="X_enc_risk is required for the split layout")
+        return {"category": X_encs, "risk": X_enc_risks}
+    return {"joint": X_encs}
+
+def check_inputs(servers: Dict, inputs: Dict[str, List]):
+    for name in inputs:
+        if name not in registry.model_dirs:
+            raise HTTPException(status_code=422, detail=f"Unknown model: {name}")
+        if name not in servers:
+            raise HTTPException(status_code=503, detail=f"FHE model not loaded: {name}")
+    sizes = {len(xs) for xs in inputs.values()}
+    if len(sizes) > 1:
+        raise HTTPException(status_code=422, detail="All models must receive the same number of inputs")
+    if not inputs or sizes == {0}:
+        raise HTTPException(status_code=422, detail="Empty batch")
+    if sizes.pop() > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch larger than {MAX_BATCH_SIZE} items")
+
+async def run_in_processes(key_id: str, keys: Dict, inputs: Dict[str, List[bytes]]) -> Dict[str, List[bytes]]:
+    with span("run"):
+        try:
+            return await process_pool.run(key_id, inputs, keys)
+        except PoolFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except WorkerCrashedError as e:
+            # The new workers need a few seconds to load the circuits
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except ModelNotReadyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+async def run_models(servers: Dict, key_id: str, keys: Dict, inputs: Dict[str, List[bytes]]) -> Dict[str, List[bytes]]:
+    """Run every model on each of its inputs concurrently, keeping the input order."""
+    if process_pool is not None:
+        return await run_in_processes(key_id, keys, inputs)
+    calls = [(run_with_keys, (servers[name], x, keys[name])) for name, xs in inputs.items() for x in xs]
+    with span("run"):
+        results = iter(await executor.run_all(calls))
+    return {name: [next(results) for _ in xs] for name, xs in inputs.items()}
+
+def decode_request_inputs(layout: str, X_encs: List, X_enc_risks: Optional[List]) -> Dict[str, List]:
+    """Decode the X_enc / X_enc_risk fields of a JSON request and map them to their models."""
+    X_enc_risk = None if X_enc_risks is None else [decode_input(x) for x in X_enc_risks]
+    return layout_inputs(layout, [decode_input(x) for x in X_encs], X_enc_risk)
+
+def decode_key_set(serialized_keys: Dict[str, List[str]]) -> Dict[str, bytes]:
+    return {name: decode_keys(keys[0]) for name, keys in serialized_keys.items()}
+
+def encode_results(layout: str, results: Dict[str, List[bytes]]) -> Tuple[List[str], Optional[List[str]]]:
+    """base64 outputs of the layout's first model, and of the risk model if it ran."""
+    risk = [bytes_to_b64(r) for r in results["risk"]] if "risk" in results else None
+    return [bytes_to_b64(r) for r in results[LAYOUTS[layout][0]]], risk
+
+# The handlers below are async so they can await the circuits, which makes them
+# run on the event loop: base64 of multi-MB ciphertexts and keys, and hashing
+# key sets, go to the threadpool so other requests are still accepted meanwhile
+
 @app.post("/fhe/process")
-def process_fhe(req: FHERequest):
-    print("--------------------------------------------------")
-    print("Step 1) Tiktok server receives encrypted payload and does secure FHE inference")
+async def process_fhe(req: FHERequest):
+    servers = get_servers()
+
     # Decode inputs
-    X_enc = decode_input(req.X_enc)
-    X_enc_risk = decode_input(req.X_enc_risk)
-    serialized_keys = decode_keys(req.serialized_keys)
-    serialized_keys_risk = decode_keys(req.serialized_keys_risk)
-
-    # Load servers
-    server = FHEModelServer(path_dir=FHE_FILE_PATH_SERVER)
-    server.load()
-    server_risk = FHEModelServer(path_dir=FHE_FILE_PATH_RISK_SERVER)
-    server_risk.load()
-
-    # Run inference
-    encrypted_result = server.run(X_enc, serialized_keys)
-    encrypted_result_risk = server_risk.run(X_enc_risk, serialized_keys_risk)
-
-    print("FHE inference done on encrypted data.")
-    print("--------------------------------------------------")
-
-    print("Step 2) Server sends back encrypted output to client")
-    response = {
-        "encrypted_result": bytes_to_b64(encrypted_result),
-        "encrypted_result_risk": bytes_to_b64(encrypted_result_risk)
-    }
-    print("Encrypted outputs serialized and ready to send.")
-    print("--------------------------------------------------")
+    X_enc_risk = None if req.X_enc_risk is None else [req.X_enc_risk]
+    with span("decode"):
+        inputs = await run_in_threadpool(decode_request_inputs, req.layout, [req.X_enc], X_enc_risk)
+    check_inputs(servers, inputs)
+
+    # Run inference on the preloaded servers
+    key_id = req.key_id
+    if key_id is None:
+        serialized_keys = layout_inputs(req.layout, [req.serialized_keys], [req.serialized_keys_risk])
+        if any(key is None for keys in serialized_keys.values() for key in keys):
+            raise HTTPException(status_code=422, detail="Either key_id or the serialized keys of every model are required")
+        with span("keys"):
+            request_keys = await run_in_threadpool(decode_key_set, serialized_keys)
+            if process_pool is not None:
+                # Workers only take registered key sets
+                key_id = (await run_in_threadpool(store_keys, request_keys))["key_id"]
+    if key_id is not None:
+        keys = get_cached_keys(key_id, list(inputs))
+        results = await run_models(servers, key_id, keys, inputs)
+    else:
+        names = list(inputs)
+        with span("run"):
+            outputs = await executor.run_all([
+                (servers[name].run, (inputs[name][0], request_keys[name])) for name in names
+            ])
+        results = {name: [output] for name, output in zip(names, outputs)}
+
+    with span("encode"):
+        encoded, encoded_risk = await run_in_threadpool(encode_results, req.layout, results)
+    response = {"encrypted_result": encoded[0]}
+    if encoded_risk is not None:
+        response["encrypted_result_risk"] = encoded_risk[0]
+
+    return response
 
+@app.post("/fhe/process_batch")
+async def process_fhe_batch(req: FHEBatchRequest):
+    servers = get_servers()
+    with span("decode"):
+        inputs = await run_in_threadpool(decode_request_inputs, req.layout, req.X_enc, req.X_enc_risk)
+    check_inputs(servers, inputs)
+    with span("keys"):
+        keys = get_cached_keys(req.key_id, list(inputs))
+
+    results = await run_models(servers, req.key_id, keys, inputs)
+    with span("encode"):
+        encoded, encoded_risk = await run_in_threadpool(encode_results, req.layout, results)
+    response = {"encrypted_results": encoded}
+    if encoded_risk is not None:
+        response["encrypted_results_risk"] = encoded_risk
     return response
+
+@app.post("/fhe/process_binary")
+async def process_fhe_binary(request: Request):
+    """
+    Binary counterpart of /fhe/process and /fhe/process_batch.
+
+    The body is a frame sequence (see fhe_transport) with one "key_id" frame
+    and, for each model to run ("category" and "risk", or "joint"), N >= 1
+    frames named after the model, one per comment. The response holds the
+    encrypted outputs as frames with the same names, in the same order.
+    """
+    servers = get_servers()
+    with span("decode"):
+        frames = await read_frames(request)
+        key_id = single_frame(frames, "key_id").decode("utf-8")
+        inputs = {name: xs for name, xs in frames.items() if name != "key_id"}
+    check_inputs(servers, inputs)
+    with span("keys"):
+        keys = get_cached_keys(key_id, list(inputs))
+
+    results = await run_models(servers, key_id, keys, inputs)
+    with span("encode"):
+        body = await run_in_threadpool(encode_frames, [(name, r) for name, outputs in results.items() for r in outputs])
+    return Response(content=body, media_type=CONTENT_TYPE)
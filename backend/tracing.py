@@ -0,0 +1,250 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+SERVER_TIMING_HEADER = "Server-Timing"
+REQUEST_ID_HEADER = "X-Request-ID"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# DEBUG logs every stage, INFO model loads and retries. The default only shows
+# failures, so the request path prints nothing
+LOG_LEVEL = os.environ.get("PRIVIFY_LOG_LEVEL", "WARNING").upper()
+
+
+class Trace:
+    """Stage durations (seconds, summed per stage) and payload sizes of one request."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_bytes(self, name: str, size: int) -> None:
+        with self._lock:
+            self.sizes[name] = self.sizes.get(name, 0) + size
+
+
+_request_id: ContextVar[Optional[str]] = ContextVar("privify_request_id", default=None)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the "privify" namespace, controlled by PRIVIFY_LOG_LEVEL."""
+    return logging.getLogger(f"privify.{name}")
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    """Send privify log records to stderr at `level`, tagged with the request ID."""
+    root = logging.getLogger("privify")
+    if any(isinstance(f, _RequestIdFilter) for handler in root.handlers for f in handler.filters):
+        return
+    handler = logging.StreamHandler()
+    handler.addFilter(_RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+
+logger = get_logger("tracing")
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    """Tag everything inside the block (logs, outgoing requests) with a request ID."""
+    request_id = request_id or uuid.uuid4().hex
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+# Copied into asyncio.to_thread workers, so spans there land in the caller's trace.
+# Plain executor threads (loop.run_in_executor) do not see it.
+_current: ContextVar[Optional[Trace]] = ContextVar("privify_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the spans recorded inside this block into a new Trace."""
+    new_trace = Trace()
+    token = _current.set(new_trace)
+    try:
+        yield new_trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the block as `stage` in the current trace; a no-op outside a trace."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        current.add(stage, elapsed)
+        logger.debug("%s took %.1f ms", stage, elapsed * 1000)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Add an externally measured duration, e.g. one reported by the other server."""
+    current = _current.get()
+    if current is not None:
+        current.add(stage, seconds)
+
+
+def record_bytes(name: str, size: int) -> None:
+    current = _current.get()
+    if current is not None:
+        current.add_bytes(name, size)
+
+
+def server_timing(current: Trace) -> str:
+    """Format stage durations as a Server-Timing header value (milliseconds)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in current.stages.items())
+
+
+def parse_server_timing(value: Optional[str]) -> Dict[str, float]:
+    """Parse a Server-Timing header value into stage durations in seconds."""
+    stages = {}
+    for entry in (value or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, duration = param.strip().partition("=")
+            if name and key == "dur":
+                try:
+                    stages[name] = float(duration) / 1000
+                except ValueError:
+                    pass
+    return stages
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(buckets)
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[Tuple[str, str], ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', repr(float(bound))),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+REQUESTS = Counter("privify_requests_total", "HTTP requests by route and status code.")
+STAGE_SECONDS = Histogram(
+    "privify_stage_seconds", "Duration of each request stage in seconds.",
+    [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300],
+)
+PAYLOAD_BYTES = Histogram(
+    "privify_payload_bytes", "Size of FHE request and response payloads in bytes.",
+    [2 ** 10, 2 ** 12, 2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28],
+)
+METRICS = [REQUESTS, STAGE_SECONDS, PAYLOAD_BYTES]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def observe_trace(service: str, current: Trace) -> None:
+    for stage, seconds in current.stages.items():
+        STAGE_SECONDS.observe(seconds, service=service, stage=stage)
+    for name, size in current.sizes.items():
+        PAYLOAD_BYTES.observe(size, service=service, name=name)
+
+
+async def instrument_request(service: str, request, call_next):
+    """
+    Body of the HTTP middleware of both servers.
+
+    Runs the request inside a trace and a request context (reusing the caller's
+    X-Request-ID), records the stages in the metrics and returns the request ID
+    and stage timings as response headers.
+    """
+    with request_context(request.headers.get(REQUEST_ID_HEADER)) as request_id, trace() as current:
+        with span("total"):
+            response = await call_next(request)
+        for name, headers in (("request_bytes", request.headers), ("response_bytes", response.headers)):
+            if "content-length" in headers:
+                current.add_bytes(name, int(headers["content-length"]))
+    route = request.scope.get("route")
+    REQUESTS.inc(service=service, route=getattr(route, "path", "unmatched"), status=str(response.status_code))
+    observe_trace(service, current)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    response.headers[SERVER_TIMING_HEADER] = server_timing(current)
+    return response
@@ -0,0 +1,60 @@
+"""
+Train one of the FHE models from a comments CSV of any size.
+
+The CSV is read and featurized in chunks into a memory-mapped feature matrix,
+the model is fit from it and compiled on a random subsample. Wall-clock time and
+peak RSS are reported per stage. Writes the same artifacts as train_model.py,
+train_risk_model.py and train_joint_model.py, saved like build_models.py does:
+atomically, so a running tiktok_server keeps serving the previous model until
+the new server.zip is in place, and with the fingerprint build_models.py would
+record for the same CSV and options:
+
+    python train_chunked.py --model category
+    python train_chunked.py --model risk --csv big_export.csv --chunk-size 200000 --compile-samples 2000
+"""
+import argparse
+
+from build_models import file_sha256, fingerprint, save_atomically
+from training import MODEL_DIRS, StageTimer, featurize_csv, train_from_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, choices=sorted(MODEL_DIRS))
+    parser.add_argument("--csv", default="comments.csv")
+    parser.add_argument("--output-dir", default=None, help="Defaults to the model's fhe_directory*")
+    parser.add_argument("--features-dir", default="./features")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="CSV rows per chunk")
+    parser.add_argument("--test-fraction", type=float, default=0.05)
+    parser.add_argument("--compile-samples", type=int, default=1000, help="Rows used to compile the circuit")
+    parser.add_argument("--max-epochs", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = {
+        "chunk_size": args.chunk_size,
+        "test_fraction": args.test_fraction,
+        "compile_samples": args.compile_samples,
+        "max_epochs": args.max_epochs,
+        "seed": args.seed,
+    }
+    timer = StageTimer()
+    with timer.stage("featurize"):
+        features = featurize_csv(args.csv, args.model, args.features_dir, chunk_size=args.chunk_size,
+                                 test_fraction=args.test_fraction, seed=args.seed)
+    print(f"Training rows: {len(features.X_train)}, held-out rows: {len(features.X_test)}")
+
+    model, metrics = train_from_features(args.model, features, compile_samples=args.compile_samples,
+                                         max_epochs=args.max_epochs, timer=timer, seed=args.seed)
+    for name, value in metrics.items():
+        print(f"{name}: {value:.4f}")
+
+    output_dir = args.output_dir or MODEL_DIRS[args.model]
+    with timer.stage("save"):
+        save_atomically(model, output_dir, fingerprint(args.model, file_sha256(args.csv), options))
+    print(f"Saved {args.model} model to {output_dir}")
+    timer.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from sklearn.model_selection import train_test_split
+import pandas as pd
+from utils import process_comments
+from training import JOINT_PARAMS, RISK_SCALE, joint_targets, num_categories
+
+from concrete.ml.sklearn import NeuralNetRegressor
+from concrete.ml.deployment import FHEModelDev
+import numpy as np
+import os
+import shutil
+
+FHE_FILE_PATH_JOINT = "./fhe_directory_joint"
+
+
+def clear_fhe_dir():
+    if os.path.exists(FHE_FILE_PATH_JOINT):
+        for filename in os.listdir(FHE_FILE_PATH_JOINT):
+            file_path = os.path.join(FHE_FILE_PATH_JOINT, filename)
+            try:
+                if os.path.isfile(file_path) or os.path.islink(file_path):
+                    os.remove(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+            except Exception as e:
+                print(f'Failed to delete {file_path}. Reason: {e}')
+        print(f"Cleared the directory: {FHE_FILE_PATH_JOINT}")
+    else:
+        os.makedirs(FHE_FILE_PATH_JOINT)
+        print(f"Created the directory: {FHE_FILE_PATH_JOINT}")
+
+# Train one model with 3 category outputs + 1 risk output, so the client
+# encrypts once and the server runs a single circuit per comment
+df = pd.read_csv('comments.csv')
+X = df.values[:, 0]
+y = joint_targets(df)
+
+X_processed = process_comments(X, max_length=70)
+
+X_train, X_test, y_train, y_test = train_test_split(X_processed, y, test_size=0.05)
+joint_model = NeuralNetRegressor(**JOINT_PARAMS)
+joint_model.fit(X_train, y_train)
+y_pred = joint_model.predict(X_test)
+
+accuracy = np.mean(np.argmax(y_pred[:, :num_categories], axis=1) == np.argmax(y_test[:, :num_categories], axis=1))
+risk_mae = np.mean(np.abs(y_pred[:, num_categories] - y_test[:, num_categories])) * RISK_SCALE
+print(f"Classification Accuracy: {accuracy:.4f}")
+print(f"Risk MAE: {risk_mae:.4f}")
+
+joint_model.compile(X_train)
+
+dev = FHEModelDev(path_dir=FHE_FILE_PATH_JOINT, model=joint_model)
+
+clear_fhe_dir()
+dev.save()
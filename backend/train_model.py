@@ -1,6 +1,7 @@
 from sklearn.model_selection import train_test_split
 import pandas as pd
-from utils import process_comment
+from utils import process_comments
+from training import CATEGORY_PARAMS, category_targets
 
 from concrete.ml.sklearn import NeuralNetRegressor
 from concrete.ml.deployment import FHEModelDev, FHEModelClient, FHEModelServer
@@ -45,23 +46,12 @@ def clear_fhe_dir():
 # (A) Train Classifier for Category
 X = df.values[:, 0]
 len_longest_comment = max(len(x) for x in X)
-y = df.iloc[:, -num_categories:].to_numpy().astype(np.float32)
-
-params = {
-    "module__n_layers": 3,
-    "module__activation_function" : nn.ReLU,
-    "module__n_hidden_neurons_multiplier" : 4,
-    
-    "module__n_w_bits" : 4, 
-    "module__n_a_bits" : 4,
-    
-    "max_epochs": 150,
-    "verbose" : True,
-    "lr" : 1e-3,
-}
-
-
-X_processed = np.array([process_comment(comment, max_length=70) for comment in X])
+y = category_targets(df)
+
+params = CATEGORY_PARAMS
+
+
+X_processed = process_comments(X, max_length=70)
 n_inputs = 70
 n_outputs = num_categories
 
@@ -1,7 +1,8 @@
 from sklearn.datasets import make_classification
 from sklearn.model_selection import train_test_split
 import pandas as pd
-from utils import process_comment
+from utils import process_comments
+from training import RISK_PARAMS, risk_targets
 
 from concrete.ml.sklearn import NeuralNetRegressor
 from concrete.ml.sklearn import RandomForestRegressor
@@ -44,22 +45,13 @@ def clear_fhe_dir():
 # Load new_comments.csv with risk scores
 df_risk = pd.read_csv('comments.csv')
 X_risk = df_risk.values[:, 0]  # comment column
-y_risk = df_risk.iloc[:, 2].astype(float).to_numpy(dtype=np.float32).reshape(-1, 1)
+y_risk = risk_targets(df_risk)
 
 # Process comments the same way
-X_risk_processed = np.array([process_comment(comment, max_length=70) for comment in X_risk])
+X_risk_processed = process_comments(X_risk, max_length=70)
 
 # Train the model
-params_risk = {
-    "module__n_layers": 3,  # Simpler for regression
-    "module__activation_function": nn.ReLU,
-    "module__n_hidden_neurons_multiplier": 4,
-    "module__n_w_bits": 4,
-    "module__n_a_bits": 4,
-    "max_epochs": 300,
-    "verbose": True,
-    "lr": 3e-3,
-}
+params_risk = RISK_PARAMS
 
 risk_model = NeuralNetRegressor(**params_risk)
 risk_model.fit(X_risk_processed, y_risk)
@@ -0,0 +1,191 @@
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import torch.nn as nn
+from utils import RISK_SCALE, process_comments
+
+num_categories = 3
+
+CATEGORY_PARAMS = {
+    "module__n_layers": 3,
+    "module__activation_function" : nn.ReLU,
+    "module__n_hidden_neurons_multiplier" : 4,
+
+    "module__n_w_bits" : 4,
+    "module__n_a_bits" : 4,
+
+    "max_epochs": 150,
+    "verbose" : True,
+    "lr" : 1e-3,
+}
+
+RISK_PARAMS = {
+    "module__n_layers": 3,  # Simpler for regression
+    "module__activation_function": nn.ReLU,
+    "module__n_hidden_neurons_multiplier": 4,
+    "module__n_w_bits": 4,
+    "module__n_a_bits": 4,
+    "max_epochs": 300,
+    "verbose": True,
+    "lr": 3e-3,
+}
+
+# One circuit with 3 category outputs + 1 risk output
+JOINT_PARAMS = {
+    "module__n_layers": 3,
+    "module__activation_function": nn.ReLU,
+    "module__n_hidden_neurons_multiplier": 4,
+    "module__n_w_bits": 4,
+    "module__n_a_bits": 4,
+    "max_epochs": 300,
+    "verbose": True,
+    "lr": 2e-3,
+}
+
+
+def category_targets(df: pd.DataFrame) -> np.ndarray:
+    """One-hot category labels, the last `num_categories` columns of comments.csv."""
+    return df.iloc[:, -num_categories:].to_numpy().astype(np.float32)
+
+
+def risk_targets(df: pd.DataFrame) -> np.ndarray:
+    """Risk scores (1-10) as a column vector."""
+    return df.iloc[:, 2].astype(float).to_numpy(dtype=np.float32).reshape(-1, 1)
+
+
+def joint_targets(df: pd.DataFrame) -> np.ndarray:
+    """Category one-hot labels followed by the risk score scaled to [0, 1]."""
+    return np.hstack([category_targets(df), risk_targets(df) / RISK_SCALE]).astype(np.float32)
+
+
+MAX_LENGTH = 70
+
+MODEL_PARAMS = {"category": CATEGORY_PARAMS, "risk": RISK_PARAMS, "joint": JOINT_PARAMS}
+MODEL_TARGETS: Dict[str, Callable[[pd.DataFrame], np.ndarray]] = {
+    "category": category_targets,
+    "risk": risk_targets,
+    "joint": joint_targets,
+}
+MODEL_DIRS = {"category": "./fhe_directory", "risk": "./fhe_directory_risk", "joint": "./fhe_directory_joint"}
+
+
+def evaluate(model_name: str, y_pred: np.ndarray, y_true: np.ndarray) -> Dict[str, float]:
+    """Category accuracy and/or risk MAE (in 1-10 units), depending on the model."""
+    metrics = {}
+    if model_name in ("category", "joint"):
+        metrics["accuracy"] = float(np.mean(
+            np.argmax(y_pred[:, :num_categories], axis=1) == np.argmax(y_true[:, :num_categories], axis=1)))
+    if model_name == "risk":
+        metrics["risk_mae"] = float(np.mean(np.abs(y_pred.ravel() - y_true.ravel())))
+    if model_name == "joint":
+        metrics["risk_mae"] = float(np.mean(np.abs(y_pred[:, num_categories] - y_true[:, num_categories])) * RISK_SCALE)
+    return metrics
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageTimer:
+    """Records wall-clock time and peak RSS at the end of each named stage."""
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        self.stages.append((name, time.perf_counter() - start, peak_rss_mb()))
+        print(f"[{name}] {self.stages[-1][1]:.1f}s, peak RSS {self.stages[-1][2]:.0f} MB")
+
+    def report(self) -> None:
+        print(f"{'stage':<12} {'seconds':>9} {'peak RSS MB':>12}")
+        for name, seconds, rss in self.stages:
+            print(f"{name:<12} {seconds:>9.1f} {rss:>12.0f}")
+
+
+class FeatureSet(NamedTuple):
+    X_train: np.memmap
+    y_train: np.ndarray
+    X_test: np.ndarray
+    y_test: np.ndarray
+
+
+def featurize_csv(csv_path: str, model_name: str, features_dir: str,
+                  chunk_size: int = 100_000, test_fraction: float = 0.05,
+                  max_length: int = MAX_LENGTH, seed: int = 0) -> FeatureSet:
+    """
+    Featurize a comments CSV chunk by chunk into an on-disk float32 matrix.
+
+    Only one chunk of comments is in memory at a time. Training rows are appended
+    to `<features_dir>/<model_name>_train.f32` and opened as a read-only memmap;
+    the held-out rows (a random `test_fraction`) and all targets are small and
+    stay in memory.
+    """
+    os.makedirs(features_dir, exist_ok=True)
+    train_path = os.path.join(features_dir, f"{model_name}_train.f32")
+    targets = MODEL_TARGETS[model_name]
+    rng = np.random.default_rng(seed)
+    y_train, X_test, y_test = [], [], []
+    rows = 0
+
+    with open(train_path, "wb") as train_file:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            X = process_comments(chunk.iloc[:, 0], max_length=max_length, dtype=np.float32)
+            y = targets(chunk)
+            test = rng.random(len(chunk)) < test_fraction
+            X[~test].tofile(train_file)
+            y_train.append(y[~test])
+            X_test.append(X[test])
+            y_test.append(y[test])
+            rows += int((~test).sum())
+
+    X_train = np.memmap(train_path, dtype=np.float32, mode="r", shape=(rows, max_length))
+    return FeatureSet(X_train, np.concatenate(y_train), np.concatenate(X_test), np.concatenate(y_test))
+
+
+def subsample(X: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Random rows of X, in file order, loaded into memory (all of X if it is smaller)."""
+    if len(X) <= size:
+        return np.asarray(X)
+    rows = np.sort(np.random.default_rng(seed).choice(len(X), size=size, replace=False))
+    return X[rows]
+
+
+def train_from_features(model_name: str, features: FeatureSet, compile_samples: int = 1000,
+                        max_epochs: Optional[int] = None, timer: Optional[StageTimer] = None, seed: int = 0):
+    """
+    Fit, evaluate and compile one model from featurized data.
+
+    The model is fit on the memory-mapped training matrix. Compilation only needs a
+    calibration set, and its cost grows with that set, so it uses `compile_samples`
+    random training rows.
+
+    Returns:
+        The compiled NeuralNetRegressor and its evaluation metrics on the held-out rows.
+    """
+    from concrete.ml.sklearn import NeuralNetRegressor
+
+    timer = timer or StageTimer()
+    params = dict(MODEL_PARAMS[model_name])
+    if max_epochs is not None:
+        params["max_epochs"] = max_epochs
+    model = NeuralNetRegressor(**params)
+
+    with timer.stage("fit"):
+        model.fit(features.X_train, features.y_train)
+    with timer.stage("evaluate"):
+        metrics = evaluate(model_name, model.predict(features.X_test), features.y_test) if len(features.X_test) else {}
+    with timer.stage("compile"):
+        model.compile(subsample(features.X_train, compile_samples, seed))
+    return model, metrics
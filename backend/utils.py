@@ -1,5 +1,12 @@
 import numpy as np
 
+# The joint model predicts the risk score divided by this, so that its output
+# is on the same [0, 1] scale as the category outputs
+RISK_SCALE = 10.0
+
+# Bump whenever process_comment's output changes, so build_models.py retrains
+PROCESS_COMMENT_VERSION = 1
+
 def process_comment(comment, max_length=70):
 
     # Clean and normalize the comment
@@ -26,5 +33,44 @@ def process_comment(comment, max_length=70):
 
     return char_array
 
+def process_comments(batch, max_length=70, dtype=np.float64, chunk_size=65536):
+    """
+    Vectorized process_comment over a list of comments.
+
+    Comments are cleaned in Python, then packed into a fixed-width numpy string
+    array whose buffer is read directly as a (N, max_length) matrix of code
+    points; padding, casting and per-row min-max scaling are whole-array
+    operations. Rows are bit-identical to process_comment with the default
+    float64 dtype. Work happens `chunk_size` rows at a time to bound temporary memory.
+    """
+    batch = list(batch)
+    out = np.empty((len(batch), max_length), dtype=dtype)
+    for start in range(0, len(batch), chunk_size):
+        cleaned = [comment.lower().strip() for comment in batch[start:start + chunk_size]]
+        # Truncates to max_length; shorter strings are NUL-padded in the buffer
+        codes = np.array(cleaned, dtype=f"<U{max_length}").view(np.uint32).reshape(len(cleaned), max_length)
+        char_array = codes.astype(np.float64)
+        char_array[codes == 0] = ord(' ')
+
+        # Min-max scaling to [0, 1] range, rows where all chars are the same stay 0
+        char_min = char_array.min(axis=1, keepdims=True)
+        char_max = char_array.max(axis=1, keepdims=True)
+        span = char_max - char_min
+        constant = span == 0
+        char_array = (char_array - char_min) / np.where(constant, 1.0, span)
+        char_array[constant.ravel()] = 0.0
+
+        # A NUL inside a comment is indistinguishable from padding above
+        for i, comment in enumerate(cleaned):
+            if '\0' in comment:
+                char_array[i] = process_comment(batch[start + i], max_length)
+        out[start:start + len(cleaned)] = char_array
+    return out
+
+def normalize_comment(comment):
+    # Lowercase like process_comment, and collapse runs of whitespace so
+    # copy-paste variants of the same comment compare equal
+    return " ".join(comment.lower().split())
+
 def clip_risk_score(prediction):
     return np.clip(np.round(prediction), 1, 10)
\ No newline at end of file